@@ -1,18 +1,24 @@
 import os
 import logging
-import time
-import boto3
-from boto3.dynamodb.conditions import Key
+from .catalog_loader import load_catalog_items
+from utilities.url_classifier import classify_url
+from utilities.instrumentation import instrument_boto3_session
+from utilities.lazy_import import lazy_module
 
+# boto3 is only imported once an aws call is made, importing it costs more than the rest of the package together
+boto3 = lazy_module('boto3')
+dynamodb_conditions = lazy_module('boto3.dynamodb.conditions')
+s3_transfer = lazy_module('boto3.s3.transfer')
 
-ucar_site = "https://data.cosmic.ucar.edu/gnss-ro/"
+
+ucar_site = os.environ.get('UCAR_SITE', "https://data.cosmic.ucar.edu/gnss-ro/")
 
 LOGGER = logging.getLogger(__name__)
 
 
 def aws_dynamodb_table(profile, table_name):
 
-    session = boto3.session.Session(profile_name=profile)
+    session = instrument_boto3_session(boto3.session.Session(profile_name=profile))
     dynamodb_table = session.resource('dynamodb').Table(table_name)
 
     return dynamodb_table
@@ -32,22 +38,20 @@ def dynamodb_table_create_entry(dynamodb_table, partition_key, sort_key, ucar_ur
     return response
 
 
-def dynamodb_table_batch_write_entries(dynamodb_table, item_list):
-
-    with dynamodb_table.batch_writer(overwrite_by_pkeys=["mission-procType-fileType", "YYYYDDD"]) as batch_write:
-        for item in item_list:
-            print("Adding item to batch put_item: ", item)
-            try:
-                batch_write.put_item(Item=item)
-            except Exception as e:
-                print(e)
-                time.sleep(10)
-                batch_write.put_item(Item=item)
-
-    return
+def dynamodb_table_batch_write_entries(dynamodb_table, item_list, writers=None):
+    """
+    Function writes the input items to the table with parallel batch writers, retrying unprocessed items with backoff
+    (see catalog_loader.load_catalog_items). Returns the CatalogLoadReport.
+    :param dynamodb_table:
+    :param item_list:
+    :param writers:
+    :return report:
+    """
+    return load_catalog_items(dynamodb_table, item_list, writers=writers)
 
 
 def dynamodb_table_get_entry(dynamodb_table, the_partition_key, the_sort_key):
+    Key = dynamodb_conditions.Key
 
     response = dynamodb_table.query(
         KeyConditionExpression=Key('mission-procType-fileType').eq(the_partition_key) & Key('YYYYDDD').eq(the_sort_key)
@@ -59,69 +63,42 @@ def dynamodb_table_get_entry(dynamodb_table, the_partition_key, the_sort_key):
 # partition key: string --> mission-procType-fileType
 # sort key: number --> YYYYDDD (Year)(Day of year)
 def get_varnames(file_url, mode):
+    """
+    Function returns the mission, proctype, filetype, year and doy of a ucar file url (mode 'ucar') or s3 key
+    (mode 's3'), parsed by the url classifier in a single match.
+    :param file_url:
+    :param mode:
+    :return varnames_dict:
+    """
+    if mode == 'ucar' and file_url.startswith(ucar_site):
+        file_url = file_url[len(ucar_site):]
 
-    root_path, filename = os.path.split(file_url)
-
-    if mode == 'ucar':
-        part_sort_key_content = root_path.replace(ucar_site, '').split('/')
-    if mode == 's3':
-        part_sort_key_content = root_path.split('/')
-
-    if 'atmPhs' in filename:
-        filetype = 'atmPhs'
-    if 'conPhs' in filename:
-        filetype = 'conPhs'
-    if 'atmPrf' in filename:
-        filetype = 'atmPrf'
-    if 'wetPrf' in filename:
-        filetype = 'wetPrf'
-    if 'wetPf2' in filename:
-        filetype = 'wetPf2'
-
-    mission = part_sort_key_content[0]
-    if mission == 'spire' or mission == 'geoopt':
-        proctype = part_sort_key_content[2]
-        year = part_sort_key_content[4]
-        doy = part_sort_key_content[5]
-    else:
-        proctype = part_sort_key_content[1]
-        year = part_sort_key_content[3]
-        doy = part_sort_key_content[4]
-
-    return {'mission': mission, 'proctype': proctype, 'filetype': filetype, 'year': year, 'doy': doy}
-
-
-def create_partition_key(mission, proctype, filetype):
-
-    partition_key = f"{mission}-{proctype}-{filetype}"
-    return partition_key
-
-
-def create_sort_key(year, doy):
+    ucar_path = classify_url(file_url)
+    if ucar_path is None or ucar_path.filetype is None:
+        raise ValueError(f"{file_url} is not a ucar catalog file")
 
-    sort_key = int(f"{year}{doy}")
-    return sort_key
+    return {'mission': ucar_path.mission, 'proctype': ucar_path.proctype, 'filetype': ucar_path.filetype,
+            'year': ucar_path.year, 'doy': ucar_path.doy}
 
 
 def aws_s3_bucket(profile, bucket_name):
 
     #bucket_name = 'ucar-earth-ro-archive'
-    profile = 'aernasaprod'
-
-    session = boto3.Session(profile_name=profile)
+    session = instrument_boto3_session(boto3.Session(profile_name=profile))
     bucket = session.resource('s3').Bucket(bucket_name)
 
     return bucket
 
 
+def s3_transfer_config(part_size=16 * 1024 * 1024, max_concurrency=4):
+    """
+    Function returns the TransferConfig used for uploads to s3. Files larger than part_size are sent as a multipart
+    upload of part_size parts with up to max_concurrency parts in flight per file.
+    :param part_size:
+    :param max_concurrency:
+    :return transfer_config:
+    """
+    transfer_config = s3_transfer.TransferConfig(multipart_threshold=part_size, multipart_chunksize=part_size,
+                                                 max_concurrency=max_concurrency, use_threads=True)
 
-
-
-
-
-
-
-
-
-
-
+    return transfer_config
@@ -0,0 +1,218 @@
+import os
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utilities.binary_manifest import read_manifest_urls
+from utilities.url_classifier import classify_url
+
+
+ucar_site = os.environ.get('UCAR_SITE', "https://data.cosmic.ucar.edu/gnss-ro/")
+
+LOGGER = logging.getLogger(__name__)
+
+partition_key_name = 'mission-procType-fileType'
+sort_key_name = 'YYYYDDD'
+
+# Settings for load_catalog_items
+catalog_loader_config = {
+    'writers': 8,               # parallel batch writers
+    'batch_size': 25,           # items per BatchWriteItem request, 25 is the DynamoDB maximum
+    'max_attempts': 10,         # attempts per batch before its unprocessed items are given up on
+    'base_backoff': 0.05,       # seconds, doubled every attempt
+    'max_backoff': 5.0,
+}
+
+throttle_error_codes = ('ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded',
+                        'InternalServerError')
+
+
+class CatalogLoadReport:
+    """
+    Counters of one catalog load: items written, BatchWriteItem requests made, how many of them were retries of
+    unprocessed or throttled items, items given up on, and the write capacity DynamoDB reports as consumed.
+    """
+
+    def __init__(self):
+        self.items = 0
+        self.requests = 0
+        self.retries = 0
+        self.failed_items = []
+        self.consumed_capacity = 0.0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, items=0, requests=0, retries=0, consumed_capacity=0.0):
+        with self._lock:
+            self.items += items
+            self.requests += requests
+            self.retries += retries
+            self.consumed_capacity += consumed_capacity
+
+    def record_failure(self, items):
+        with self._lock:
+            self.failed_items.extend(items)
+
+    def items_per_second(self):
+        if self.seconds == 0:
+            return 0.0
+        return self.items / self.seconds
+
+    def summary(self):
+        return (f"catalog load: {self.items} items in {self.seconds:.2f}s = {self.items_per_second():.1f} items/s | "
+                f"{self.requests} batch requests, {self.retries} retries | "
+                f"{self.consumed_capacity:.1f} write capacity units consumed | {len(self.failed_items)} items failed")
+
+
+def create_partition_key(mission, proctype, filetype):
+
+    partition_key = f"{mission}-{proctype}-{filetype}"
+    return partition_key
+
+
+def create_sort_key(year, doy):
+
+    sort_key = int(f"{year}{doy}")
+    return sort_key
+
+
+def catalog_item(ucar_url, s3_keys, bucket_url):
+    """
+    Function returns the catalog table item of one ucar .tar.gz url, or None if the url is not a catalog file. The item
+    carries the s3 url of the file if its key is in s3_keys (anything supporting 'in', e.g. an S3KeyIndex) and an empty
+    s3 url otherwise. The keys are built from classify_url's fields, as get_varnames does.
+    :param ucar_url:
+    :param s3_keys:
+    :param bucket_url:
+    :return item:
+    """
+    ucar_key = ucar_url.replace(ucar_site, '')
+    ucar_path = classify_url(ucar_key)
+    if ucar_path is None or ucar_path.filetype is None:
+        return None
+
+    s3_url = os.path.join(bucket_url, ucar_key) if ucar_key in s3_keys else ''
+
+    return {partition_key_name: create_partition_key(ucar_path.mission, ucar_path.proctype, ucar_path.filetype),
+            sort_key_name: create_sort_key(ucar_path.year, ucar_path.doy),
+            'ucar_url': ucar_url, 's3_url': s3_url}
+
+
+def build_catalog_items(ucar_urls, s3_keys, bucket_url):
+    """
+    Function returns the catalog items of the input ucar urls in one pass, skipping urls that are not catalog files.
+    :param ucar_urls:
+    :param s3_keys:
+    :param bucket_url:
+    :return item_list:
+    """
+    item_list = []
+    for ucar_url in ucar_urls:
+        item = catalog_item(ucar_url, s3_keys, bucket_url)
+        if item is not None:
+            item_list.append(item)
+
+    return item_list
+
+
+def build_catalog_items_from_manifests(manifest_paths, s3_keys, bucket_url):
+    """
+    Function returns the catalog items of every url in the input mission manifests, binary or legacy .txt.
+    :param manifest_paths:
+    :param s3_keys:
+    :param bucket_url:
+    :return item_list:
+    """
+    ucar_urls = []
+    for manifest_path in manifest_paths:
+        ucar_urls.extend(read_manifest_urls(manifest_path))
+
+    return build_catalog_items(ucar_urls, s3_keys, bucket_url)
+
+
+def backoff_seconds(attempt):
+    """
+    Function returns how long to wait before retry number attempt (1, 2 ...): exponential backoff capped at max_backoff,
+    with full jitter so parallel writers that were throttled together do not retry together.
+    :param attempt:
+    :return seconds:
+    """
+    ceiling = min(catalog_loader_config['max_backoff'], catalog_loader_config['base_backoff'] * 2 ** attempt)
+    return random.uniform(0, ceiling)
+
+
+def write_batch(dynamodb_client, table_name, items, report):
+    """
+    Function writes up to 25 items with BatchWriteItem. Items DynamoDB hands back as UnprocessedItems, and whole
+    requests that are throttled, are retried after backoff_seconds until max_attempts; what is still left then is added
+    to the report's failed items.
+    :param dynamodb_client:
+    :param table_name:
+    :param items:
+    :param report:
+    :return:
+    """
+    # the caller already has a boto3 client, so botocore is loaded by now
+    from botocore.exceptions import ClientError
+
+    request_items = {table_name: [{'PutRequest': {'Item': item}} for item in items]}
+
+    attempt = 0
+    while True:
+        try:
+            response = dynamodb_client.batch_write_item(RequestItems=request_items, ReturnConsumedCapacity='TOTAL')
+        except ClientError as e:
+            if e.response['Error']['Code'] not in throttle_error_codes:
+                raise
+            response = {'UnprocessedItems': request_items}
+
+        unprocessed = response.get('UnprocessedItems', {}).get(table_name, [])
+        consumed = sum([capacity.get('CapacityUnits', 0.0) for capacity in response.get('ConsumedCapacity', [])])
+        report.record(items=len(request_items[table_name]) - len(unprocessed), requests=1,
+                      retries=1 if attempt > 0 else 0, consumed_capacity=consumed)
+        if len(unprocessed) == 0:
+            return
+
+        attempt += 1
+        if attempt >= catalog_loader_config['max_attempts']:
+            LOGGER.error(f"giving up on {len(unprocessed)} unprocessed items after {attempt} attempts")
+            report.record_failure([put_request['PutRequest']['Item'] for put_request in unprocessed])
+            return
+
+        time.sleep(backoff_seconds(attempt))
+        request_items = {table_name: unprocessed}
+
+
+def load_catalog_items(dynamodb_table, item_list, writers=None):
+    """
+    Function writes the input items to the catalog table with several batch writers in parallel, each sending 25 item
+    BatchWriteItem requests and retrying unprocessed items with backoff and jitter. Items with the same partition and
+    sort key are collapsed to the last one, as a batch_writer with overwrite_by_pkeys would, since one request may not
+    hold the same key twice. Returns a CatalogLoadReport with items/s and consumed capacity.
+    :param dynamodb_table:
+    :param item_list:
+    :param writers:
+    :return report:
+    """
+    writers = writers or catalog_loader_config['writers']
+    batch_size = catalog_loader_config['batch_size']
+    # the table's client is thread safe and takes plain python values, unlike the table resource itself
+    dynamodb_client = dynamodb_table.meta.client
+    table_name = dynamodb_table.name
+
+    items_by_key = {(item[partition_key_name], item[sort_key_name]): item for item in item_list}
+    item_list = list(items_by_key.values())
+
+    report = CatalogLoadReport()
+    batches = [item_list[i:i + batch_size] for i in range(0, len(item_list), batch_size)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=writers) as executor:
+        futures = [executor.submit(write_batch, dynamodb_client, table_name, batch, report) for batch in batches]
+        for future in futures:
+            future.result()
+    report.seconds = time.perf_counter() - start
+
+    LOGGER.info(report.summary())
+    return report
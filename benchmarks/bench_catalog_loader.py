@@ -0,0 +1,101 @@
+"""
+Benchmark of the parallel catalog loader against a local DynamoDB stand-in (moto).
+
+    python -m benchmarks.bench_catalog_loader --items 200000 --writers 8 --unprocessed-rate 0.1
+
+Synthetic ucar urls are turned into catalog items and written with load_catalog_items. --unprocessed-rate makes the
+stand-in hand back that fraction of every batch as UnprocessedItems, to exercise the backoff path. The benchmark checks
+that every item ends up in the table and prints items/s and consumed capacity.
+"""
+import time
+import random
+import argparse
+import threading
+import boto3
+from moto import mock_aws
+from aws_utilities import catalog_loader
+from aws_utilities.catalog_loader import build_catalog_items, load_catalog_items, ucar_site
+
+
+def synthetic_ucar_urls(count):
+    missions = ['cosmic2', 'metopa', 'metopb', 'champ', 'grace']
+    filetypes = ['atmPrf', 'wetPrf', 'wetPf2', 'atmPhs', 'conPhs']
+    ucar_urls = []
+    for i in range(count):
+        mission = missions[i % len(missions)]
+        filetype = filetypes[(i // len(missions)) % len(filetypes)]
+        day_index = i // (len(missions) * len(filetypes))
+        year = 2000 + day_index // 365
+        doy = f"{day_index % 365 + 1:03d}"
+        level = 'level1b' if filetype in ['atmPhs', 'conPhs'] else 'level2'
+        ucar_urls.append(f"{ucar_site}{mission}/postProc/{level}/{year}/{doy}/{filetype}_postProc_{year}_{doy}.tar.gz")
+
+    return ucar_urls
+
+
+class UnprocessedInjector:
+    """
+    Wraps batch_write_item so that a random fraction of each request is not written and handed back as UnprocessedItems.
+    """
+
+    def __init__(self, client, rate):
+        self.client = client
+        self.rate = rate
+        self.batch_write_item = client.batch_write_item
+        self._lock = threading.Lock()
+
+    def __call__(self, RequestItems, **kwargs):
+        written_items = {}
+        unprocessed_items = {}
+        for table_name, requests in RequestItems.items():
+            with self._lock:
+                held_back = [request for request in requests if random.random() < self.rate]
+            kept = [request for request in requests if request not in held_back]
+            written_items[table_name] = kept
+            if len(held_back) > 0:
+                unprocessed_items[table_name] = held_back
+
+        if any(len(requests) > 0 for requests in written_items.values()):
+            response = self.batch_write_item(RequestItems=written_items, **kwargs)
+        else:
+            response = {}
+        response['UnprocessedItems'] = unprocessed_items
+        return response
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=20000)
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--unprocessed-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    with mock_aws():
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        table = dynamodb.create_table(TableName='gnss-ro-catalog',
+                                      KeySchema=[{'AttributeName': 'mission-procType-fileType', 'KeyType': 'HASH'},
+                                                 {'AttributeName': 'YYYYDDD', 'KeyType': 'RANGE'}],
+                                      AttributeDefinitions=[
+                                          {'AttributeName': 'mission-procType-fileType', 'AttributeType': 'S'},
+                                          {'AttributeName': 'YYYYDDD', 'AttributeType': 'N'}],
+                                      BillingMode='PAY_PER_REQUEST')
+
+        if args.unprocessed_rate > 0:
+            table.meta.client.batch_write_item = UnprocessedInjector(table.meta.client, args.unprocessed_rate)
+            # keep the retries fast, the stand-in is not really throttling
+            catalog_loader.catalog_loader_config['base_backoff'] = 0.001
+
+        ucar_urls = synthetic_ucar_urls(args.items)
+        s3_keys = set([ucar_url.replace(ucar_site, '') for ucar_url in ucar_urls[::2]])
+
+        start = time.perf_counter()
+        item_list = build_catalog_items(ucar_urls, s3_keys, 's3://ucar-earth-ro-archive/')
+        build_elapsed = time.perf_counter() - start
+        print(f"built {len(item_list)} items in {build_elapsed:.2f}s = {len(item_list) / build_elapsed:.0f} items/s")
+
+        report = load_catalog_items(table, item_list, writers=args.writers)
+        print(report.summary())
+
+        table_count = sum([page['Count'] for page in
+                           table.meta.client.get_paginator('scan').paginate(TableName=table.name, Select='COUNT')])
+        print(f"table holds {table_count} items, all written: {table_count == len(item_list)}")
@@ -0,0 +1,100 @@
+"""
+Benchmark and check of change detection from listing metadata, on a synthetic gnss-ro tree.
+
+    python -m benchmarks.bench_change_detection --years 2017 2018 2019 2020 2021 --days 60 --reprocessed 3
+
+The tree is crawled once with a fresh listing metadata store, which lists everything. Then a few days in old years are
+reprocessed (new files, new modification times) and a couple of days are added, and the tree is crawled again with
+the store. The benchmark prints the listings each crawl needed against a full crawl and checks the second crawl found
+exactly the files of the changed and added days, including the reprocessed ones a crawl from the last searched day
+would not reach. A third crawl with nothing changed should find nothing. Last, a fresh store with the high-water marks
+of the first tree as its baseline checks a first run reports no old files but still catches a later reprocessing.
+"""
+import os
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from datetime import datetime, timezone
+from utilities import ucar_repo_status
+from utilities.async_crawler import AsyncCrawler
+from utilities.listing_cache import configure_listing_cache
+from utilities.rate_scheduler import configure_rate_scheduler
+from utilities.listing_metadata import ListingMetadataStore, ChangeDetector
+from benchmarks.synthetic_ucar_server import SyntheticUcarServer, add_tree_arguments, tree_from_args, \
+    level_filetypes
+
+
+def crawl(start_urls, change_detector, workers):
+    crawler = AsyncCrawler(max_workers=workers, per_host_limit=workers, change_detector=change_detector)
+    start = time.perf_counter()
+    found_urls = asyncio.run(crawler.crawl(start_urls))
+    change_detector.commit()
+    return set(found_urls), crawler.listing_count, time.perf_counter() - start
+
+
+def day_file_urls(base_url, tree, mission, proctype, year, doy):
+    return {os.path.join(base_url, mission, proctype, level, year, doy, f"{filetype}_{proctype}_{year}_{doy}.tar.gz")
+            for level, filetypes in level_filetypes.items() for filetype in filetypes}
+
+
+if __name__ == '__main__':
+    parser = add_tree_arguments(argparse.ArgumentParser())
+    parser.set_defaults(years=[2017, 2018, 2019, 2020, 2021], days=60)
+    parser.add_argument('--reprocessed', type=int, default=3, help="days to reprocess in old years")
+    parser.add_argument('--added-days', type=int, default=2)
+    parser.add_argument('--workers', type=int, default=16)
+    args = parser.parse_args()
+
+    # the crawls revalidate listings anyway, without the cache every listing is a request that can be counted
+    configure_listing_cache(enabled=False)
+    configure_rate_scheduler(enabled=False)
+    tree = tree_from_args(args)
+    with SyntheticUcarServer(tree, latency=args.latency) as server, tempfile.TemporaryDirectory() as work_dir:
+        ucar_repo_status.ucar_site = server.base_url
+        start_urls = [os.path.join(server.base_url, f"{mission}/") for mission in tree.missions]
+        store = ListingMetadataStore(os.path.join(work_dir, 'listing_metadata.sqlite'))
+
+        first_urls, full_listings, full_elapsed = crawl(start_urls, ChangeDetector(store), args.workers)
+        print(f"first crawl: {full_listings} listings in {full_elapsed:.2f}s, {len(first_urls)} files")
+
+        pick = random.Random(0)
+        reprocess_mtime = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+        expected_urls = set()
+        for _ in range(args.reprocessed):
+            mission, proctype = pick.choice(tree.missions), pick.choice(tree.proctypes)
+            year, doy = pick.choice(tree.years[:-1]), pick.choice(tree.doys)
+            for level in level_filetypes:
+                tree.reprocess(mission, proctype, level, year, doy, reprocess_mtime, file_size=tree.file_size + 1)
+            expected_urls |= day_file_urls(server.base_url, tree, mission, proctype, year, doy)
+        last_doy = int(tree.doys[-1])
+        tree.doys += [str(last_doy + day).zfill(3) for day in range(1, args.added_days + 1)]
+        for mission in tree.missions:
+            for proctype in tree.proctypes:
+                for year in tree.years:
+                    for doy in tree.doys[-args.added_days:]:
+                        expected_urls |= day_file_urls(server.base_url, tree, mission, proctype, year, doy)
+
+        changed_urls, changed_listings, changed_elapsed = crawl(start_urls, ChangeDetector(store), args.workers)
+        old_year_urls = {url for url in changed_urls if f"/{tree.years[-1]}/" not in url and
+                         url.split('/')[-2] not in tree.doys[-args.added_days:]}
+        print(f"after reprocessing {args.reprocessed} old days and adding {args.added_days}: {changed_listings} "
+              f"listings ({changed_listings / tree.listing_count():.0%} of a full crawl's {tree.listing_count()}) "
+              f"in {changed_elapsed:.2f}s, {len(changed_urls)} files found, exactly the changed ones: "
+              f"{changed_urls == expected_urls}, of which {len(old_year_urls)} reprocessed in old years")
+
+        quiet_urls, quiet_listings, quiet_elapsed = crawl(start_urls, ChangeDetector(store), args.workers)
+        print(f"nothing changed: {quiet_listings} listings in {quiet_elapsed:.2f}s, {len(quiet_urls)} files found")
+        store.close()
+
+        baseline_store = ListingMetadataStore(os.path.join(work_dir, 'baseline.sqlite'))
+        high_water = {(mission, proctype, level): {'year': tree.years[-1], 'doy': tree.doys[-1]}
+                      for mission in tree.missions for proctype in tree.proctypes for level in level_filetypes}
+        baseline_urls, _, _ = crawl(start_urls, ChangeDetector(baseline_store, high_water), args.workers)
+        tree.reprocess(tree.missions[0], tree.proctypes[0], 'level2', tree.years[0], tree.doys[0],
+                       datetime(2024, 6, 1, tzinfo=timezone.utc))
+        later_urls, _, _ = crawl(start_urls, ChangeDetector(baseline_store, high_water), args.workers)
+        print(f"first run against a baseline: {len(baseline_urls)} files reported; after one more reprocessing: "
+              f"{sorted(url.replace(server.base_url, '') for url in later_urls)}")
+        baseline_store.close()
@@ -0,0 +1,90 @@
+"""
+Benchmark of resuming a crashed crawl from its checkpoint, on a synthetic gnss-ro tree.
+
+    python -m benchmarks.bench_crawl_resume --days 60 --crash-fraction 0.7 --latency 0.01
+
+A checkpointed crawl of every mission is started in a child process that dies with os._exit (no cleanup, like a kill
+or an OOM) after crash-fraction of the tree's listings. The crawl is then re-run from the same checkpoint. The
+benchmark prints the listings and time the resumed run needs against a crawl from scratch, and checks the resumed run
+finds exactly the files of an uninterrupted crawl.
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from utilities.async_crawler import AsyncCrawler, fetch_href_list
+from utilities.crawl_checkpoint import CrawlCheckpoint
+from utilities.listing_cache import configure_listing_cache
+from utilities.rate_scheduler import configure_rate_scheduler
+from benchmarks.synthetic_ucar_server import SyntheticUcarServer, add_tree_arguments, tree_from_args
+
+
+class CrashingFetch:
+    """
+    Listing fetch that kills the process once crash_after listings have been fetched.
+    """
+
+    def __init__(self, crash_after):
+        self.crash_after = crash_after
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, url):
+        with self.lock:
+            self.count += 1
+            if self.count > self.crash_after:
+                os._exit(1)
+        return fetch_href_list(url)
+
+
+def crashing_crawl(start_urls, checkpoint_path, crash_after, workers):
+    configure_listing_cache(enabled=False)
+    configure_rate_scheduler(enabled=False)
+    checkpoint = CrawlCheckpoint(checkpoint_path, start_urls)
+    crawler = AsyncCrawler(max_workers=workers, per_host_limit=workers, fetch=CrashingFetch(crash_after),
+                           checkpoint=checkpoint)
+    asyncio.run(crawler.crawl(start_urls))
+
+
+def timed_crawl(start_urls, workers, checkpoint=None):
+    crawler = AsyncCrawler(max_workers=workers, per_host_limit=workers, checkpoint=checkpoint)
+    start = time.perf_counter()
+    found_urls = asyncio.run(crawler.crawl(start_urls))
+    return set(found_urls), crawler.listing_count, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = add_tree_arguments(argparse.ArgumentParser())
+    parser.add_argument('--crash-fraction', type=float, default=0.7)
+    parser.add_argument('--workers', type=int, default=16)
+    args = parser.parse_args()
+
+    # every listing has to come from the server for the counts to be comparable
+    configure_listing_cache(enabled=False)
+    configure_rate_scheduler(enabled=False)
+
+    tree = tree_from_args(args)
+    with SyntheticUcarServer(tree, latency=args.latency) as server, tempfile.TemporaryDirectory() as work_dir:
+        # the killed child drops its connections mid response, which is expected here
+        server.httpd.handle_error = lambda request, client_address: None
+        start_urls = [os.path.join(server.base_url, f"{mission}/") for mission in tree.missions]
+        all_urls, full_listings, full_elapsed = timed_crawl(start_urls, args.workers)
+        print(f"crawl from scratch: {full_listings} listings in {full_elapsed:.2f}s, {len(all_urls)} files")
+
+        checkpoint_path = os.path.join(work_dir, 'checkpoint.sqlite')
+        crash_after = int(full_listings * args.crash_fraction)
+        child = multiprocessing.get_context('spawn').Process(
+            target=crashing_crawl, args=(start_urls, checkpoint_path, crash_after, args.workers))
+        child.start()
+        child.join()
+        print(f"crawl killed after {crash_after} listings (exit code {child.exitcode})")
+
+        checkpoint = CrawlCheckpoint(checkpoint_path, start_urls)
+        print(f"checkpoint left by the killed crawl: {checkpoint.counts()}, resumed: {checkpoint.resumed}")
+        resumed_urls, resumed_listings, resumed_elapsed = timed_crawl(start_urls, args.workers, checkpoint)
+        checkpoint.close()
+        print(f"resumed crawl: {resumed_listings} listings in {resumed_elapsed:.2f}s "
+              f"({resumed_listings / full_listings:.0%} of a full crawl), same files: {resumed_urls == all_urls}")
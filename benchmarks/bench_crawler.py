@@ -0,0 +1,87 @@
+"""
+Benchmark of the serial recursive_scrape against the AsyncCrawler on a synthetic gnss-ro tree.
+
+    python -m benchmarks.bench_crawler --days 30 --latency 0.02 --workers 32 --processes 4
+
+Both crawls start from the mission urls of the local stand-in; the benchmark checks they find the same set of .tar.gz
+urls and prints listings per second for each. With --processes the process-sharded crawl is timed as well.
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+import contextlib
+from utilities import ucar_repo_status
+from utilities.async_crawler import AsyncCrawler
+from utilities.sharded_crawl import sharded_crawl
+from utilities.listing_cache import configure_listing_cache
+from utilities.rate_scheduler import configure_rate_scheduler
+from benchmarks.synthetic_ucar_server import SyntheticUcarServer, add_tree_arguments, tree_from_args
+
+
+def run_serial(mission_urls, manifest_dir, site):
+    ucar_repo_status.ucar_manifests_loc = manifest_dir
+    ucar_repo_status.ucar_site = site
+    del ucar_repo_status.ucar_urls[:]
+
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for url in mission_urls:
+            ucar_repo_status.recursive_scrape(url)
+    elapsed = time.perf_counter() - start
+
+    return set(ucar_repo_status.ucar_urls), elapsed
+
+
+def run_async(mission_urls, workers, per_host_limit):
+    crawler = AsyncCrawler(max_workers=workers, per_host_limit=per_host_limit)
+
+    start = time.perf_counter()
+    found_urls = asyncio.run(crawler.crawl(mission_urls))
+    elapsed = time.perf_counter() - start
+
+    return set(found_urls), elapsed, crawler.listing_count
+
+
+def run_sharded(mission_urls, processes, threads_per_process):
+    start = time.perf_counter()
+    found_urls = sharded_crawl(mission_urls, processes=processes, threads_per_process=threads_per_process)
+    elapsed = time.perf_counter() - start
+
+    return set(found_urls), elapsed
+
+
+if __name__ == '__main__':
+    parser = add_tree_arguments(argparse.ArgumentParser())
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--per-host-limit', type=int, default=32)
+    parser.add_argument('--processes', type=int, default=0)
+    parser.add_argument('--threads-per-process', type=int, default=8)
+    parser.add_argument('--skip-serial', action='store_true')
+    args = parser.parse_args()
+
+    # every listing has to come from the server for the two crawls to be comparable, as fast as the engine can go
+    configure_listing_cache(enabled=False)
+    configure_rate_scheduler(enabled=False)
+
+    tree = tree_from_args(args)
+    with SyntheticUcarServer(tree, latency=args.latency) as server:
+        mission_urls = [os.path.join(server.base_url, f"{mission}/") for mission in tree.missions]
+
+        async_urls, async_elapsed, listings = run_async(mission_urls, args.workers, args.per_host_limit)
+        print(f"async : {listings} listings in {async_elapsed:.2f}s = {listings / async_elapsed:.1f} listings/s, "
+              f"{len(async_urls)} files")
+
+        if args.processes > 0:
+            sharded_urls, sharded_elapsed = run_sharded(mission_urls, args.processes, args.threads_per_process)
+            print(f"sharded ({args.processes} processes): {listings} listings in {sharded_elapsed:.2f}s = "
+                  f"{listings / sharded_elapsed:.1f} listings/s, {len(sharded_urls)} files, "
+                  f"same urls: {sharded_urls == async_urls}")
+
+        if not args.skip_serial:
+            with tempfile.TemporaryDirectory() as manifest_dir:
+                serial_urls, serial_elapsed = run_serial(mission_urls, manifest_dir, server.base_url)
+            print(f"serial: {listings} listings in {serial_elapsed:.2f}s = {listings / serial_elapsed:.1f} listings/s, "
+                  f"{len(serial_urls)} files")
+            print(f"speedup: {serial_elapsed / async_elapsed:.1f}x, same urls: {serial_urls == async_urls}")
@@ -0,0 +1,87 @@
+"""
+Benchmark of the download ordering policies on a backlog of mixed small and large tarballs.
+
+    python -m benchmarks.bench_download_order --days 8 --bandwidth 2000000 --workers 4 --large-days 1
+
+Requires moto. The synthetic tree serves small conPhs tarballs next to larger atmPhs/atmPrf ones, and the last
+large-days days are reprocessed into much larger files, the way a dense recent day arrives last in discovery order.
+Every file is sent at bandwidth bytes per second, so a transfer takes time in proportion to its size. The tree is
+crawled once with the listing cache on, then the backlog is streamed into a moto bucket under each policy with sizes
+learnt from the cached listings; a last run learns them with HEAD requests instead. For each run the benchmark prints
+the measured makespan, the one the schedule predicted and checks every file arrived whole.
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+import contextlib
+from datetime import datetime, timezone
+import boto3
+from moto import mock_aws
+from utilities import ucar_repo_status
+from utilities.async_crawler import AsyncCrawler
+from utilities.listing_cache import configure_listing_cache
+from utilities.rate_scheduler import configure_rate_scheduler
+from utilities.transfer_pipeline import run_transfer_pipeline
+from utilities.download_scheduler import configure_download_scheduler, download_policies
+from benchmarks.synthetic_ucar_server import SyntheticUcarServer, SyntheticTree, level_filetypes
+
+filetype_sizes = {'conPhs': 20_000, 'atmPhs': 400_000, 'atmPrf': 300_000, 'wetPrf': 150_000, 'wetPf2': 150_000}
+
+
+def transfer(urls, bucket, policy, workers):
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        metrics = run_transfer_pipeline(urls, bucket, mode='stream', download_workers=workers, download_order=policy)
+    objects = {obj.key: obj.size for obj in bucket.objects.all()}
+    bucket.objects.all().delete()
+    return metrics, objects
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=8)
+    parser.add_argument('--large-days', type=int, default=1)
+    parser.add_argument('--large-size', type=int, default=4_000_000)
+    parser.add_argument('--bandwidth', type=float, default=2_000_000, help="bytes per second per file")
+    parser.add_argument('--latency', type=float, default=0.01)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    tree = SyntheticTree(missions=['cosmic2'], proctypes=['postProc'], years=[2020], days=args.days,
+                         filetype_sizes=filetype_sizes)
+    for doy in tree.doys[-args.large_days:]:
+        for level in level_filetypes:
+            tree.reprocess('cosmic2', 'postProc', level, '2020', doy, datetime(2024, 5, 1, tzinfo=timezone.utc),
+                           file_size=args.large_size)
+
+    configure_rate_scheduler(enabled=False)
+    configure_download_scheduler(per_file_seconds=args.latency, bytes_per_second=args.bandwidth)
+    with SyntheticUcarServer(tree, latency=args.latency, bandwidth=args.bandwidth) as server, \
+            tempfile.TemporaryDirectory() as work_dir, mock_aws():
+        ucar_repo_status.ucar_site = server.base_url
+        configure_listing_cache(path=os.path.join(work_dir, 'listing_cache.sqlite'))
+        crawler = AsyncCrawler(max_workers=8, per_host_limit=8)
+        urls = sorted(asyncio.run(crawler.crawl([os.path.join(server.base_url, 'cosmic2/')])))
+        expected_sizes = {}
+        for url in urls:
+            path = url.replace(server.base_url, '')
+            expected_sizes[path] = server.tree.resolve('/gnss-ro/' + path)[1]
+        print(f"{len(urls)} files, {sum(expected_sizes.values()) / 1e6:.1f} MB, {args.workers} workers at "
+              f"{args.bandwidth / 1e6:.1f} MB/s each, the largest {args.large_days * 5} files of "
+              f"{args.large_size / 1e6:.1f} MB found last")
+
+        bucket = boto3.resource('s3', region_name='us-east-1').Bucket('bench-bucket')
+        bucket.create()
+        runs = [(policy, True) for policy in download_policies] + [('largest_first', False)]
+        for policy, from_listings in runs:
+            if not from_listings:
+                configure_listing_cache(enabled=False)
+            start = time.perf_counter()
+            metrics, objects = transfer(urls, bucket, policy, args.workers)
+            elapsed = time.perf_counter() - start
+            schedule = metrics['schedule']
+            source = 'listings' if from_listings else 'HEAD'
+            print(f"{policy:>14} (sizes from {source:>8}): makespan {metrics['stream'].wall_seconds():.2f}s, "
+                  f"predicted {schedule.predicted[policy]:.2f}s, {schedule.known_sizes} sizes known, "
+                  f"all complete: {objects == expected_sizes}, {elapsed:.2f}s with scheduling")
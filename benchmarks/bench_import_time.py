@@ -0,0 +1,81 @@
+"""
+Benchmark of the time it takes to import the sync's modules in a fresh interpreter.
+
+    python -m benchmarks.bench_import_time --runs 5 --budget-ms 100
+
+Each module is imported runs times, every time in a new python process started in a temporary directory, with the
+time measured around the import statement alone (interpreter startup is not counted). Socket connections and host
+lookups are refused in the child before the import and counted, so a module that lists the ucar site or calls AWS when
+imported is caught without reaching the network. The benchmark prints the median import time of every module and the
+heavy dependencies (numpy, requests, boto3, asyncio) the import pulled in, and checks main imports within budget-ms
+with no connection.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+modules = ['main', 'utilities.ucar_repo_status', 'utilities.amy_scrape_ucar', 'utilities.async_crawler',
+           'utilities.binary_manifest', 'utilities.url_classifier', 'aws_utilities.aws_boto3_calls',
+           'aws_utilities.catalog_loader']
+heavy_modules = ['numpy', 'requests', 'urllib3', 'boto3', 'botocore', 'asyncio']
+
+child_code = """
+import sys, json, time, socket
+connections = []
+def refuse(sock, address):
+    connections.append(str(address))
+    raise ConnectionRefusedError(f"import made a connection to {address}")
+def refuse_lookup(host, *args, **kwargs):
+    return refuse(None, host)
+socket.socket.connect = refuse
+socket.getaddrinfo = refuse_lookup
+start = time.perf_counter()
+try:
+    __import__(sys.argv[1])
+    error = None
+except Exception as e:
+    error = repr(e)
+print(json.dumps({'seconds': time.perf_counter() - start, 'connections': connections, 'error': error,
+                  'heavy': [name for name in json.loads(sys.argv[2]) if name in sys.modules]}))
+"""
+
+
+def time_import(module, work_dir):
+    """
+    Imports module in a new interpreter and returns what the child reports: the import seconds, the connections it
+    attempted, the error it raised if any and the heavy modules loaded.
+    """
+    env = dict(os.environ, PYTHONPATH=repo_root)
+    env.pop('UCAR_SITE', None)
+    result = subprocess.run([sys.executable, '-c', child_code, module, json.dumps(heavy_modules)], cwd=work_dir,
+                            env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=100.0, help="import time main has to stay within")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for module in modules:
+            runs = [time_import(module, work_dir) for _ in range(args.runs)]
+            milliseconds = statistics.median(run['seconds'] for run in runs) * 1e3
+            connections = sum(len(run['connections']) for run in runs)
+            errors = {run['error'] for run in runs if run['error'] is not None}
+            results[module] = (milliseconds, connections, errors)
+            print(f"{module:>30}: {milliseconds:7.1f} ms, {connections} connections, "
+                  f"loaded {runs[-1]['heavy'] or 'no heavy modules'}{', errors ' + str(errors) if errors else ''}")
+
+    milliseconds, connections, errors = results['main']
+    ok = milliseconds <= args.budget_ms and connections == 0 and len(errors) == 0 and \
+        all(result[1] == 0 for result in results.values())
+    print(f"main imports in {milliseconds:.1f} ms (budget {args.budget_ms:.0f} ms), no module connects on import: "
+          f"{all(result[1] == 0 for result in results.values())}, ok: {ok}")
@@ -0,0 +1,80 @@
+"""
+Scaling benchmark of the S3KeyIndex from 10k to 10M keys.
+
+    python -m benchmarks.bench_key_index --sizes 10000 100000 1000000 10000000
+
+For each size a synthetic obj key file is written, loaded into an index, and queried with a batch of urls half of
+which are present. The old list-based dedupe is O(n^2) and is only timed for sizes up to --legacy-max.
+"""
+import os
+import time
+import argparse
+import tempfile
+from utilities.key_index import S3KeyIndex
+from utilities.ucar_repo_status import check_if_correct_level
+
+missions = ['cosmic1', 'cosmic2', 'metopa', 'metopb', 'champ', 'grace', 'tsx', 'kompsat5']
+proctypes = ['postProc', 'repro2013', 'repro2016', 'nrt']
+filetypes = ['atmPrf', 'wetPrf', 'wetPf2']
+
+
+def synthetic_key(i):
+    mission = missions[i % len(missions)]
+    proctype = proctypes[(i // len(missions)) % len(proctypes)]
+    year = 2000 + (i // 1000) % 22
+    doy = str(i % 366 + 1).zfill(3)
+    return f"{mission}/{proctype}/level2/{year}/{doy}/{filetypes[i % 3]}_{proctype}_{year}_{doy}_{i}.tar.gz"
+
+
+def write_key_file(path, size):
+    with open(path, 'w') as key_file:
+        for i in range(size):
+            key_file.write(synthetic_key(i) + '\n')
+
+
+def legacy_load(path):
+    with open(path, 'r') as the_s3_obj_file:
+        obj_file_content = the_s3_obj_file.read().split('\n')
+    the_obj_file_keys = []
+    for the_item in obj_file_content:
+        if check_if_correct_level(the_item):
+            if the_item not in the_obj_file_keys:
+                the_obj_file_keys.append(the_item)
+    return the_obj_file_keys
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 100000, 1000000])
+    parser.add_argument('--queries', type=int, default=100000)
+    parser.add_argument('--legacy-max', type=int, default=10000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in args.sizes:
+            key_file_path = os.path.join(tmp_dir, f"keys_{size}.txt")
+            write_key_file(key_file_path, size)
+
+            start = time.perf_counter()
+            key_index = S3KeyIndex.from_file(key_file_path)
+            load_seconds = time.perf_counter() - start
+
+            queries = [synthetic_key(i) for i in range(0, 2 * args.queries, 2)]
+            queries = [query if i % 2 == 0 else query + '.missing' for i, query in enumerate(queries)]
+            start = time.perf_counter()
+            missing_keys = key_index.missing(queries)
+            query_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            mission_keys = key_index.keys(mission='cosmic2', proctype='nrt')
+            group_seconds = time.perf_counter() - start
+
+            per_url_ns = query_seconds / len(queries) * 1e9
+            line = (f"{size:>9} keys: load {load_seconds:7.2f}s ({size / load_seconds:10.0f} keys/s) | "
+                    f"diff {len(queries)} urls {query_seconds * 1e3:7.1f} ms ({per_url_ns:5.0f} ns/url, "
+                    f"{len(missing_keys)} missing) | cosmic2/nrt keys {len(mission_keys)} in {group_seconds * 1e3:.1f} ms")
+            if size <= args.legacy_max:
+                start = time.perf_counter()
+                legacy_load(key_file_path)
+                line += f" | legacy load {time.perf_counter() - start:.2f}s"
+            print(line)
@@ -0,0 +1,76 @@
+"""
+Benchmark of the chunked key normalizer against the original line by line zero padding.
+
+    python -m benchmarks.bench_key_normalizer --keys 10000000 --unpadded-rate 0.01
+
+An obj key file of synthetic keys, a fraction of them with one or two digit doy directories, is normalized with
+normalize_key_file and with the original check_zero_pad_doy loop (copied here without its per key print, which alone
+made the original take hours). The benchmark checks both write the same file and prints keys/s for each.
+"""
+import os
+import re
+import time
+import random
+import argparse
+import tempfile
+from utilities.key_normalizer import normalize_key_file
+
+
+def reference_check_zero_pad_doy(obj_file_key):
+    no_zero_pad_two_digit = re.search("/([0-9][0-9])/", obj_file_key)
+    no_zero_pad_one_digit = re.search("/([0-9])/", obj_file_key)
+    if no_zero_pad_one_digit != None:
+        number = no_zero_pad_one_digit.group(0).split('/')[1].zfill(3)
+        return re.sub(r"/([0-9])/", f"/{number}/", obj_file_key)
+    if no_zero_pad_two_digit != None:
+        number = no_zero_pad_two_digit.group(0).split('/')[1].zfill(3)
+        return re.sub(r"/([0-9][0-9])/", f"/{number}/", obj_file_key)
+
+    return obj_file_key
+
+
+def reference_normalize(input_path, output_path):
+    with open(input_path, 'r') as s3_obj_key_file:
+        with open(output_path, 'w') as new_s3_obj_key_file:
+            for line in s3_obj_key_file:
+                new_s3_obj_key_file.write(reference_check_zero_pad_doy(line.strip()) + "\n")
+
+
+def write_synthetic_key_file(path, count, unpadded_rate):
+    random.seed(0)
+    missions = ['cosmic2', 'metopa', 'champ', 'spire/noaa']
+    filetypes = ['atmPhs', 'conPhs', 'atmPrf', 'wetPrf', 'wetPf2']
+    with open(path, 'w') as key_file:
+        for i in range(count):
+            year = 2006 + i % 16
+            doy = i % 366 + 1
+            doy_dir = str(doy) if random.random() < unpadded_rate else f"{doy:03d}"
+            filetype = filetypes[i % len(filetypes)]
+            key_file.write(f"{missions[i % len(missions)]}/postProc/level2/{year}/{doy_dir}/"
+                           f"{filetype}_postProc_{year}_{doy:03d}.tar.gz\n")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--keys', type=int, default=1000000)
+    parser.add_argument('--unpadded-rate', type=float, default=0.01)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_path = os.path.join(work_dir, 'keys.txt')
+        write_synthetic_key_file(input_path, args.keys, args.unpadded_rate)
+
+        output_path = os.path.join(work_dir, 'normalized.txt')
+        report = normalize_key_file(input_path, output_path, changes_path=os.path.join(work_dir, 'changes.tsv'))
+        print(report.summary())
+        print(f"first changes: {report.changes[:3]}")
+
+        reference_path = os.path.join(work_dir, 'reference.txt')
+        start = time.perf_counter()
+        reference_normalize(input_path, reference_path)
+        reference_elapsed = time.perf_counter() - start
+        print(f"reference: {args.keys} keys in {reference_elapsed:.2f}s = {args.keys / reference_elapsed:.0f} keys/s")
+
+        with open(output_path, 'r') as output_file, open(reference_path, 'r') as reference_file:
+            print(f"speedup: {reference_elapsed / report.seconds:.1f}x, same output: "
+                  f"{output_file.read() == reference_file.read()}")
@@ -0,0 +1,76 @@
+"""
+Micro-benchmark of the listing parser backends over directory listing pages.
+
+    python -m benchmarks.bench_listing_parser
+    python -m benchmarks.bench_listing_parser --record https://data.cosmic.ucar.edu/gnss-ro/cosmic2/nrt/level2/2021/
+
+Pages are read from benchmarks/listings/*.html. --record fetches the given urls and saves them there, so the benchmark
+can be re-run offline on real ucar pages. If no pages are recorded, synthetic pages the size of a year listing (366
+day directories) and a large file listing are used instead.
+"""
+import os
+import glob
+import time
+import argparse
+from utilities.listing_parser import listing_backends, parse_listing_hrefs
+from benchmarks.synthetic_ucar_server import render_listing
+
+listings_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'listings')
+
+
+def record_pages(urls):
+    from utilities.http_client import http_get
+
+    os.makedirs(listings_dir, exist_ok=True)
+    for url in urls:
+        response = http_get(url)
+        response.raise_for_status()
+        filename = url.split('://')[-1].strip('/').replace('/', '_') + '.html'
+        with open(os.path.join(listings_dir, filename), 'w') as page_file:
+            page_file.write(response.text)
+        print("recorded ", url, " ---> ", filename)
+
+
+def load_pages():
+    pages = {}
+    for page_path in sorted(glob.glob(os.path.join(listings_dir, '*.html'))):
+        with open(page_path, 'r') as page_file:
+            pages[os.path.basename(page_path)] = page_file.read()
+
+    if len(pages) == 0:
+        doys = [f"{str(doy).zfill(3)}/" for doy in range(1, 367)]
+        files = [f"atmPrf_C2E{sat}.2021.{str(doy).zfill(3)}.tar.gz" for sat in range(1, 7) for doy in range(1, 367)]
+        pages['synthetic_year_listing'] = render_listing('/gnss-ro/cosmic2/nrt/level2/2021/', doys)
+        pages['synthetic_file_listing'] = render_listing('/gnss-ro/cosmic2/nrt/level2/2021/001/', files, 4096)
+
+    return pages
+
+
+def time_backend(backend, page_text, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parse_listing_hrefs(page_text, backend=backend)
+    return (time.perf_counter() - start) / repeat
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--record', nargs='+', help="urls of listing pages to save under benchmarks/listings")
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    if args.record:
+        record_pages(args.record)
+
+    for page_name, page_text in load_pages().items():
+        reference = parse_listing_hrefs(page_text, backend='bs4')
+        print(f"{page_name}: {len(page_text)} bytes, {len(reference)} hrefs")
+        for backend in listing_backends:
+            try:
+                same_hrefs = parse_listing_hrefs(page_text, backend=backend) == reference
+            except ImportError:
+                print(f"    {backend:>6}: not installed")
+                continue
+            per_page = time_backend(backend, page_text, args.repeat)
+            print(f"    {backend:>6}: {per_page * 1000:8.3f} ms/page  {len(reference) / per_page:12.0f} hrefs/s  "
+                  f"matches bs4: {same_hrefs}")
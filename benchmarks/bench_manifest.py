@@ -0,0 +1,77 @@
+"""
+Benchmark of the binary mission manifest against the legacy comma terminated <mission>.txt.
+
+    python -m benchmarks.bench_manifest --rows 1000000
+
+A legacy manifest of synthetic urls is written, imported into a binary manifest, and both are read back: all urls, the
+last searched info, and one filtered query (a proctype/filetype over a date range), which the binary manifest answers
+from its memory mapped columns. The benchmark checks both give the same answers and prints timings and file sizes.
+"""
+import os
+import time
+import argparse
+import tempfile
+from utilities import ucar_repo_status
+from utilities.binary_manifest import ManifestReader, import_legacy_manifest, read_legacy_manifest_urls, sidecar_path
+
+
+def synthetic_mission_urls(mission, rows):
+    proctypes = ['repro2013', 'repro2016', 'postProc', 'nrt']
+    level_filetypes = [('level1b', 'atmPhs'), ('level1b', 'conPhs'), ('level2', 'atmPrf'), ('level2', 'wetPrf'),
+                       ('level2', 'wetPf2')]
+    urls = []
+    for i in range(rows):
+        proctype = proctypes[(i // 50000) % len(proctypes)]
+        level, filetype = level_filetypes[i % len(level_filetypes)]
+        day_index = i // len(level_filetypes)
+        year = 2006 + (day_index // 365) % 16
+        doy = f"{day_index % 365 + 1:03d}"
+        urls.append(f"{ucar_repo_status.ucar_site}{mission}/{proctype}/{level}/{year}/{doy}/"
+                    f"{filetype}_{proctype}_{year}_{doy}.tar.gz")
+
+    return urls
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def legacy_query(txt_path):
+    return [url for url in read_legacy_manifest_urls(txt_path)
+            if '/postProc/' in url and '/wetPrf_' in url and '2010' <= url.split('/')[-3] <= '2011']
+
+
+def binary_query(manifest_path):
+    reader = ManifestReader(manifest_path)
+    return reader.urls(reader.select(proctype='postProc', filetype='wetPrf', year=(2010, 2011)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as manifest_dir:
+        txt_path = os.path.join(manifest_dir, 'cosmic1.txt')
+        urls = synthetic_mission_urls('cosmic1', args.rows)
+        with open(txt_path, 'w') as txt_file:
+            txt_file.write(''.join([f"{url}," for url in urls]))
+
+        manifest_path, import_elapsed = timed(import_legacy_manifest, txt_path)
+        print(f"import: {args.rows} rows in {import_elapsed:.2f}s")
+        binary_size = os.path.getsize(manifest_path) + os.path.getsize(sidecar_path(manifest_path))
+        print(f"size: txt {os.path.getsize(txt_path) / 1e6:.1f} MB | binary {binary_size / 1e6:.1f} MB")
+
+        for name, func in [('all urls', read_legacy_manifest_urls), ('last searched info',
+                                                                     ucar_repo_status.create_last_searched_info)]:
+            txt_result, txt_elapsed = timed(func, txt_path)
+            binary_result, binary_elapsed = timed(func if func is not read_legacy_manifest_urls
+                                                  else lambda path: ManifestReader(path).urls(), manifest_path)
+            print(f"{name}: txt {txt_elapsed:.3f}s | binary {binary_elapsed:.3f}s | same: {txt_result == binary_result}")
+
+        txt_result, txt_elapsed = timed(legacy_query, txt_path)
+        binary_result, binary_elapsed = timed(binary_query, manifest_path)
+        print(f"postProc wetPrf 2010-2011 ({len(binary_result)} rows): txt {txt_elapsed:.3f}s | "
+              f"binary {binary_elapsed:.3f}s | same: {txt_result == binary_result}")
@@ -0,0 +1,124 @@
+"""
+Benchmark of the date window planner against the boundary-year checks it replaced, on a synthetic gnss-ro tree.
+
+    python -m benchmarks.bench_policy_window --years 2010 2011 2012 2013 2014 2015 2016 2017 2018 2019 2020 --days 60
+
+For a set of keep_after / keep_before / keep_after_and_before policies (a window inside one year, a window across
+several years, open-ended windows), the urls are planned with the original check_new_doy / check_before_doy /
+check_between_proctype_year tasks, copied here as the reference, and with policy_tasks, and each plan is crawled. The
+benchmark prints the listings each needs and checks the files found against the files whose year/doy lie inside the
+window.
+"""
+import os
+import asyncio
+import argparse
+from utilities import ucar_repo_status
+from utilities.ucar_repo_status import check_new_doy, check_before_doy, check_new_proctype_year, \
+    check_before_proctype_year
+from utilities.async_crawler import AsyncCrawler
+from utilities.url_classifier import classify_url
+from utilities.listing_cache import configure_listing_cache
+from utilities.policy_planner import policy_tasks, policy_window
+from benchmarks.synthetic_ucar_server import SyntheticTree, SyntheticUcarServer, add_tree_arguments
+
+
+class CountingTree(SyntheticTree):
+    """
+    SyntheticTree that counts the directory listings served.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.listings = 0
+
+    def resolve(self, path):
+        resolved = super().resolve(path)
+        if resolved is not None and resolved[0] == 'dir':
+            self.listings += 1
+        return resolved
+
+
+def reference_check_between_proctype_year(policy_url, policy_start_year, policy_end_year):
+    return [the_year_url for the_year_url in check_before_proctype_year(policy_url, policy_end_year)
+            if policy_end_year not in the_year_url and policy_start_year not in the_year_url]
+
+
+def reference_policy_tasks(policy_url, proc_type_policy):
+    policy = proc_type_policy['policy']
+    policy_start_year, policy_start_doy = proc_type_policy['start_date'].split('-')[:2]
+    policy_end_year, policy_end_doy = proc_type_policy['end_date'].split('-')[:2]
+
+    tasks = []
+    if policy == 'keep_after':
+        tasks.append((check_new_doy, (policy_url, policy_start_year, policy_start_doy)))
+        tasks.append((check_new_proctype_year, (policy_url, policy_start_year)))
+    if policy == 'keep_before':
+        tasks.append((check_before_doy, (policy_url, policy_end_year, policy_end_doy)))
+        tasks.append((check_before_proctype_year, (policy_url, policy_end_year)))
+    if policy == 'keep_after_and_before':
+        tasks.append((check_new_doy, (policy_url, policy_start_year, policy_start_doy)))
+        tasks.append((check_before_doy, (policy_url, policy_end_year, policy_end_doy)))
+        tasks.append((reference_check_between_proctype_year, (policy_url, policy_start_year, policy_end_year)))
+
+    return tasks
+
+
+def plan_and_crawl(tree, tasks):
+    """
+    Runs the planning tasks and crawls the urls they return; returns the planning and crawl listings and the files found.
+    """
+    tree.listings = 0
+    to_search_urls = []
+    for function, args in tasks:
+        to_search_urls.extend(url for url in function(*args) if url not in to_search_urls)
+    planning_listings = tree.listings
+
+    tree.listings = 0
+    found_urls = asyncio.run(AsyncCrawler().crawl(to_search_urls)) if len(to_search_urls) > 0 else []
+
+    return planning_listings, tree.listings, set(found_urls)
+
+
+def policy(kind, start_date, end_date):
+    return {'policy': kind, 'start_date': f"{start_date}-00-00-00", 'end_date': f"{end_date}-00-00-00"}
+
+
+if __name__ == '__main__':
+    parser = add_tree_arguments(argparse.ArgumentParser())
+    parser.set_defaults(missions=['cosmic2'], proctypes=['postProc'], years=list(range(2010, 2021)), days=60)
+    args = parser.parse_args()
+
+    # every listing has to come from the server for the counts to be comparable
+    configure_listing_cache(enabled=False)
+
+    tree = CountingTree(args.missions, args.proctypes, args.years, args.days, args.file_size)
+    first_year, last_year = int(tree.years[0]), int(tree.years[-1])
+    middle_year = (first_year + last_year) // 2
+    policies = {
+        'one year window': policy('keep_after_and_before', f"{middle_year}-010", f"{middle_year}-020"),
+        'two year window': policy('keep_after_and_before', f"{middle_year}-040", f"{middle_year + 1}-005"),
+        'multi year window': policy('keep_after_and_before', f"{first_year + 2}-030", f"{last_year - 2}-005"),
+        'keep after': policy('keep_after', f"{last_year - 1}-050", f"{last_year}-001"),
+        'keep before': policy('keep_before', f"{first_year}-001", f"{first_year + 1}-003"),
+    }
+
+    with SyntheticUcarServer(tree, latency=args.latency) as server:
+        ucar_repo_status.ucar_site = server.base_url
+        policy_url = os.path.join(server.base_url, tree.missions[0], tree.proctypes[0], '')
+
+        all_files = asyncio.run(AsyncCrawler().crawl([policy_url]))
+        print(f"full crawl of {policy_url}: {tree.listings} listings, {len(all_files)} files")
+
+        for name, proc_type_policy in policies.items():
+            window = policy_window(proc_type_policy)
+            expected = set()
+            for url in all_files:
+                ucar_path = classify_url(url.replace(server.base_url, ''))
+                if window.contains(ucar_path.year, ucar_path.doy):
+                    expected.add(url)
+
+            reference = plan_and_crawl(tree, reference_policy_tasks(policy_url, proc_type_policy))
+            planned = plan_and_crawl(tree, policy_tasks(policy_url, proc_type_policy))
+            print(f"{name} ({len(expected)} files): reference {reference[0]} + {reference[1]} listings, "
+                  f"correct: {reference[2] == expected} | window planner {planned[0]} + {planned[1]} listings, "
+                  f"correct: {planned[2] == expected}")
@@ -0,0 +1,96 @@
+"""
+Benchmark of the adaptive rate scheduler against a synthetic server that refuses load above a concurrency limit.
+
+    python -m benchmarks.bench_rate_scheduler --days 20 --latency 0.02 --max-in-flight 8 --workers 32
+
+The server answers 429 with a Retry-After to any request arriving while max-in-flight are already being served. The
+tree is crawled, and a batch of files downloaded, with a fixed pool of workers twice: with the scheduler disabled
+(every worker fires as soon as it is free, throttled requests only sleep out their own Retry-After) and with it
+enabled. For each run the benchmark prints the elapsed time, the 429s the server sent, the peak concurrency it saw and
+the scheduler summary, and checks both runs found the same files and downloaded them whole.
+"""
+import os
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from utilities import ucar_repo_status
+from utilities.async_crawler import AsyncCrawler
+from utilities.listing_cache import configure_listing_cache
+from utilities.http_client import get_http_stats
+from utilities.rate_scheduler import configure_rate_scheduler, format_scheduler_summary
+from benchmarks.synthetic_ucar_server import SyntheticUcarServer, add_tree_arguments, tree_from_args
+
+
+def crawl(mission_urls, workers):
+    crawler = AsyncCrawler(max_workers=workers, per_host_limit=workers)
+    start = time.perf_counter()
+    found_urls = asyncio.run(crawler.crawl(mission_urls))
+    return set(found_urls), crawler.listing_count, crawler.failed_urls, time.perf_counter() - start
+
+
+def download_all(file_urls, workers):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor, open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        paths = list(executor.map(ucar_repo_status.download_file, file_urls))
+    return paths, time.perf_counter() - start
+
+
+def run(tree, args, scheduled):
+    configure_rate_scheduler(enabled=scheduled)
+    with SyntheticUcarServer(tree, latency=args.latency, max_in_flight=args.max_in_flight,
+                             retry_after=args.retry_after) as server, tempfile.TemporaryDirectory() as home:
+        ucar_repo_status.home_path = home
+        ucar_repo_status.ucar_site = server.base_url
+        mission_urls = [os.path.join(server.base_url, f"{mission}/") for mission in tree.missions]
+        throttled_before = get_http_stats()['throttled']
+
+        found_urls, listings, failed_urls, crawl_elapsed = crawl(mission_urls, args.workers)
+        crawl_throttled = server.stats['throttled']
+        print(f"  crawl: {listings} listings in {crawl_elapsed:.2f}s = {listings / crawl_elapsed:.1f} listings/s, "
+              f"{len(found_urls)} files, {len(failed_urls)} failed, {crawl_throttled} 429s sent")
+
+        file_urls = sorted(found_urls)[:args.files]
+        paths, download_elapsed = download_all(file_urls, args.workers)
+        complete = all(os.path.getsize(path) == tree.file_size for path in paths)
+        print(f"  download: {len(paths)} files in {download_elapsed:.2f}s, all complete: {complete}, "
+              f"{server.stats['throttled'] - crawl_throttled} 429s sent")
+        print(f"  server peak concurrency {server.stats['peak_in_flight']} (limit {args.max_in_flight}), "
+              f"client saw {get_http_stats()['throttled'] - throttled_before} throttled replies")
+        if scheduled:
+            print('  ' + format_scheduler_summary().replace('\n', '\n  '))
+
+    relative_urls = {url.replace(server.base_url, '') for url in found_urls}
+
+    return relative_urls, server.stats['throttled'], crawl_elapsed + download_elapsed
+
+
+if __name__ == '__main__':
+    parser = add_tree_arguments(argparse.ArgumentParser())
+    parser.set_defaults(days=20, latency=0.02, max_in_flight=8)
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--listing-rate', type=float, default=500.0)
+    parser.add_argument('--download-rate', type=float, default=None,
+                        help="requests/s of the download class, by default unlimited as in scheduler_config")
+    args = parser.parse_args()
+
+    # throttled requests are logged one by one, which is expected here
+    logging.getLogger('utilities.http_client').setLevel(logging.WARNING)
+    configure_listing_cache(enabled=False)
+    configure_rate_scheduler(classes={'listing': {'rate': args.listing_rate, 'burst': int(args.listing_rate)},
+                                      'download': {'rate': args.download_rate,
+                                                   'burst': int(args.download_rate or 1)}})
+    tree = tree_from_args(args)
+
+    print(f"fixed {args.workers} workers, no scheduler:")
+    fixed_urls, fixed_throttled, fixed_elapsed = run(tree, args, scheduled=False)
+    print(f"fixed {args.workers} workers under the adaptive scheduler:")
+    scheduled_urls, scheduled_throttled, scheduled_elapsed = run(tree, args, scheduled=True)
+    print(f"429s {fixed_throttled} -> {scheduled_throttled}, total time {fixed_elapsed:.2f}s -> "
+          f"{scheduled_elapsed:.2f}s, same files: {fixed_urls == scheduled_urls}")
@@ -0,0 +1,211 @@
+"""
+Offline end to end replay of the sync against a synthetic gnss-ro tree and a moto AWS account.
+
+    python -m benchmarks.bench_replay --missions cosmic2 metopa --days 10 --new-days 2 --report replay_report.json
+
+Requires moto. Nothing is fetched from data.cosmic.ucar.edu and no AWS profile is used: the synthetic server stands in
+for the site, and main is imported with UCAR_SITE pointing at it, UCAR_AWS_PROFILE empty (boto3's default credential
+chain, which moto answers), and HOME, the manifests (UCAR_MANIFESTS_LOC), the obj key file (UCAR_OBJ_KEY_FILE) and
+every local store in a temporary directory. The run goes through the three entry points in the order they are used:
+
+    policies  use_policies_json: plan policies.json (the first proctype keep_all, the others keep_after the middle
+              of the tree), crawl the plan into the mission manifests and compare it with the obj key file
+    live_run  new-days days are added to the tree (the last year is the current one), then live_run crawls what is
+              new since last_searched_info.json, streams it into the moto bucket and publishes the new obj key file
+    catalog   load_catalog builds the catalog items of the manifests against the published key file and writes them
+              to a moto dynamodb table
+
+Each stage is checked (files found against the tree, objects in the bucket, items in the table) and its wall time,
+throughput and per endpoint latency (from instrumentation) are printed and written as json to report, so runs of
+different versions can be compared. Importing main is timed as a stage of its own.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+from datetime import date
+import boto3
+from moto import mock_aws
+from benchmarks.synthetic_ucar_server import SyntheticUcarServer, add_tree_arguments, tree_from_args, level_filetypes
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+catalog_table_name = 'gnss-ro-available-tar-file-table'
+
+
+def tree_file_paths(tree, doy_filter=None, proctypes=None):
+    """
+    Returns the paths below the site of every file of the tree, optionally only for some proctypes and days.
+    """
+    paths = []
+    for mission in tree.missions:
+        mission_path = f"{mission}/noaa" if mission in ('spire', 'geoopt') else mission
+        for proctype in proctypes or tree.proctypes:
+            for level, filetypes in level_filetypes.items():
+                for year in tree.years:
+                    for doy in tree.doys:
+                        if doy_filter is None or doy_filter(year, doy):
+                            paths.extend(f"{mission_path}/{proctype}/{level}/{year}/{doy}/"
+                                         f"{filetype}_{proctype}_{year}_{doy}.tar.gz" for filetype in filetypes)
+    return paths
+
+
+def policies_for(tree):
+    """
+    Returns a policies.json dictionary: the first proctype of every mission keep_all, the others keep_after the middle
+    day of the first year, and the day it keeps after.
+    """
+    after = (tree.years[0], tree.doys[len(tree.doys) // 2])
+    keep_after = {'policy': 'keep_after', 'start_date': f"{after[0]}-{after[1]}-00-00-00",
+                  'end_date': f"{after[0]}-{after[1]}-00-00-00"}
+    policy_dict = {mission: {f"{proctype}/": dict(keep_after) for proctype in tree.proctypes}
+                   for mission in tree.missions}
+    for mission in tree.missions:
+        policy_dict[mission][f"{tree.proctypes[0]}/"] = {'policy': 'keep_all', 'start_date': '', 'end_date': ''}
+    return policy_dict, after
+
+
+def endpoint_latencies(snapshot):
+    return {endpoint: {'count': stats['count'], 'errors': stats['errors'], 'bytes': stats['bytes'],
+                       'p50_ms': stats['p50_seconds'] * 1e3, 'p90_ms': stats['p90_seconds'] * 1e3,
+                       'p99_ms': stats['p99_seconds'] * 1e3}
+            for endpoint, stats in snapshot.items()}
+
+
+def print_stage(name, stage):
+    rates = ', '.join(f"{value:.1f} {unit}" for unit, value in stage.get('throughput', {}).items())
+    print(f"{name:>8}: {stage['seconds']:.2f}s{', ' + rates if rates else ''}, ok: {stage['ok']}")
+    for endpoint, latency in stage.get('endpoints', {}).items():
+        print(f"          {endpoint:<28} {latency['count']:>6} calls  p50 {latency['p50_ms']:7.1f} ms  "
+              f"p90 {latency['p90_ms']:7.1f} ms  p99 {latency['p99_ms']:7.1f} ms  {latency['errors']} errors")
+
+
+@contextlib.contextmanager
+def quiet():
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def replay(args, work_dir, server):
+    tree = server.tree
+    site = server.base_url
+    manifests_dir = os.path.join(work_dir, 'ucar_file_manifests_per_mission')
+    obj_key_file = os.path.join(work_dir, 'zero_pad_ucar_objKey.txt')
+    os.makedirs(manifests_dir)
+    os.environ.update({'UCAR_SITE': site, 'UCAR_AWS_PROFILE': '', 'UCAR_MANIFESTS_LOC': manifests_dir + '/',
+                       'UCAR_OBJ_KEY_FILE': obj_key_file, 'HOME': work_dir, 'UCAR_METRICS_DIR': work_dir,
+                       'AWS_ACCESS_KEY_ID': 'testing', 'AWS_SECRET_ACCESS_KEY': 'testing',
+                       'AWS_DEFAULT_REGION': 'us-east-1'})
+    os.environ.pop('AWS_PROFILE', None)
+    # main reads and writes its json files in the working directory
+    os.chdir(work_dir)
+    if repo_root not in sys.path:
+        sys.path.insert(0, repo_root)
+    stages = {}
+
+    start = time.perf_counter()
+    import main
+    from utilities import ucar_repo_status
+    from utilities.instrumentation import take_metrics
+    from utilities.listing_cache import configure_listing_cache
+    from utilities.binary_manifest import list_manifest_paths
+    from utilities.s3_inventory import find_latest_obj_key_file
+    stages['import'] = {'seconds': time.perf_counter() - start, 'ok': main.ucar_site == site}
+    main.parentDir = work_dir
+    take_metrics()
+
+    bucket = boto3.resource('s3').Bucket(main.test_bucket_name)
+    bucket.create()
+    boto3.resource('dynamodb').create_table(
+        TableName=catalog_table_name, BillingMode='PAY_PER_REQUEST',
+        KeySchema=[{'AttributeName': 'mission-procType-fileType', 'KeyType': 'HASH'},
+                   {'AttributeName': 'YYYYDDD', 'KeyType': 'RANGE'}],
+        AttributeDefinitions=[{'AttributeName': 'mission-procType-fileType', 'AttributeType': 'S'},
+                              {'AttributeName': 'YYYYDDD', 'AttributeType': 'N'}])
+
+    policy_dict, after = policies_for(tree)
+    with open('policies.json', 'w') as policies_file:
+        json.dump(policy_dict, policies_file)
+    expected_paths = set(tree_file_paths(tree, proctypes=tree.proctypes[:1]))
+    expected_paths.update(tree_file_paths(tree, lambda year, doy: (year, doy) > after, tree.proctypes[1:]))
+    # half the files are in s3 already
+    with open(obj_key_file, 'w') as key_file:
+        key_file.writelines(f"{path}\n" for path in sorted(expected_paths)[::2])
+
+    start = time.perf_counter()
+    with quiet():
+        main.use_policies_json()
+    seconds = time.perf_counter() - start
+    found_paths = {url.replace(site, '') for url in ucar_repo_status.ucar_urls}
+    stages['policies'] = {'seconds': seconds, 'files': len(found_paths), 'ok': found_paths == expected_paths,
+                          'throughput': {'files/s': len(found_paths) / seconds},
+                          'endpoints': endpoint_latencies(take_metrics())}
+
+    old_doys = list(tree.doys)
+    tree.doys += [str(int(old_doys[-1]) + day).zfill(3) for day in range(1, args.new_days + 1)]
+    del ucar_repo_status.ucar_urls[:]
+    # live_run is the next day's run: every listing the cache holds for the current year is past its ttl
+    configure_listing_cache(default_ttl=0)
+    # the key file live_run brings up to date from the bucket
+    with open(obj_key_file) as key_file, open(os.path.join(work_dir, 's3_obj_keys_2000-01-01.txt'), 'w') as base_file:
+        base_file.write(key_file.read())
+
+    start = time.perf_counter()
+    with quiet():
+        main.live_run(transfer_mode='stream')
+    seconds = time.perf_counter() - start
+    found_paths = {url.replace(site, '') for url in ucar_repo_status.ucar_urls}
+    transferred = {obj.key: obj.size for obj in bucket.objects.all() if obj.key.endswith('.tar.gz')}
+    expected_transfers = {path for path in found_paths if 'conPhs' not in path and 'atmPhs' not in path}
+    transferred_bytes = sum(transferred.values())
+    stages['live_run'] = {'seconds': seconds, 'files': len(found_paths), 'transferred': len(transferred),
+                          'ok': len(found_paths) > 0 and all(path.split('/')[-2] not in old_doys
+                                                             for path in found_paths)
+                          and set(transferred) == expected_transfers
+                          and all(size == tree.size_of(key.split('/')[-1]) for key, size in transferred.items()),
+                          'throughput': {'files/s': len(found_paths) / seconds,
+                                         'MB/s': transferred_bytes / 1e6 / seconds},
+                          'endpoints': endpoint_latencies(take_metrics())}
+
+    # the published key file is what the catalog is loaded against
+    with open(find_latest_obj_key_file(work_dir)) as published_file, open(obj_key_file, 'w') as key_file:
+        key_file.write(published_file.read())
+    manifest_paths = list_manifest_paths(manifests_dir)
+    start = time.perf_counter()
+    with quiet():
+        report = main.load_catalog(manifest_paths, table_name=catalog_table_name)
+    seconds = time.perf_counter() - start
+    table_items = boto3.resource('dynamodb').Table(catalog_table_name).scan(Select='COUNT')['Count']
+    stages['catalog'] = {'seconds': seconds, 'items': report.items, 'ok': report.items == table_items > 0,
+                         'throughput': {'items/s': report.items / seconds},
+                         'endpoints': endpoint_latencies(take_metrics())}
+
+    return stages
+
+
+if __name__ == '__main__':
+    parser = add_tree_arguments(argparse.ArgumentParser())
+    # new days land in the current year, whose listings the listing cache revalidates
+    parser.set_defaults(file_size=64 * 1024, years=[date.today().year - 1, date.today().year])
+    parser.add_argument('--new-days', type=int, default=2, help="days added to the tree before live_run")
+    parser.add_argument('--report', default='replay_report.json', help="json file the stage numbers are written to")
+    args = parser.parse_args()
+    report_path = os.path.abspath(args.report)
+
+    with SyntheticUcarServer(tree_from_args(args), latency=args.latency, drop_rate=args.drop_rate,
+                             max_in_flight=args.max_in_flight, bandwidth=args.bandwidth) as server, \
+            tempfile.TemporaryDirectory() as work_dir, mock_aws():
+        stages = replay(args, work_dir, server)
+        os.chdir(repo_root)
+
+    print(f"tree: {args.missions} x {args.proctypes}, years {args.years}, {args.days} + {args.new_days} days")
+    for name, stage in stages.items():
+        print_stage(name, stage)
+    with open(report_path, 'w') as report_file:
+        json.dump({'tree': {'missions': args.missions, 'proctypes': args.proctypes, 'years': args.years,
+                            'days': args.days, 'new_days': args.new_days, 'file_size': args.file_size,
+                            'latency': args.latency},
+                   'stages': stages}, report_file, indent=2)
+    print(f"report: {report_path}")
@@ -0,0 +1,121 @@
+"""
+Benchmark and check of resumable downloads against a synthetic server that drops connections mid-stream.
+
+    python -m benchmarks.bench_resumable_download --files 40 --file-size 4000000 --drop-rate 0.5
+
+Files are downloaded from a server that cuts drop-rate of its file responses off half way through. The benchmark
+downloads them with download_file, and with a restart-from-zero loop (the original behaviour plus retries) as the
+reference, and prints the bytes each pulled over the wire. It then checks:
+
+- every downloaded file has the bytes the server serves;
+- a second run downloads nothing;
+- a truncated local file is completed with a Range request instead of fetched again;
+- a wrong checksum raises and leaves no file behind.
+"""
+import os
+import time
+import logging
+import argparse
+import tempfile
+import requests
+from utilities import ucar_repo_status
+from utilities.http_client import http_get
+from utilities.listing_cache import configure_listing_cache
+from utilities.async_crawler import crawl_urls
+from utilities.resumable_download import configure_downloads, file_checksum
+from utilities.instrumentation import take_metrics
+from benchmarks.synthetic_ucar_server import SyntheticUcarServer, add_tree_arguments, tree_from_args, file_body
+
+
+def reference_download(url, full_path, max_attempts):
+    """
+    The original download_file loop, retried from byte zero whenever the body comes up short. Returns the bytes read.
+    """
+    num_bytes = 0
+    for _ in range(max_attempts):
+        try:
+            with http_get(url, stream=True) as response:
+                response.raise_for_status()
+                expected_bytes = int(response.headers['Content-Length'])
+                with open(full_path, 'wb') as the_file:
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        the_file.write(chunk)
+                        num_bytes += len(chunk)
+        except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError):
+            continue
+        if os.path.getsize(full_path) == expected_bytes:
+            return num_bytes
+    raise IOError(f"{url}: no complete download in {max_attempts} attempts")
+
+
+def downloaded_bytes():
+    return take_metrics().get('download', {}).get('bytes', 0)
+
+
+def is_served_content(url, full_path, base_url, file_size):
+    with open(full_path, 'rb') as the_file:
+        return the_file.read() == file_body('/gnss-ro/' + url.replace(base_url, ''), file_size)
+
+
+if __name__ == '__main__':
+    parser = add_tree_arguments(argparse.ArgumentParser())
+    parser.set_defaults(drop_rate=0.5, file_size=4000000, days=4)
+    parser.add_argument('--files', type=int, default=40)
+    args = parser.parse_args()
+
+    # every interrupted transfer logs a warning, which is expected here
+    logging.getLogger('utilities.resumable_download').setLevel(logging.ERROR)
+    configure_listing_cache(enabled=False)
+    configure_downloads(base_backoff=0.0, max_attempts=20)
+    tree = tree_from_args(args)
+    with tempfile.TemporaryDirectory() as home:
+        ucar_repo_status.home_path = home
+
+        with SyntheticUcarServer(tree, latency=args.latency) as server:
+            ucar_repo_status.ucar_site = server.base_url
+            file_urls = crawl_urls([os.path.join(server.base_url, f"{tree.missions[0]}/")])[:args.files]
+        total_size = len(file_urls) * args.file_size
+
+        with SyntheticUcarServer(tree, latency=args.latency, drop_rate=args.drop_rate) as server:
+            # dropped connections are the point here, keep the server quiet about them
+            server.httpd.handle_error = lambda request, client_address: None
+            file_urls = [url.replace(ucar_repo_status.ucar_site, server.base_url) for url in file_urls]
+            ucar_repo_status.ucar_site = server.base_url
+
+            reference_dir = os.path.join(home, 'reference')
+            os.makedirs(reference_dir)
+            start = time.perf_counter()
+            reference_bytes = sum(reference_download(url, os.path.join(reference_dir, url.split('/')[-1]), 20)
+                                  for url in file_urls)
+            reference_elapsed = time.perf_counter() - start
+            print(f"restart from zero: {reference_bytes / total_size:.2f}x the file bytes in {reference_elapsed:.2f}s")
+
+            take_metrics()
+            start = time.perf_counter()
+            paths = [ucar_repo_status.download_file(url, chunk_size=64 * 1024) for url in file_urls]
+            elapsed = time.perf_counter() - start
+            resumed_bytes = downloaded_bytes()
+            contents_correct = all(is_served_content(url, path, server.base_url, args.file_size)
+                                   for url, path in zip(file_urls, paths))
+            print(f"resumable: {resumed_bytes / total_size:.2f}x the file bytes in {elapsed:.2f}s, all contents "
+                  f"correct: {contents_correct}")
+
+            [ucar_repo_status.download_file(url) for url in file_urls]
+            print(f"second run downloads {downloaded_bytes()} bytes")
+
+            with open(paths[0], 'r+b') as the_file:
+                the_file.truncate(args.file_size // 3)
+            ucar_repo_status.download_file(file_urls[0])
+            print(f"truncated file completed with {downloaded_bytes()} bytes "
+                  f"(of {args.file_size - args.file_size // 3} missing), correct: "
+                  f"{is_served_content(file_urls[0], paths[0], server.base_url, args.file_size)}")
+
+            good_checksum = f"md5:{file_checksum(paths[1], 'md5')}"
+            os.remove(paths[1])
+            try:
+                ucar_repo_status.download_file(file_urls[1], checksum='md5:' + '0' * 32)
+                print("wrong checksum: not detected")
+            except IOError as e:
+                print(f"wrong checksum raises ({e}), file left behind: {os.path.exists(paths[1])}")
+            ucar_repo_status.download_file(file_urls[1], checksum=good_checksum)
+            print(f"right checksum accepted: {os.path.exists(paths[1])}")
@@ -0,0 +1,86 @@
+"""
+Benchmark of the download -> s3 upload pipeline against the synthetic ucar server and a moto s3 bucket.
+
+    python -m benchmarks.bench_transfer_pipeline --file-size 8000000 --files 40 --download-workers 4 --upload-workers 4
+
+Requires moto. The serial baseline is the old live_run loop: download_file then bucket.upload_file, one file at a time.
+The pipeline is run in both spool (through the local mirror) and stream (straight to s3) mode.
+"""
+import os
+import time
+import argparse
+import tempfile
+import contextlib
+import boto3
+from moto import mock_aws
+from utilities import ucar_repo_status
+from utilities.transfer_pipeline import run_transfer_pipeline
+from aws_utilities.aws_boto3_calls import s3_transfer_config
+from benchmarks.synthetic_ucar_server import SyntheticUcarServer, SyntheticTree
+
+
+def file_urls(server, count):
+    tree = server.tree
+    urls = []
+    for doy in tree.doys:
+        for filetype in ['atmPrf', 'wetPrf', 'wetPf2']:
+            urls.append(os.path.join(server.base_url, tree.missions[0], tree.proctypes[0], 'level2', tree.years[0], doy,
+                                     f"{filetype}_{tree.proctypes[0]}_{tree.years[0]}_{doy}.tar.gz"))
+    return urls[:count]
+
+
+def run_serial(urls, bucket):
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for url in urls:
+            path_to_local_file = ucar_repo_status.download_file(url)
+            bucket.upload_file(path_to_local_file, url.replace(ucar_repo_status.ucar_site, ''))
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=30)
+    parser.add_argument('--file-size', type=int, default=4 * 1024 * 1024)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--download-workers', type=int, default=4)
+    parser.add_argument('--upload-workers', type=int, default=4)
+    parser.add_argument('--part-size', type=int, default=8 * 1024 * 1024)
+    args = parser.parse_args()
+
+    tree = SyntheticTree(missions=['cosmic2'], proctypes=['postProc'], years=[2020],
+                         days=args.files // 3 + 1, file_size=args.file_size)
+    with SyntheticUcarServer(tree, latency=args.latency) as server, tempfile.TemporaryDirectory() as home, mock_aws():
+        ucar_repo_status.ucar_site = server.base_url
+        ucar_repo_status.home_path = home
+        bucket = boto3.resource('s3', region_name='us-east-1').Bucket('bench-bucket')
+        bucket.create()
+        urls = file_urls(server, args.files)
+        total_mb = len(urls) * args.file_size / 1e6
+
+        serial_elapsed = run_serial(urls, bucket)
+        print(f"serial  : {len(urls)} files, {total_mb:.1f} MB in {serial_elapsed:.2f}s")
+
+        # download_file keeps complete local copies, so the pipeline gets a mirror of its own
+        ucar_repo_status.home_path = os.path.join(home, 'pipeline')
+        start = time.perf_counter()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            metrics = run_transfer_pipeline(urls, bucket, transfer_config=s3_transfer_config(args.part_size),
+                                            download_workers=args.download_workers,
+                                            upload_workers=args.upload_workers)
+        pipeline_elapsed = time.perf_counter() - start
+        print(f"pipeline: {len(urls)} files, {total_mb:.1f} MB in {pipeline_elapsed:.2f}s "
+              f"({serial_elapsed / pipeline_elapsed:.1f}x)")
+        for stage_metrics in metrics.values():
+            print("    ", stage_metrics.summary())
+
+        start = time.perf_counter()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            metrics = run_transfer_pipeline(urls, bucket, mode='stream', download_workers=args.download_workers,
+                                            stream_part_size=max(args.part_size, 5 * 1024 * 1024))
+        stream_elapsed = time.perf_counter() - start
+        print(f"stream  : {len(urls)} files, {total_mb:.1f} MB in {stream_elapsed:.2f}s "
+              f"({serial_elapsed / stream_elapsed:.1f}x), peak buffer memory "
+              f"{metrics['peak_buffer_bytes'] / 1e6:.1f} MB, 0 bytes on disk")
+        print("    ", metrics['stream'].summary())
+        print("objects in bucket: ", len(list(bucket.objects.all())))
@@ -0,0 +1,156 @@
+"""
+Benchmark of the compiled url classifier against the substring scans it replaced.
+
+    python -m benchmarks.bench_url_classifier --paths 2000000
+
+A mix of synthetic ucar urls (files and directories at every depth, spire/geoopt layout, excluded levels and other
+filetypes) is run through the original check_if_* / get_varnames logic, copied here as the reference, and through
+url_classifier. The benchmark checks both give the same answers and prints paths per second for each, and times
+classify_urls, the batch form, against classify_url called per path.
+"""
+import os
+import time
+import argparse
+from utilities.url_classifier import crawl_listing_actions, classify_url, classify_urls, is_in_doy_level
+from aws_utilities.aws_boto3_calls import get_varnames
+
+
+ucar_site = "https://data.cosmic.ucar.edu/gnss-ro/"
+reference_doy_arr = [str(doy).zfill(3) for doy in range(0, 367)]
+
+
+def reference_valid_proc_type(url):
+    for valid_proc in ['repro2016/', 'postProc/', 'repro2013/', 'nrt/']:
+        if valid_proc in url:
+            return True
+    return False
+
+
+def reference_correct_level(url):
+    for excluded_level in ['level0/', 'level1a/', 'provisional/', 'tools/']:
+        if excluded_level in url:
+            return False
+    return True
+
+
+def reference_correct_filetype(new_url):
+    if new_url.endswith(".tar.gz"):
+        for filetype in ['conPhs', 'atmPhs', 'atmPrf', 'wetPrf', 'wetPf2']:
+            if filetype in new_url:
+                return True
+    return False
+
+
+def reference_link_actions(urls):
+    file_urls = []
+    dir_urls = []
+    for new_url in urls:
+        if new_url.endswith('tar.gz'):
+            if reference_correct_filetype(new_url):
+                file_urls.append(new_url)
+        if new_url.endswith('/'):
+            if reference_valid_proc_type(new_url):
+                if reference_correct_level(new_url):
+                    dir_urls.append(new_url)
+
+    return file_urls, dir_urls
+
+
+def reference_varnames(file_url):
+    root_path, filename = os.path.split(file_url)
+    part_sort_key_content = root_path.replace(ucar_site, '').split('/')
+
+    filetype = None
+    for candidate in ['atmPhs', 'conPhs', 'atmPrf', 'wetPrf', 'wetPf2']:
+        if candidate in filename:
+            filetype = candidate
+
+    mission = part_sort_key_content[0]
+    offset = 1 if mission == 'spire' or mission == 'geoopt' else 0
+    return {'mission': mission, 'proctype': part_sort_key_content[1 + offset], 'filetype': filetype,
+            'year': part_sort_key_content[3 + offset], 'doy': part_sort_key_content[4 + offset]}
+
+
+def synthetic_paths(count):
+    missions = ['cosmic2', 'metopa', 'champ', 'spire/noaa', 'geoopt/noaa']
+    proctypes = ['nrt', 'postProc', 'repro2013', 'provisional']
+    levels = ['level1a', 'level1b', 'level2', 'level0']
+    filetypes = ['atmPhs', 'conPhs', 'atmPrf', 'wetPrf', 'wetPf2', 'ionPhs', 'podTc2']
+
+    paths = []
+    for i in range(count):
+        mission = missions[i % len(missions)]
+        proctype = proctypes[(i // 5) % len(proctypes)]
+        level = levels[(i // 20) % len(levels)]
+        year = 2006 + (i // 80) % 16
+        doy = f"{(i // 7) % 366 + 1:03d}"
+        depth = i % 9
+        directory = f"{ucar_site}{mission}/{proctype}/{level}/{year}/{doy}/"
+        if depth < 5:
+            # directory urls, from the mission down to the doy
+            paths.append(os.path.join(ucar_site, *directory.replace(ucar_site, '').split('/')[:depth + 1], ''))
+        else:
+            filetype = filetypes[i % len(filetypes)]
+            paths.append(f"{directory}{filetype}_{proctype}_{year}_{doy}.tar.gz")
+
+    return paths
+
+
+def rate(count, elapsed):
+    return f"{count / elapsed / 1e6:.2f}M paths/s"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--paths', type=int, default=1000000)
+    args = parser.parse_args()
+
+    paths = synthetic_paths(args.paths)
+
+    # the crawler sees the links grouped by the listing they are on
+    listings = {}
+    for path in paths:
+        parent, link = path.rstrip('/').rsplit('/', 1)
+        listings.setdefault(f"{parent}/", []).append(link + '/' if path.endswith('/') else link)
+
+    start = time.perf_counter()
+    reference_actions = [reference_link_actions([os.path.join(url, link) for link in links])
+                         for url, links in listings.items()]
+    reference_elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    actions = [crawl_listing_actions(url, links) for url, links in listings.items()]
+    elapsed = time.perf_counter() - start
+    print(f"listing link checks ({len(listings)} listings): reference {rate(len(paths), reference_elapsed)} | "
+          f"classifier {rate(len(paths), elapsed)} | same: {actions == reference_actions}")
+
+    doy_matches = [path.split('/')[-2] in reference_doy_arr for path in paths[:200000]] == \
+        [is_in_doy_level(path) for path in paths[:200000]]
+    print(f"doy level check same: {doy_matches}")
+
+    file_urls = [file_url for listing_file_urls, _ in actions for file_url in listing_file_urls]
+    start = time.perf_counter()
+    reference_records = [reference_varnames(file_url) for file_url in file_urls]
+    reference_elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    records = [get_varnames(file_url, 'ucar') for file_url in file_urls]
+    elapsed = time.perf_counter() - start
+    print(f"get_varnames: reference {rate(len(file_urls), reference_elapsed)} | classifier "
+          f"{rate(len(file_urls), elapsed)} | same: {records == reference_records}")
+
+    start = time.perf_counter()
+    ucar_paths = [classify_url(path) for path in paths]
+    elapsed = time.perf_counter() - start
+    atmprf_count = sum(1 for ucar_path in ucar_paths if ucar_path is not None and ucar_path.filetype == 'atmPrf')
+    print(f"classify_url: {rate(len(paths), elapsed)} | {sum(1 for ucar_path in ucar_paths if ucar_path is not None)} "
+          f"valid paths, {atmprf_count} atmPrf files | spire layout parsed: {classify_url(paths[3]).subdir == 'noaa'}")
+
+    start = time.perf_counter()
+    ucar_path_columns = classify_urls(paths)
+    elapsed = time.perf_counter() - start
+    same = all(bool(row['valid']) == (ucar_path is not None) and
+               (ucar_path is None or tuple(str(row[name]) for name in ucar_path._fields) ==
+                tuple('' if value is None else value for value in ucar_path))
+               for row, ucar_path in zip(ucar_path_columns[:200000], ucar_paths[:200000]))
+    atmprf_columns = ucar_path_columns['valid'] & (ucar_path_columns['filetype'] == 'atmPrf')
+    print(f"classify_urls: {rate(len(paths), elapsed)} | {int(atmprf_columns.sum())} atmPrf files | "
+          f"same as classify_url: {same}")
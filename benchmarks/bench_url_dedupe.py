@@ -0,0 +1,115 @@
+"""
+Benchmark of the discovered-url dedupe: the list scan recursive_scrape used against the hash set and Bloom filter
+backends of url_dedupe.
+
+    python -m benchmarks.bench_url_dedupe --urls 1000000 --duplicate-rate 0.2 --list-limit 20000
+
+A stream of ucar-like .tar.gz urls, duplicate-rate of them repeats of an earlier url, is fed to each structure in ten
+equal blocks and the cost per url of each block is printed, so a cost that grows with the number of urls already seen
+shows up as a rising row. The list scan is only run over the first list-limit urls. The benchmark checks every backend
+makes the same new/duplicate decision as the list scan for every url, and prints the memory each one reports.
+"""
+import time
+import random
+import argparse
+from utilities.url_dedupe import HashSetDedupe, BloomDedupe
+
+site = "https://data.cosmic.ucar.edu/gnss-ro/"
+
+
+def url_stream(count, duplicate_rate, seed=0):
+    """
+    Returns count urls, duplicate_rate of them repeating an earlier one.
+    """
+    stream_random = random.Random(seed)
+    urls = []
+    unique_count = 0
+    for _ in range(count):
+        if unique_count > 0 and stream_random.random() < duplicate_rate:
+            urls.append(urls[stream_random.randrange(len(urls))])
+            continue
+        year, doy = 2006 + unique_count // 400000 % 16, unique_count // 1000 % 366 + 1
+        urls.append(f"{site}cosmic2/postProc/level2/{year}/{doy:03d}/"
+                    f"atmPrf_C2E{unique_count % 6 + 1}.{year}.{doy:03d}.{unique_count:08d}.tar.gz")
+        unique_count += 1
+    return urls
+
+
+class ListScan:
+    """
+    The dedupe recursive_scrape did: `if new_url not in ucar_urls` over the global list.
+    """
+
+    def __init__(self):
+        self.urls = []
+
+    def add(self, url):
+        if url not in self.urls:
+            self.urls.append(url)
+            return True
+        return False
+
+    def close(self):
+        pass
+
+
+def run_blocks(dedupe, urls, blocks=10):
+    """
+    Feeds urls to dedupe in equal blocks, returns the decisions and the microseconds per url of each block.
+    """
+    decisions = []
+    block_costs = []
+    block_size = max(1, len(urls) // blocks)
+    for block_start in range(0, block_size * blocks, block_size):
+        block = urls[block_start:block_start + block_size]
+        start = time.perf_counter()
+        decisions.extend([dedupe.add(url) for url in block])
+        block_costs.append((time.perf_counter() - start) / len(block) * 1e6)
+    return decisions, block_costs
+
+
+def print_costs(name, block_costs, report=None):
+    costs = ' '.join(f"{cost:7.2f}" for cost in block_costs)
+    growth = block_costs[-1] / block_costs[0]
+    memory = f", {report['memory_bytes'] / 1024 / 1024:.1f} MiB" if report is not None else ''
+    print(f"{name:>6}: {costs}  us/url (last/first block {growth:.1f}x{memory})")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--urls', type=int, default=1000000)
+    parser.add_argument('--duplicate-rate', type=float, default=0.2)
+    parser.add_argument('--list-limit', type=int, default=20000)
+    parser.add_argument('--false-positive-rate', type=float, default=0.01)
+    args = parser.parse_args()
+
+    urls = url_stream(args.urls, args.duplicate_rate)
+    list_urls = urls[:args.list_limit]
+    print(f"{len(urls)} urls, {len(set(urls))} unique")
+
+    print(f"first {len(list_urls)} urls:")
+    list_decisions, list_costs = run_blocks(ListScan(), list_urls)
+    print_costs('list', list_costs)
+    for name, dedupe in [('set', HashSetDedupe()),
+                         ('bloom', BloomDedupe(capacity=len(list_urls),
+                                               false_positive_rate=args.false_positive_rate))]:
+        decisions, costs = run_blocks(dedupe, list_urls)
+        print_costs(name, costs, dedupe.memory_report())
+        print(f"        same decisions as the list scan: {decisions == list_decisions}")
+        dedupe.close()
+
+    print(f"all {len(urls)} urls:")
+    set_dedupe = HashSetDedupe()
+    set_decisions, set_costs = run_blocks(set_dedupe, urls)
+    print_costs('set', set_costs, set_dedupe.memory_report())
+    set_dedupe.close()
+    bloom_dedupe = BloomDedupe(capacity=len(urls), false_positive_rate=args.false_positive_rate)
+    bloom_decisions, bloom_costs = run_blocks(bloom_dedupe, urls)
+    report = bloom_dedupe.memory_report()
+    print_costs('bloom', bloom_costs, report)
+    bloom_dedupe.close()
+    print(f"        same decisions as the set: {bloom_decisions == set_decisions}, "
+          f"{report['exact_checks']} on-disk checks of which {report['false_positives']} false positives "
+          f"({report['false_positives'] / report['urls']:.2%} of new urls)")
+    print(f"list scan extrapolated to {len(urls)} urls: "
+          f"{list_costs[-1] * len(urls) / len(list_urls) * len(urls) / 2 / 1e6:.0f}s")
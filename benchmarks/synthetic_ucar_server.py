@@ -0,0 +1,350 @@
+"""
+Local stand-in for data.cosmic.ucar.edu that serves a synthetic gnss-ro directory tree.
+
+The tree is never materialised; every listing is generated from the request path, so large trees (many missions,
+years and days) cost nothing to set up. Listings use the same autoindex layout as the ucar site: a parent link
+first, then one link per entry followed by its modification time and size.
+
+Files support HEAD and single byte-range GETs. With drop_rate > 0 that fraction of file responses is cut off half way
+through the body, the way a flaky connection would, to exercise resumable downloads. With max_in_flight set, a
+request arriving while that many are already being served is refused with 429 and a Retry-After of retry_after
+seconds, like a server's rate protection.
+
+Run directly to serve a tree for manual testing:
+
+    python benchmarks/synthetic_ucar_server.py --port 8000 --years 2020 2021 --days 30
+"""
+import re
+import time
+import zlib
+import random
+import socket
+import argparse
+import threading
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+level_filetypes = {'level1b': ['atmPhs', 'conPhs'], 'level2': ['atmPrf', 'wetPrf', 'wetPf2']}
+listing_mtime = datetime(2021, 10, 27, 16, 29, tzinfo=timezone.utc)
+range_pattern = re.compile(r'bytes=([0-9]+)-([0-9]*)$')
+
+
+class SyntheticTree:
+    """
+    Description of the synthetic tree: /gnss-ro/<mission>/<proctype>/<level>/<year>/<doy>/<filetype>_<...>.tar.gz.
+    Missions named spire or geoopt get the extra 'noaa' directory the real site has. Every entry is listed with the same
+    modification time, except days rewritten with reprocess. Files are file_size bytes, or the size filetype_sizes gives
+    for their filetype.
+    """
+
+    def __init__(self, missions=('cosmic2', 'metopa'), proctypes=('postProc', 'nrt'), years=(2020, 2021),
+                 days=10, file_size=1024, filetype_sizes=None):
+        self.missions = list(missions)
+        self.proctypes = list(proctypes)
+        self.years = [str(year) for year in years]
+        self.doys = [str(doy).zfill(3) for doy in range(1, days + 1)]
+        self.file_size = file_size
+        self.filetype_sizes = dict(filetype_sizes or {})
+        self.reprocessed = {}
+
+    def size_of(self, filename):
+        return self.filetype_sizes.get(filename.split('_')[0], self.file_size)
+
+    def reprocess(self, mission, proctype, level, year, doy, mtime, file_size=None):
+        """
+        Rewrites the files of one day the way a reprocessing on a posix server does: the files and the doy directory get
+        the new modification time (and the files the new size), the year directory above keeps its own.
+        """
+        self.reprocessed[(mission, proctype, level.strip('/'), str(year), str(doy).zfill(3))] = \
+            (mtime, file_size or self.file_size)
+
+    def listing_count(self):
+        """
+        Number of directory listings a full crawl of the tree fetches (root, missions, proctypes, levels, years, doys).
+        """
+        per_level = 1 + len(self.years) * (1 + len(self.doys))
+        per_proctype = 1 + len(level_filetypes) * per_level
+        per_mission = 1 + len(self.proctypes) * per_proctype
+        spire_count = len([mission for mission in self.missions if mission in ('spire', 'geoopt')])
+        return 1 + len(self.missions) * per_mission + spire_count
+
+    def file_count(self):
+        files_per_day = sum(len(filetypes) for filetypes in level_filetypes.values())
+        return len(self.missions) * len(self.proctypes) * len(self.years) * len(self.doys) * files_per_day
+
+    def stamps(self, path, names):
+        """
+        Returns the modification time and size listed for each entry name of the directory at path.
+        """
+        parts = [part for part in path.split('/') if part not in ('', 'gnss-ro', 'noaa')]
+        entry_stamps = {}
+        for name in names:
+            mtime, size = listing_mtime, None if name.endswith('/') else self.size_of(name)
+            if len(parts) == 4 and tuple(parts) + (name.strip('/'),) in self.reprocessed:
+                mtime = self.reprocessed[tuple(parts) + (name.strip('/'),)][0]
+            elif len(parts) == 5 and tuple(parts) in self.reprocessed:
+                mtime, size = self.reprocessed[tuple(parts)]
+            entry_stamps[name] = (mtime, size)
+        return entry_stamps
+
+    def resolve(self, path):
+        """
+        Resolves a request path to ('dir', [entry names]) or ('file', size), or None if it does not exist.
+        """
+        parts = [part for part in path.split('/') if part != '']
+        if len(parts) == 0 or parts[0] != 'gnss-ro':
+            return None
+        parts = parts[1:]
+        if len(parts) == 0:
+            return 'dir', [f"{mission}/" for mission in self.missions]
+
+        mission = parts[0]
+        if mission not in self.missions:
+            return None
+        if mission in ('spire', 'geoopt'):
+            if len(parts) == 1:
+                return 'dir', ['noaa/']
+            if parts[1] != 'noaa':
+                return None
+            parts = parts[1:]
+        rest = parts[1:]
+
+        if len(rest) == 0:
+            return 'dir', [f"{proctype}/" for proctype in self.proctypes]
+        if rest[0] not in self.proctypes:
+            return None
+        if len(rest) == 1:
+            return 'dir', [f"{level}/" for level in level_filetypes]
+        if rest[1] not in level_filetypes:
+            return None
+        if len(rest) == 2:
+            return 'dir', [f"{year}/" for year in self.years]
+        if rest[2] not in self.years:
+            return None
+        if len(rest) == 3:
+            return 'dir', [f"{doy}/" for doy in self.doys]
+        if rest[3] not in self.doys:
+            return None
+        filenames = [f"{filetype}_{rest[0]}_{rest[2]}_{rest[3]}.tar.gz" for filetype in level_filetypes[rest[1]]]
+        if len(rest) == 4:
+            return 'dir', filenames
+        if len(rest) == 5 and rest[4] in filenames:
+            return 'file', self.reprocessed.get((mission,) + tuple(rest[:4]), (None, self.size_of(rest[4])))[1]
+        return None
+
+
+def render_listing(path, entries, entry_size=None, entry_stamps=None):
+    """
+    Renders an autoindex page for path with the given entry names. Directories get '-' as their size. entry_stamps
+    gives the (mtime, size) of each name, by default listing_mtime and entry_size.
+    """
+    lines = [f'<html>\r\n<head><title>Index of {path}</title></head>\r\n<body>',
+             f'<h1>Index of {path}</h1><hr><pre><a href="../">../</a>']
+    for name in entries:
+        mtime, size = (entry_stamps or {}).get(name, (listing_mtime, entry_size))
+        size = '-' if name.endswith('/') else str(size)
+        stamp = mtime.strftime('%d-%b-%Y %H:%M')
+        lines.append(f'<a href="{name}">{name}</a>{" " * max(1, 51 - len(name))}{stamp}{size:>20}')
+    lines.append('</pre><hr></body>\r\n</html>\r\n')
+    return '\r\n'.join(lines)
+
+
+def file_body(path, size):
+    """
+    Returns the content of the file at path: a byte pattern seeded by the path that does not repeat every 256 bytes,
+    so a range served from the wrong offset gives different bytes.
+    """
+    seed = zlib.crc32(path.encode())
+    block = bytes([(seed + i) % 256 for i in range(251)])
+    return (block * (size // len(block) + 1))[:size]
+
+
+def make_handler(tree, latency, drop_rate=0.0, max_in_flight=None, retry_after=1, stats=None, bandwidth=None):
+    drop_random = random.Random(0)
+    drop_lock = threading.Lock()
+    stats = stats if stats is not None else {}
+    stats.update({'in_flight': 0, 'peak_in_flight': 0, 'served': 0, 'throttled': 0})
+
+    class SyntheticUcarHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            super().setup()
+            # headers and body go out in separate writes, without this every response waits on a delayed ack
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_HEAD(self):
+            self.admit(head_only=True)
+
+        def do_GET(self):
+            self.admit(head_only=False)
+
+        def admit(self, head_only):
+            with drop_lock:
+                refused = max_in_flight is not None and stats['in_flight'] >= max_in_flight
+                if refused:
+                    stats['throttled'] += 1
+                else:
+                    stats['in_flight'] += 1
+                    stats['served'] += 1
+                    stats['peak_in_flight'] = max(stats['peak_in_flight'], stats['in_flight'])
+            if refused:
+                self.send_response(429)
+                self.send_header('Retry-After', str(retry_after))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            try:
+                self.respond(head_only)
+            finally:
+                with drop_lock:
+                    stats['in_flight'] -= 1
+
+        def respond(self, head_only):
+            if latency > 0:
+                time.sleep(latency)
+            resolved = tree.resolve(self.path)
+            if resolved is None:
+                self.send_error(404)
+                return
+
+            kind, value = resolved
+            if kind == 'dir':
+                body = render_listing(self.path, value, tree.file_size, tree.stamps(self.path, value)).encode()
+                etag = f'"{zlib.crc32(body):x}"'
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                content_type = 'text/html'
+            else:
+                body = file_body(self.path, value)
+                etag = f'"{zlib.crc32(self.path.encode()) ^ value:x}"'
+                content_type = 'application/octet-stream'
+
+            status = 200
+            content_range = None
+            range_match = range_pattern.match(self.headers.get('Range', '')) if kind == 'file' else None
+            if range_match is not None:
+                first_byte = int(range_match.group(1))
+                last_byte = min(int(range_match.group(2) or len(body) - 1), len(body) - 1)
+                if first_byte >= len(body):
+                    self.send_response(416)
+                    self.send_header('Content-Range', f"bytes */{len(body)}")
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                status = 206
+                content_range = f"bytes {first_byte}-{last_byte}/{len(body)}"
+                body = body[first_byte:last_byte + 1]
+
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', format_datetime(listing_mtime, usegmt=True))
+            if kind == 'file':
+                self.send_header('Accept-Ranges', 'bytes')
+            if content_range is not None:
+                self.send_header('Content-Range', content_range)
+            self.end_headers()
+            if head_only:
+                return
+
+            if kind == 'file' and drop_rate > 0 and len(body) > 1:
+                with drop_lock:
+                    drop = drop_random.random() < drop_rate
+                if drop:
+                    # promise the whole body, send half of it and hang up
+                    self.wfile.write(body[:len(body) // 2])
+                    self.wfile.flush()
+                    self.close_connection = True
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                    return
+            if kind == 'file' and bandwidth is not None:
+                # paced in chunks so a file takes its size / bandwidth to send
+                chunk_size = 64 * 1024
+                for chunk_start in range(0, len(body), chunk_size):
+                    chunk = body[chunk_start:chunk_start + chunk_size]
+                    self.wfile.write(chunk)
+                    time.sleep(len(chunk) / bandwidth)
+                return
+            self.wfile.write(body)
+
+    return SyntheticUcarHandler
+
+
+class SyntheticUcarServer:
+    """
+    Threaded HTTP server for a SyntheticTree. Use as a context manager; base_url is the equivalent of ucar_site. stats
+    counts the requests served and throttled and the peak number served at once. bandwidth caps the bytes per second
+    each file response is sent at.
+    """
+
+    def __init__(self, tree, host='127.0.0.1', port=0, latency=0.0, drop_rate=0.0, max_in_flight=None,
+                 retry_after=1, bandwidth=None):
+        self.tree = tree
+        self.stats = {}
+        self.httpd = ThreadingHTTPServer((host, port), make_handler(tree, latency, drop_rate, max_in_flight,
+                                                                    retry_after, self.stats, bandwidth))
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/gnss-ro/"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+def add_tree_arguments(parser):
+    parser.add_argument('--missions', nargs='+', default=['cosmic2', 'metopa'])
+    parser.add_argument('--proctypes', nargs='+', default=['postProc', 'nrt'])
+    parser.add_argument('--years', nargs='+', type=int, default=[2020, 2021])
+    parser.add_argument('--days', type=int, default=10)
+    parser.add_argument('--file-size', type=int, default=1024)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds of delay added to every response")
+    parser.add_argument('--drop-rate', type=float, default=0.0,
+                        help="fraction of file responses cut off half way through the body")
+    parser.add_argument('--max-in-flight', type=int, default=None,
+                        help="concurrent requests above which the server answers 429 with a Retry-After")
+    parser.add_argument('--bandwidth', type=float, default=None, help="bytes per second each file is sent at")
+    return parser
+
+
+def tree_from_args(args):
+    return SyntheticTree(args.missions, args.proctypes, args.years, args.days, args.file_size)
+
+
+if __name__ == '__main__':
+    parser = add_tree_arguments(argparse.ArgumentParser(description=__doc__.split('\n')[1]))
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+
+    server = SyntheticUcarServer(tree_from_args(args), port=args.port, latency=args.latency, drop_rate=args.drop_rate,
+                                 max_in_flight=args.max_in_flight, bandwidth=args.bandwidth)
+    print(f"serving {server.tree.listing_count()} listings / {server.tree.file_count()} files at {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
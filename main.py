@@ -5,15 +5,28 @@ import time
 import json
 from datetime import date
 from utilities.ucar_repo_status import recursive_scrape, get_mission_level_urls, check_last_searched, \
-    create_last_searched_json, check_for_new_ucar_entries, ucar_urls, download_file, create_s3_obj_key_file, \
+    create_last_searched_json, check_for_new_ucar_entries, check_for_changed_ucar_entries, ucar_urls, download_file, create_s3_obj_key_file, \
     check_new_proctype, check_new_doy, check_new_proctype_year, check_before_doy, check_before_proctype_year
 
-from utilities.compare_in_s3 import compare_against_obj_key_file, get_obj_key_file_list, get_ucar_file_url_list
+from utilities.async_crawler import crawl_to_manifests
+from utilities.sharded_crawl import sharded_crawl_to_manifests
+from utilities.transfer_pipeline import run_transfer_pipeline
+from utilities.policy_planner import plan_policies
+from utilities.http_client import format_http_summary
+from utilities.rate_scheduler import format_scheduler_summary
+from utilities.listing_cache import format_listing_cache_summary
+from utilities.instrumentation import format_metrics_summary, write_metrics_report
 
-from aws_utilities.aws_boto3_calls import aws_dynamodb_table, get_varnames, create_partition_key, create_sort_key, \
-    dynamodb_table_create_entry, dynamodb_table_batch_write_entries, aws_s3_bucket
+from utilities.compare_in_s3 import compare_against_obj_key_file, local_s3_obj_key_file
+from utilities.key_index import load_key_index
+from utilities.binary_manifest import list_manifest_paths
+from utilities.crawl_state import seed_crawl_state, write_last_searched_json
+from utilities.listing_metadata import open_change_detector
+from utilities.s3_inventory import find_latest_obj_key_file, sync_obj_key_file, touched_prefixes
 
-from multiprocessing import Pool
+from aws_utilities.aws_boto3_calls import aws_dynamodb_table, dynamodb_table_create_entry, \
+    dynamodb_table_batch_write_entries, aws_s3_bucket, s3_transfer_config
+from aws_utilities.catalog_loader import build_catalog_items_from_manifests
 
 
 logging.basicConfig(level=logging.INFO,
@@ -26,10 +39,12 @@ LOGGER = logging.getLogger(__name__)
 
 
 parentDir = pathlib.Path(__file__).parent.resolve()
-ucar_site = "https://data.cosmic.ucar.edu/gnss-ro/"
-mission_urls = get_mission_level_urls(ucar_site)
+ucar_site = os.environ.get('UCAR_SITE', "https://data.cosmic.ucar.edu/gnss-ro/")
+# listed from the site on first use by get_mission_urls, not when main is imported
+mission_urls = None
 
-aws_profile = 'aernasaprod'
+# an empty UCAR_AWS_PROFILE uses boto3's default credential chain
+aws_profile = os.environ.get('UCAR_AWS_PROFILE', 'aernasaprod') or None
 
 #table_name = 'gnss-ro-available-tar-file-table'
 #dynamodb = aws_dynamodb_table(aws_profile, table_name)
@@ -40,6 +55,18 @@ bucket_name = 'ucar-earth-ro-archive'
 test_bucket_name = 'processed-nasa-access-data-in-work'
 
 
+def get_mission_urls():
+    """
+    Function returns the mission level urls of the ucar site, listing the site the first time it is called and
+    returning the same dictionary afterwards.
+    :return mission_urls:
+    """
+    global mission_urls
+    if mission_urls is None:
+        mission_urls = get_mission_level_urls(ucar_site)
+    return mission_urls
+
+
 def test_file_content_compare():
     filepath = os.path.join(parentDir, 'champ.txt')
     compare_against_obj_key_file(filepath)
@@ -48,63 +75,55 @@ def test_file_content_compare():
 def test_boto3_calls(the_manifest_file):
 
     print(os.getpid(), " using file: ", the_manifest_file)
-    ucar_url_list = get_ucar_file_url_list(the_manifest_file)
-    mission = os.path.basename(the_manifest_file).replace('.txt', '')
-    obj_file_key_list = get_obj_key_file_list(mission)
-
-    list_of_item_dicts = []
-    for file_url in ucar_url_list:
-        varnames_dict = get_varnames(file_url, 'ucar')
-        proctype = varnames_dict['proctype']
-        filetype = varnames_dict['filetype']
-        year = varnames_dict['year']
-        doy = varnames_dict['doy']
-
-        ucar_file_key = [file_url.replace(ucar_site, '')]
-        intersection = set(ucar_file_key).intersection(set(obj_file_key_list))
-        if len(intersection) > 0:
-            partition_key = create_partition_key(mission, proctype, filetype)
-            sort_key = create_sort_key(year, doy)
-
-            s3_url = os.path.join(bucket_url, ucar_file_key[0])
-            ucar_url = file_url
-
-            the_item = {'mission-procType-fileType': partition_key, 'YYYYDDD': sort_key,
-                        'ucar_url': ucar_url, 's3_url': s3_url}
-            LOGGER.info(f"partkey:  {partition_key} | sortkey:  {sort_key} | ucar_url:  {ucar_url} | s3_url: {s3_url}")
-            list_of_item_dicts.append(the_item)
-        else:
-            partition_key = create_partition_key(mission, proctype, filetype)
-            sort_key = create_sort_key(year, doy)
+    load_catalog([the_manifest_file])
 
-            s3_url = ''
-            ucar_url = file_url
+    LOGGER.info(f"{os.getpid()}, finished")
 
-            the_item = {'mission-procType-fileType': partition_key, 'YYYYDDD': sort_key,
-                        'ucar_url': ucar_url, 's3_url': s3_url}
-            LOGGER.info(f"partkey:  {partition_key} | sortkey:  {sort_key} | ucar_url:  {ucar_url} | s3_url: {s3_url}")
-            list_of_item_dicts.append(the_item)
+    return
 
-    dynamodb_table_batch_write_entries(dynamodb, list_of_item_dicts)
 
-    LOGGER.info(f"{os.getpid()}, finished")
+def load_catalog(manifest_paths=None, table_name='gnss-ro-available-tar-file-table', writers=None):
+    """
+    Loads the catalog table from the mission manifests in one process: items are built for all manifests at once
+    against the obj key index and written by parallel batch writers.
+    :param manifest_paths: defaults to every manifest in ucar_file_manifests_per_mission
+    :param table_name:
+    :param writers:
+    :return report:
+    """
+    if manifest_paths is None:
+        manifest_paths = list_manifest_paths(os.path.join(parentDir, 'ucar_file_manifests_per_mission'))
 
-    return
+    dynamodb = aws_dynamodb_table(aws_profile, table_name)
+    key_index = load_key_index(local_s3_obj_key_file)
+    item_list = build_catalog_items_from_manifests(manifest_paths, key_index, bucket_url)
+
+    report = dynamodb_table_batch_write_entries(dynamodb, item_list, writers=writers)
+    print(report.summary())
+
+    return report
 
 
-def live_run():
+def live_run(transfer_mode='stream', crawl_processes=None, change_detection=False, download_order=None,
+             inventory_manifest=None, list_shard_depth=0):
+    """
+    Incremental run: crawl what is new since last_searched_info.json, transfer it to s3 and publish the new key file.
+    :param transfer_mode: 'stream' straight to s3 or 'spool' through the local mirror
+    :param crawl_processes: crawl with this many worker processes instead of the single process async crawler
+    :param change_detection: crawl every processing type and use listing modification times to list only the days
+        that changed, which also finds days reprocessed in old years; always uses the single process crawler
+    :param download_order: order the transfers by size, 'fifo', 'shortest_first' or 'largest_first' (see
+        download_scheduler); the run reports the makespan against the one each order predicts
+    :param inventory_manifest: s3:// url of an S3 Inventory manifest.json whose keys are merged into the new key file
+    :param list_shard_depth: split each prefix listed for the new key file into its children this many levels down
+    """
     bucket = aws_s3_bucket(aws_profile, test_bucket_name)
 
-    file_manifest_list = os.listdir(os.path.join(parentDir, 'ucar_file_manifests_per_mission', ""))
-    file_manifests_path_list = []
+    file_manifests_path_list = list_manifest_paths(os.path.join(parentDir, 'ucar_file_manifests_per_mission', ""))
 
     to_download_list = []
 
-    if len(file_manifest_list) > 0:
-        for manifest_file in file_manifest_list:
-            manifest_filepath = os.path.join(parentDir, 'ucar_file_manifests_per_mission', manifest_file)
-            file_manifests_path_list.append(manifest_filepath)
-    else:
+    if len(file_manifests_path_list) == 0:
         for obj in bucket.objects.filter(Delimiter='/', Prefix='ucar_file_manifest_per_mission/'):
             obj_key = obj.key
             filename = obj_key.split('/')[1]
@@ -112,113 +131,95 @@ def live_run():
             print("local: ", local_path, " | obj.key: ", obj_key)
             bucket.download_file(obj_key, local_path)
 
-        file_manifest_list = os.listdir(os.path.join(parentDir, 'ucar_file_manifests_per_mission', ""))
-        for manifest_file in file_manifest_list:
-            manifest_filepath = os.path.join(parentDir, 'ucar_file_manifests_per_mission', manifest_file)
-            file_manifests_path_list.append(manifest_filepath)
+        file_manifests_path_list = list_manifest_paths(os.path.join(parentDir, 'ucar_file_manifests_per_mission', ""))
     print(file_manifests_path_list)
     # Change logic for determining if last_searched_info.json is available 1/8/2022
     if "last_searched_info.json" not in os.listdir(parentDir):
         print("Creating new last_searched_info.json...")
-        last_searched_json_path = create_last_searched_json(file_manifests_path_list)
+        # read from the crawl state instead of re-parsing every manifest
+        seed_crawl_state(file_manifests_path_list)
+        last_searched_json_path = write_last_searched_json(os.path.join(parentDir, "last_searched_info.json"))
         with open(last_searched_json_path, 'r+') as the_json_file:
             last_searched_dict = json.load(the_json_file)
     else:
         with open("last_searched_info.json", 'r+') as the_json_file:
             last_searched_dict = json.load(the_json_file)
 
-    new_ucar_urls = check_for_new_ucar_entries(last_searched_dict)
-    for new_url in new_ucar_urls:
-        recursive_scrape(new_url)
+    change_detector = None
+    if change_detection:
+        change_detector = open_change_detector()
+        crawl_to_manifests(check_for_changed_ucar_entries(last_searched_dict), change_detector=change_detector)
+        print(change_detector.summary())
+    else:
+        new_ucar_urls = check_for_new_ucar_entries(last_searched_dict)
+        if crawl_processes is not None:
+            sharded_crawl_to_manifests(new_ucar_urls, processes=crawl_processes)
+        else:
+            crawl_to_manifests(new_ucar_urls)
     to_download_list.extend(ucar_urls)
 
     print(to_download_list)
     if len(to_download_list) > 0:
 
-        for to_download_item in to_download_list:
-            # download locally
-            # conditional for testing only 1/9/2022
-            if "conPhs" not in to_download_item and "atmPhs" not in to_download_item:
-                path_to_local_file = download_file(to_download_item)
-                s3_key = to_download_item.replace(ucar_site, '')
-
-                # upload to s3
-                bucket.upload_file(path_to_local_file, s3_key)
+        # conditional for testing only 1/9/2022
+        to_transfer_list = [to_download_item for to_download_item in to_download_list
+                            if "conPhs" not in to_download_item and "atmPhs" not in to_download_item]
+        # sizes the change detection crawl recorded, the rest come from the listing cache
+        known_sizes = change_detector.store.file_sizes(to_transfer_list) if change_detector is not None else None
+        # stream straight to s3, or transfer_mode='spool' to download to the local mirror and upload from there
+        run_transfer_pipeline(to_transfer_list, bucket, transfer_config=s3_transfer_config(), mode=transfer_mode,
+                              sizes=known_sizes, download_order=download_order)
 
         new_proctype_signal_file = f'signal_new_proc_type_{date.today()}.json'
         if new_proctype_signal_file in os.listdir(parentDir):
             bucket.upload_file(new_proctype_signal_file, new_proctype_signal_file)
-        # publish new s3_obj_key_file
-        local_key_file_path = create_s3_obj_key_file(bucket)
+        # publish new s3_obj_key_file, listing only the prefixes written to unless there is no previous key file
+        base_obj_key_file = find_latest_obj_key_file(parentDir)
+        if base_obj_key_file is not None:
+            written_keys = [to_transfer_item.replace(ucar_site, '') for to_transfer_item in to_transfer_list]
+            local_key_file_path = sync_obj_key_file(bucket, touched_prefixes(written_keys), base_obj_key_file,
+                                                    shard_depth=list_shard_depth,
+                                                    inventory_manifest=inventory_manifest, output_dir=parentDir)
+        else:
+            local_key_file_path = create_s3_obj_key_file(bucket)
         obj_key_filename = os.path.basename(local_key_file_path)
         bucket.upload_file(local_key_file_path, obj_key_filename)
         # publish new last_searched_info.json
+        write_last_searched_json(os.path.join(parentDir, "last_searched_info.json"))
+
+    if change_detector is not None:
+        # only now that the changed files are in s3 do they become the reference for the next run
+        change_detector.commit()
+        change_detector.close()
 
     return
 
 
-def use_policies_json():
+def use_policies_json(crawl_processes=None):
     """
     Driver for web scraping utility that utilizes policies.json for determining
+    :param crawl_processes: crawl with this many worker processes instead of the single process async crawler
     :return:
     """
     with open("policies.json", 'r+') as the_json_file:
         policy_dict = json.load(the_json_file)
 
-    to_search_urls = []
     to_download_list = []
-    if len(mission_urls['non_data_description']) > 0:
-        LOGGER.info(f"NEW MISSIONS FOUND: {mission_urls['non_data_description']}")
-
-    for mission in policy_dict.keys():
-        proc_type_list = []
-        mission_url = os.path.join(ucar_site, mission, '')
-        for proc_type in policy_dict[mission].keys():
-            proc_type_list.append(proc_type)
-            if policy_dict[mission][proc_type]['policy'] != "keep_none":
-                policy_url = os.path.join(ucar_site, mission, proc_type, '')
-                policy_start_year = policy_dict[mission][proc_type]['start_date'].split('-')[0]
-                policy_start_doy = policy_dict[mission][proc_type]['start_date'].split('-')[1]
-                policy_end_year = policy_dict[mission][proc_type]['end_date'].split('-')[0]
-                policy_end_doy = policy_dict[mission][proc_type]['end_date'].split('-')[1]
-
-                if policy_dict[mission][proc_type]['policy'] == 'keep_all':
-                    to_search_urls.append(policy_url)
-                if policy_dict[mission][proc_type]['policy'] == 'keep_after':
-                    # keep after start date
-                    to_search_urls.extend(check_new_doy(policy_url, policy_start_year, policy_start_doy))
-                    to_search_urls.extend(check_new_proctype_year(policy_url, policy_start_year))
-                if policy_dict[mission][proc_type]['policy'] == 'keep_before':
-                    # keep before end date
-                    to_search_urls.extend(check_before_doy(policy_url, policy_end_year, policy_end_doy))
-                    to_search_urls.extend(check_before_proctype_year(policy_url, policy_end_year))
-                if policy_dict[mission][proc_type]['policy'] == 'keep_after_and_before':
-                    # keep between start and end date
-                    to_search_urls.extend(check_new_doy(policy_url, policy_start_year, policy_start_doy))
-                    to_search_urls.extend(check_before_doy(policy_url, policy_end_year, policy_end_doy))
-                    year_before_end_urls = check_before_proctype_year(policy_url, policy_end_year)
-                    for the_year_url in year_before_end_urls:
-                        if policy_end_year not in the_year_url and policy_start_year not in the_year_url:
-                            to_search_urls.append(the_year_url)
-
-                #new_year_urls = check_new_proctype_year(policy_url, policy_end_year)
-                #new_doy_urls = check_new_doy(policy_url, policy_end_year, policy_end_doy)
-                #if len(new_year_urls) > 0:
-                #    to_search_urls.extend(new_year_urls)
-                #    new_year_end = new_year_urls[0].split('/')[-2]
-                #    new_doy_end = check_new_doy(policy_url, new_year_end, '000')[-1].split('/')[-2]
-                #    new_end_date = f"{new_year_end}-{new_doy_end}"
-                #    policy_dict[mission][proc_type]["end_date"] = new_end_date
-                #if len(new_doy_urls) > 0:
-                #    to_search_urls.extend(new_doy_urls)
-
-        new_proc_types = check_new_proctype(mission_url, proc_type_list)
-        if len(new_proc_types) > 0:
-            LOGGER.info(f"NEW PROC TYPES FOUND FOR {mission}: {new_proc_types}")
+    new_missions = get_mission_urls()['non_data_description']
+    if len(new_missions) > 0:
+        LOGGER.info(f"NEW MISSIONS FOUND: {new_missions}")
+
+    plan = plan_policies(policy_dict)
+    print(plan.summary())
+    for mission, new_proc_types in plan.new_proc_types.items():
+        LOGGER.info(f"NEW PROC TYPES FOUND FOR {mission}: {new_proc_types}")
+    to_search_urls = plan.to_search_urls
 
     print(to_search_urls)
-    for url in to_search_urls:
-        recursive_scrape(url)
+    if crawl_processes is not None:
+        sharded_crawl_to_manifests(to_search_urls, processes=crawl_processes)
+    else:
+        crawl_to_manifests(to_search_urls)
     to_download_list.extend(ucar_urls)
     print(to_download_list)
 
@@ -298,6 +299,11 @@ if __name__ == '__main__':
     #upload_manifest_files_to_s3()
     end = time.perf_counter()
     print(f"runtime = {end - start}")
+    print(format_http_summary())
+    print(format_scheduler_summary())
+    print(format_listing_cache_summary())
+    print(format_metrics_summary())
+    print(f"metrics report: {write_metrics_report()}")
 
     #test_ucar_site_drill_down()
     #test_file_content_compare()
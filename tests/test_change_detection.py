@@ -0,0 +1,49 @@
+"""
+Tests that the change detector's baseline comes from the high-water mark of each proctype, so days of a proctype the
+crawl state has not seen are reported.
+"""
+import sqlite3
+from utilities.crawl_state import CrawlStateStore
+from utilities.listing_metadata import ChangeDetector, ListingMetadataStore
+from utilities.listing_parser import ListingEntry
+
+site = 'https://data.cosmic.ucar.edu/gnss-ro/'
+
+
+def day_listing(proctype, year, doy):
+    url = f"{site}cosmic2/{proctype}/level2/{year}/{doy}/"
+    entries = [ListingEntry(f"atmPrf_{proctype}_{year}_{doy}.tar.gz", '2024-06-01 00:00', 1000)]
+    return url, entries, [url + entry.href for entry in entries]
+
+
+def test_new_proctype_before_another_proctypes_mark_is_reported(tmp_path):
+    state = CrawlStateStore(str(tmp_path / 'crawl_state.sqlite'))
+    state.record_urls([f"{site}cosmic2/nrt/level2/2024/100/atmPrf_nrt_2024_100.tar.gz"], site=site)
+    detector = ChangeDetector(ListingMetadataStore(str(tmp_path / 'listing_metadata.sqlite')),
+                              state.high_water_marks(), site=site)
+
+    url, entries, file_urls = day_listing('repro2021', 2020, '005')
+    assert detector.changed_files(url, entries, file_urls) == file_urls
+
+    url, entries, file_urls = day_listing('nrt', 2020, '005')
+    assert detector.changed_files(url, entries, file_urls) == []
+    detector.close()
+
+
+def test_state_with_mission_level_marks_is_cleared(tmp_path):
+    path = str(tmp_path / 'crawl_state.sqlite')
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE last_found (mission TEXT PRIMARY KEY, url TEXT NOT NULL, proctype TEXT NOT NULL, "
+                       "year TEXT NOT NULL, doy TEXT NOT NULL)")
+    connection.execute("INSERT INTO last_found VALUES ('cosmic2', 'url', 'nrt', '2024', '100')")
+    connection.execute("CREATE TABLE high_water (mission TEXT NOT NULL, level TEXT NOT NULL, proctype TEXT NOT NULL, "
+                       "year TEXT NOT NULL, doy TEXT NOT NULL, year_doy INTEGER NOT NULL, url TEXT NOT NULL, "
+                       "PRIMARY KEY (mission, level))")
+    connection.execute("INSERT INTO high_water VALUES ('cosmic2', 'level2', 'nrt', '2024', '100', 2024100, 'url')")
+    connection.commit()
+    connection.close()
+
+    state = CrawlStateStore(path)
+
+    assert state.is_empty()
+    assert state.high_water_marks() == {}
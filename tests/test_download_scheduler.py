@@ -0,0 +1,20 @@
+"""
+Tests that a download schedule is built from the sizes of its own urls only.
+"""
+from utilities.download_scheduler import schedule_downloads, learn_file_sizes
+
+site = 'https://data.cosmic.ucar.edu/gnss-ro/'
+
+
+def test_sizes_of_other_urls_are_ignored():
+    urls = [f"{site}{i}.tar.gz" for i in range(3)]
+    # a metadata store holds the sizes of many more files than are being downloaded
+    sizes = {urls[0]: 100, urls[1]: 300}
+    sizes.update({f"{site}other_{i}.tar.gz": 10_000 for i in range(10)})
+
+    assert learn_file_sizes(urls, sizes) == {urls[0]: 100, urls[1]: 300}
+
+    schedule = schedule_downloads(urls, workers=2, policy='fifo', sizes=sizes)
+    assert schedule.known_sizes == 2
+    # the unknown size is the median of the known sizes of these urls
+    assert schedule.sizes == {urls[0]: 100, urls[1]: 300, urls[2]: 200}
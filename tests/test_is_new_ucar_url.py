@@ -0,0 +1,57 @@
+"""
+Tests that is_new_ucar_url keeps its dedupe in step with the global ucar_urls list without rebuilding it per url.
+"""
+import pytest
+from utilities import ucar_repo_status
+from utilities.url_dedupe import configure_url_dedupe, url_dedupe_config
+
+site = 'https://data.cosmic.ucar.edu/gnss-ro/'
+
+
+@pytest.fixture(params=['set', 'bloom'])
+def dedupe_opens(request, monkeypatch):
+    saved_config = dict(url_dedupe_config)
+    configure_url_dedupe(backend=request.param, capacity=10_000)
+    opens = []
+
+    def counting_open(urls):
+        opens.append(len(urls))
+        return open_url_dedupe(urls)
+
+    open_url_dedupe = ucar_repo_status.open_url_dedupe
+    monkeypatch.setattr(ucar_repo_status, 'open_url_dedupe', counting_open)
+    monkeypatch.setattr(ucar_repo_status, '_ucar_url_dedupe', None)
+    del ucar_repo_status.ucar_urls[:]
+    yield opens
+    ucar_repo_status._ucar_url_dedupe.close()
+    del ucar_repo_status.ucar_urls[:]
+    url_dedupe_config.update(saved_config)
+
+
+def test_duplicates_in_list_do_not_rebuild(dedupe_opens):
+    ucar_urls = ucar_repo_status.ucar_urls
+    ucar_urls.extend([site + 'a.tar.gz', site + 'a.tar.gz'])
+
+    for i in range(100):
+        new_url = f"{site}{i}.tar.gz"
+        assert ucar_repo_status.is_new_ucar_url(new_url)
+        ucar_urls.append(new_url)
+        # appended from outside, e.g. by ManifestRecorder
+        ucar_urls.append(site + 'a.tar.gz')
+
+    assert not ucar_repo_status.is_new_ucar_url(site + 'a.tar.gz')
+    assert not ucar_repo_status.is_new_ucar_url(site + '7.tar.gz')
+    assert dedupe_opens == [2]
+
+
+def test_cleared_list_rebuilds(dedupe_opens):
+    ucar_urls = ucar_repo_status.ucar_urls
+    assert ucar_repo_status.is_new_ucar_url(site + 'a.tar.gz')
+    ucar_urls.append(site + 'a.tar.gz')
+    assert ucar_repo_status.is_new_ucar_url(site + 'b.tar.gz')
+    ucar_urls.append(site + 'b.tar.gz')
+
+    del ucar_urls[:]
+
+    assert ucar_repo_status.is_new_ucar_url(site + 'a.tar.gz')
+    assert dedupe_opens == [0, 0]
@@ -0,0 +1,23 @@
+"""
+Tests of normalize_key_file writing its output, including over its own input.
+"""
+from utilities import compare_in_s3, key_normalizer
+from utilities.key_normalizer import normalize_key_file
+
+keys = "cosmic2/nrt/level2/2020/5/atmPrf_nrt_2020_005.tar.gz\n champ/postProc/level2/2008/37/x.tar.gz\n"
+padded_keys = "cosmic2/nrt/level2/2020/005/atmPrf_nrt_2020_005.tar.gz\nchamp/postProc/level2/2008/037/x.tar.gz\n"
+
+
+def test_normalize_in_place(tmp_path):
+    key_file = tmp_path / 'obj_keys.txt'
+    key_file.write_text(keys)
+
+    report = normalize_key_file(str(key_file), str(key_file), chunk_bytes=16)
+
+    assert key_file.read_text() == padded_keys
+    assert report.changed == 2
+    assert [path.name for path in tmp_path.iterdir()] == ['obj_keys.txt']
+
+
+def test_comparer_reads_the_file_the_normalizer_writes():
+    assert compare_in_s3.local_s3_obj_key_file == key_normalizer.default_output_path
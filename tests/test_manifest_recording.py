@@ -0,0 +1,71 @@
+"""
+Tests that found files are recorded in the binary manifests by both the serial and the concurrent crawl, and that a
+file the manifest cannot hold is left out of it without failing its listing.
+"""
+import asyncio
+import pytest
+from utilities import ucar_repo_status
+from utilities.async_crawler import AsyncCrawler, ManifestRecorder
+from utilities.binary_manifest import ManifestReader, binary_manifest_path
+from utilities.crawl_state import crawl_state_config, configure_crawl_state
+
+site = 'https://data.cosmic.ucar.edu/gnss-ro/'
+doy_url = site + 'cosmic2/nrt/level2/2021/001/'
+long_filename = 'atmPrf_' + 'x' * 60 + '.tar.gz'
+listings = {
+    site + 'cosmic2/': ['../', 'nrt/'],
+    site + 'cosmic2/nrt/': ['../', 'level2/'],
+    site + 'cosmic2/nrt/level2/': ['../', '2021/'],
+    site + 'cosmic2/nrt/level2/2021/': ['../', '001/'],
+    doy_url: ['../', 'atmPrf_nrt_2021_001.tar.gz', long_filename, 'wetPrf_nrt_2021_001.tar.gz'],
+}
+manifest_urls = [doy_url + 'atmPrf_nrt_2021_001.tar.gz', doy_url + 'wetPrf_nrt_2021_001.tar.gz']
+
+
+@pytest.fixture
+def manifest_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(ucar_repo_status, 'ucar_manifests_loc', str(tmp_path))
+    monkeypatch.setattr(ucar_repo_status, 'ucar_site', site)
+    monkeypatch.setattr(ucar_repo_status, 'get_href_list', listings.__getitem__)
+    monkeypatch.setattr(ucar_repo_status, '_ucar_url_dedupe', None)
+    saved_config = dict(crawl_state_config)
+    configure_crawl_state(path=str(tmp_path / 'crawl_state.sqlite'))
+    del ucar_repo_status.ucar_urls[:]
+    yield str(tmp_path)
+    del ucar_repo_status.ucar_urls[:]
+    configure_crawl_state(**saved_config)
+
+
+def read_manifest_urls(manifest_dir):
+    return ManifestReader(binary_manifest_path(manifest_dir, 'cosmic2')).urls()
+
+
+def test_recursive_scrape_writes_binary_manifest(manifest_dir):
+    ucar_repo_status.recursive_scrape(site + 'cosmic2/')
+
+    assert sorted(read_manifest_urls(manifest_dir)) == manifest_urls
+    assert sorted(ucar_repo_status.ucar_urls) == sorted(manifest_urls + [doy_url + long_filename])
+
+
+def test_unrecordable_file_does_not_fail_listing(manifest_dir):
+    with ManifestRecorder() as record_file:
+        crawler = AsyncCrawler(max_workers=2, fetch=listings.__getitem__, on_file=record_file)
+        found_urls = asyncio.run(crawler.crawl([site + 'cosmic2/']))
+
+    assert crawler.failed_urls == []
+    assert found_urls == sorted(manifest_urls + [doy_url + long_filename])
+    assert record_file.skipped_urls == [doy_url + long_filename]
+    assert sorted(read_manifest_urls(manifest_dir)) == manifest_urls
+
+
+def test_on_file_error_fails_only_that_file(manifest_dir):
+    def on_file(new_url):
+        if new_url.endswith(long_filename):
+            raise RuntimeError('cannot record')
+
+    crawler = AsyncCrawler(max_workers=2, fetch=listings.__getitem__, on_file=on_file)
+    found_urls = asyncio.run(crawler.crawl([site + 'cosmic2/']))
+
+    assert crawler.failed_urls == []
+    assert crawler.failed_files == [doy_url + long_filename]
+    assert len(found_urls) == 3
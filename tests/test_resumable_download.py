@@ -0,0 +1,188 @@
+"""
+Tests of download_with_resume against a local http server that drops connections mid-stream, ignores Range, answers
+416 and changes files between requests.
+"""
+import os
+import re
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from utilities.resumable_download import download_with_resume, download_config, configure_downloads
+
+range_pattern = re.compile(r'bytes=([0-9]+)-')
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """
+    Serves server.files[path] and records every request's path and Range header in server.requests. The behaviour of a
+    path is set in server.behaviours: 'drop' cuts off the first drops responses half way, 'drop_always' every one, and
+    'ignore_range' answers Range requests with the whole body; a Range past the end of the file gets a 416.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def _respond(self, send_body):
+        server = self.server
+        body = server.files[self.path]
+        behaviour = server.behaviours.get(self.path, {})
+        range_header = self.headers.get('Range')
+        with server.lock:
+            server.requests.append((self.command, self.path, range_header))
+            get_count = sum(1 for command, path, _ in server.requests if command == 'GET' and path == self.path)
+
+        range_match = range_pattern.match(range_header or '')
+        offset = int(range_match.group(1)) if range_match is not None and not behaviour.get('ignore_range') else 0
+        if offset >= len(body) > 0:
+            self.send_response(416)
+            self.send_header('Content-Range', f"bytes */{len(body)}")
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if offset > 0:
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {offset}-{len(body) - 1}/{len(body)}")
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(body) - offset))
+        self.end_headers()
+        if not send_body:
+            return
+
+        drop = behaviour.get('drop_always') or get_count <= behaviour.get('drop', 0)
+        if drop:
+            # half of what was promised, then the connection goes away
+            self.wfile.write(body[offset:offset + (len(body) - offset) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            self.connection.shutdown(2)
+            return
+        self.wfile.write(body[offset:])
+
+
+@pytest.fixture
+def server():
+    http_server = ThreadingHTTPServer(('127.0.0.1', 0), FlakyHandler)
+    http_server.files = {}
+    http_server.behaviours = {}
+    http_server.requests = []
+    http_server.lock = threading.Lock()
+    thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+    thread.start()
+    http_server.base_url = f"http://127.0.0.1:{http_server.server_address[1]}"
+    yield http_server
+    http_server.shutdown()
+    http_server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff():
+    saved_config = dict(download_config)
+    configure_downloads(base_backoff=0.0, max_backoff=0.0)
+    yield
+    download_config.update(saved_config)
+
+
+def file_body(size, seed=0):
+    return bytes((i * 7 + seed) % 251 for i in range(size))
+
+
+def get_ranges(server, path):
+    return [range_header for command, request_path, range_header in server.requests
+            if command == 'GET' and request_path == path]
+
+
+def test_resumes_with_range_after_mid_stream_drop(server, tmp_path):
+    body = file_body(200_000)
+    server.files['/a.tar.gz'] = body
+    server.behaviours['/a.tar.gz'] = {'drop': 1}
+    full_path = str(tmp_path / 'a.tar.gz')
+
+    assert download_with_resume(server.base_url + '/a.tar.gz', full_path) == full_path
+
+    with open(full_path, 'rb') as the_file:
+        assert the_file.read() == body
+    # the second request resumes from what was written before the drop, at most the half that was sent
+    first_range, second_range = get_ranges(server, '/a.tar.gz')
+    assert first_range is None
+    assert 0 < int(range_pattern.match(second_range).group(1)) <= len(body) // 2
+    assert not os.path.exists(full_path + download_config['part_suffix'])
+
+
+def test_server_ignoring_range_replaces_partial_file(server, tmp_path):
+    body = file_body(200_000)
+    server.files['/a.tar.gz'] = body
+    server.behaviours['/a.tar.gz'] = {'drop': 1, 'ignore_range': True}
+    full_path = str(tmp_path / 'a.tar.gz')
+
+    download_with_resume(server.base_url + '/a.tar.gz', full_path)
+
+    with open(full_path, 'rb') as the_file:
+        assert the_file.read() == body
+    assert len(get_ranges(server, '/a.tar.gz')) == 2
+
+
+def test_416_on_complete_partial_file_finishes_without_body(server, tmp_path):
+    body = file_body(50_000)
+    server.files['/a.tar.gz'] = body
+    full_path = str(tmp_path / 'a.tar.gz')
+    with open(full_path + download_config['part_suffix'], 'wb') as part_file:
+        part_file.write(body)
+
+    download_with_resume(server.base_url + '/a.tar.gz', full_path)
+
+    with open(full_path, 'rb') as the_file:
+        assert the_file.read() == body
+    assert get_ranges(server, '/a.tar.gz') == [f"bytes={len(body)}-"]
+
+
+def test_changed_file_size_starts_over(server, tmp_path):
+    old_body = file_body(80_000, seed=1)
+    new_body = file_body(120_000, seed=2)
+    server.files['/a.tar.gz'] = new_body
+    full_path = str(tmp_path / 'a.tar.gz')
+    with open(full_path + download_config['part_suffix'], 'wb') as part_file:
+        part_file.write(old_body[:30_000])
+
+    download_with_resume(server.base_url + '/a.tar.gz', full_path, expected_size=len(old_body))
+
+    with open(full_path, 'rb') as the_file:
+        assert the_file.read() == new_body
+    assert get_ranges(server, '/a.tar.gz') == ["bytes=30000-", None]
+
+
+def test_checksum_mismatch_raises_and_leaves_nothing(server, tmp_path):
+    body = file_body(50_000)
+    server.files['/a.tar.gz'] = body
+    full_path = str(tmp_path / 'a.tar.gz')
+
+    with pytest.raises(IOError, match='checksum mismatch'):
+        download_with_resume(server.base_url + '/a.tar.gz', full_path, checksum='md5:' + '0' * 32)
+
+    assert not os.path.exists(full_path)
+    assert not os.path.exists(full_path + download_config['part_suffix'])
+
+    download_with_resume(server.base_url + '/a.tar.gz', full_path, checksum='md5:' + hashlib.md5(body).hexdigest())
+    assert os.path.getsize(full_path) == len(body)
+
+
+def test_gives_up_after_max_attempts(server, tmp_path):
+    server.files['/a.tar.gz'] = file_body(200_000)
+    server.behaviours['/a.tar.gz'] = {'drop_always': True, 'ignore_range': True}
+    configure_downloads(max_attempts=3)
+    full_path = str(tmp_path / 'a.tar.gz')
+
+    with pytest.raises(IOError, match='after 3 attempts'):
+        download_with_resume(server.base_url + '/a.tar.gz', full_path)
+
+    assert len(get_ranges(server, '/a.tar.gz')) == 3
+    assert not os.path.exists(full_path)
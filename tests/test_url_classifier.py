@@ -0,0 +1,49 @@
+"""
+Tests that classify_urls, the batch form of the url classifier, gives classify_url's answer for every url.
+"""
+import pytest
+from utilities.url_classifier import classify_url, classify_urls
+
+site = 'https://data.cosmic.ucar.edu/gnss-ro/'
+urls = [
+    site + 'cosmic2/nrt/level2/2021/001/atmPrf_nrt_2021_001.tar.gz',
+    site + 'spire/noaa/nrt/level1b/2022/100/conPhs_nrt_2022_100.tar.gz',
+    site + 'geoopt/noaa/nrt/level2/2020/001/',
+    site + 'cosmic2/postProc/level2/2014/',
+    site + 'metopa/',
+    'cosmic2/nrt/level2/2021/001/podTc2_nrt_2021_001.tar.gz',
+    'cosmic2/nrt/level2/2021/001/x_wetPf2_wetPrf.tar.gz',
+    'cosmic2/nrt/level2/20a1/',
+    'cosmic2/nrt/level2/2021/abc/',
+    'cosmic2/nrt/level2/2021/001/a/b',
+    'cosmic2/nrt//2021',
+    'spire',
+    '',
+]
+
+
+def as_row(ucar_path):
+    if ucar_path is None:
+        return None
+    return tuple('' if value is None else value for value in ucar_path)
+
+
+@pytest.mark.parametrize('batch', [urls, urls + [site + 'cosmic2/nrt/level2/2021/001/é.tar.gz']],
+                         ids=['ascii', 'not ascii'])
+def test_classify_urls_matches_classify_url(batch):
+    ucar_paths = classify_urls(batch)
+
+    assert len(ucar_paths) == len(batch)
+    for url, row in zip(batch, ucar_paths):
+        expected = as_row(classify_url(url))
+        assert bool(row['valid']) == (expected is not None), url
+        if expected is not None:
+            assert tuple(str(row[name]) for name in ucar_paths.dtype.names[:-1]) == expected, url
+
+
+def test_classify_urls_columns_select_rows():
+    ucar_paths = classify_urls(urls)
+
+    atmprf_rows = ucar_paths[ucar_paths['valid'] & (ucar_paths['filetype'] == 'atmPrf')]
+    assert atmprf_rows['filename'].tolist() == ['atmPrf_nrt_2021_001.tar.gz']
+    assert classify_urls([]).shape == (0,)
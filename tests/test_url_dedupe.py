@@ -0,0 +1,39 @@
+"""
+Tests of the url dedupe backends and their configuration.
+"""
+import os
+import pytest
+from utilities.url_dedupe import configure_url_dedupe, url_dedupe_config, open_url_dedupe
+
+site = 'https://data.cosmic.ucar.edu/gnss-ro/'
+
+
+@pytest.fixture
+def saved_config():
+    saved_config = dict(url_dedupe_config)
+    yield
+    url_dedupe_config.clear()
+    url_dedupe_config.update(saved_config)
+
+
+def test_bloom_dedupes_in_one_directory_are_independent(saved_config, tmp_path):
+    configure_url_dedupe(backend='bloom', directory=str(tmp_path), capacity=10_000, commit_every=1_000_000)
+    # the crawler, the manifest recorder and is_new_ucar_url each hold one during a crawl
+    dedupes = [open_url_dedupe([site + 'shared.tar.gz']) for _ in range(3)]
+
+    for i in range(100):
+        for dedupe in dedupes:
+            assert dedupe.add(f"{site}{i}.tar.gz")
+    assert all(not dedupe.add(site + 'shared.tar.gz') for dedupe in dedupes)
+    assert len(os.listdir(tmp_path)) == 3
+
+    for dedupe in dedupes:
+        dedupe.close()
+    assert os.listdir(tmp_path) == []
+
+
+def test_unknown_backend_already_configured_raises_value_error(saved_config):
+    url_dedupe_config['backend'] = 'unknown'
+
+    with pytest.raises(ValueError, match='unknown url dedupe backend unknown'):
+        configure_url_dedupe(capacity=10)
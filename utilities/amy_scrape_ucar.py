@@ -1,4 +1,5 @@
-import requests
+from .http_client import http_get
+from .listing_parser import parse_listing_hrefs
 ucar_url_base = "https://data.cosmic.ucar.edu/gnss-ro/"
 
 useful_subfolders=['postProc','repro2013','repro2016']
@@ -8,38 +9,48 @@ ucar_site_dict = {}
 
 def get_subfolders(url):
     list = []
-    r = requests.get(url)
-    curl_lines = r.text.split('\n')
-    for line in curl_lines:
-        if "href" in line and line.split('"')[1][:-1] != '..':
-            list.append(line.split('"')[1][:-1])
+    r = http_get(url)
+    for href in parse_listing_hrefs(r.text):
+        if href[:-1] != '..':
+            list.append(href[:-1])
     return list
 
-#get ucar missions
-missions = get_subfolders(ucar_url_base)
-for m in missions:
-    ucar_site_dict[m]={}
-    subfolder = get_subfolders(f'{ucar_url_base}/{m}')
-    for s in subfolder:
-        if s in useful_subfolders:
-            ucar_site_dict[m][s]={}
-            levels = get_subfolders(f'{ucar_url_base}/{m}/{s}')
-            for l in levels:
-                if l not in excluded_levels:
-                    ucar_site_dict[m][s][l]={}
-                    years = get_subfolders(f'{ucar_url_base}/{m}/{s}/{l}')
-                    #print(m,s,l,years)
-                    for y in years:
-
-                        days = get_subfolders(f'{ucar_url_base}/{m}/{s}/{l}/{y}')
-                        ucar_site_dict[m][s][l][y]=len(days)
-                        print(m,s,l,y,len(days))
-                else:
-                    #print(m,s,l)
-                    pass
-        else:
-            #print(m,s)
-            pass
-
-
-#print(ucar_site_dict)
+def scrape_ucar_site_dict(url_base=ucar_url_base):
+    """
+    Function crawls the ucar site down to the year directories and fills ucar_site_dict with the number of days of every
+    mission, proctype, level and year. Nothing is fetched until it is called.
+    :param url_base:
+    :return ucar_site_dict:
+    """
+    #get ucar missions
+    missions = get_subfolders(url_base)
+    for m in missions:
+        ucar_site_dict[m]={}
+        subfolder = get_subfolders(f'{url_base}/{m}')
+        for s in subfolder:
+            if s in useful_subfolders:
+                ucar_site_dict[m][s]={}
+                levels = get_subfolders(f'{url_base}/{m}/{s}')
+                for l in levels:
+                    if l not in excluded_levels:
+                        ucar_site_dict[m][s][l]={}
+                        years = get_subfolders(f'{url_base}/{m}/{s}/{l}')
+                        #print(m,s,l,years)
+                        for y in years:
+
+                            days = get_subfolders(f'{url_base}/{m}/{s}/{l}/{y}')
+                            ucar_site_dict[m][s][l][y]=len(days)
+                            print(m,s,l,y,len(days))
+                    else:
+                        #print(m,s,l)
+                        pass
+            else:
+                #print(m,s)
+                pass
+
+    return ucar_site_dict
+
+
+if __name__ == '__main__':
+    scrape_ucar_site_dict()
+    #print(ucar_site_dict)
@@ -0,0 +1,275 @@
+import logging
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+from .listing_cache import fetch_listing_hrefs, fetch_listing_entries
+from .listing_parser import ListingEntry
+from .binary_manifest import open_mission_manifest, list_manifest_paths
+from .crawl_state import get_crawl_state, seed_crawl_state
+from . import ucar_repo_status
+from .ucar_repo_status import ucar_urls
+from .url_classifier import crawl_listing_actions
+from .crawl_checkpoint import open_crawl_checkpoint
+from .url_dedupe import open_url_dedupe, format_dedupe_summary
+from .lazy_import import lazy_module
+
+# asyncio is a large part of importing the sync, it is imported by the first crawl instead
+asyncio = lazy_module('asyncio')
+
+
+LOGGER = logging.getLogger(__name__)
+
+default_max_workers = 32
+default_per_host_limit = 16
+
+
+def fetch_href_list(url):
+    """
+    Function fetches a ucar directory listing, through the local listing cache, and returns every href found on the page
+    (including the parent directory link at index 0, exactly as recursive_scrape sees it). Raises on an http error so
+    the crawler can record the failed listing.
+    :param url:
+    :return href_list:
+    """
+    return fetch_listing_hrefs(url, raise_for_status=True)
+
+
+def fetch_entry_list(url):
+    """
+    Function is fetch_href_list returning the listing's entries, i.e. each href with the modification time and size
+    listed next to it.
+    :param url:
+    :return entry_list:
+    """
+    return fetch_listing_entries(url, raise_for_status=True)
+
+
+def fetch_current_entry_list(url):
+    """
+    Function is fetch_entry_list revalidating any cached listing with the server instead of trusting its ttl, which
+    change detection needs: the listing cache takes past years of reprocessed proctypes as never changing.
+    :param url:
+    :return entry_list:
+    """
+    return fetch_listing_entries(url, raise_for_status=True, revalidate=True)
+
+
+class AsyncCrawler:
+    """
+    Breadth-first crawler for the ucar gnss-ro repo. Directory urls are pushed onto a frontier queue that is drained by
+    a bounded pool of asyncio workers. The blocking listing fetch runs in a thread pool so that many listings are in
+    flight at once, and a per-host semaphore caps how many of those hit the same server. The links followed and the
+    .tar.gz files kept are decided by the same checks used by recursive_scrape. With a CrawlCheckpoint (see
+    crawl_checkpoint) every listing is recorded as it completes, and a resumed checkpoint restarts the crawl from its
+    pending directories instead of the start urls. Found files are deduped with the configured url_dedupe backend.
+    With a ChangeDetector (see listing_metadata) unchanged doy directories are not listed and only new or changed files
+    are found. fetch may return plain hrefs or ListingEntry tuples; by default listings come through the listing cache,
+    revalidated every time when detecting changes.
+    """
+
+    def __init__(self, max_workers=default_max_workers, per_host_limit=default_per_host_limit,
+                 fetch=None, on_file=None, checkpoint=None, change_detector=None):
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit
+        if fetch is None:
+            fetch = fetch_current_entry_list if change_detector is not None else fetch_entry_list
+        self.fetch = fetch
+        self.on_file = on_file
+        self.checkpoint = checkpoint
+        self.change_detector = change_detector
+
+        self.found_urls = []
+        self.seen_files = None
+        self.visited_urls = set()
+        self.failed_urls = []
+        self.failed_files = []
+        self.listing_count = 0
+
+        self._host_semaphores = {}
+
+    def _host_semaphore(self, url):
+        host = urlsplit(url).netloc
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_semaphores[host]
+
+    def _enqueue(self, frontier, url):
+        if url not in self.visited_urls:
+            self.visited_urls.add(url)
+            frontier.put_nowait(url)
+
+    def _add_found(self, new_url):
+        if self.seen_files.add(new_url):
+            self.found_urls.append(new_url)
+            if self.on_file is not None:
+                # a file on_file cannot handle is logged on its own, the rest of its listing is still handled
+                try:
+                    self.on_file(new_url)
+                except Exception as e:
+                    LOGGER.error(f"on_file failed for {new_url}: {e}")
+                    self.failed_files.append(new_url)
+
+    def _handle_listing(self, frontier, url, href_list):
+        entries = [ListingEntry(entry, None, None) if isinstance(entry, str) else entry for entry in href_list[1:]]
+        file_urls, dir_urls = crawl_listing_actions(url, [entry.href for entry in entries])
+        if self.change_detector is not None:
+            file_urls = self.change_detector.changed_files(url, entries, file_urls)
+            dir_urls = self.change_detector.directories_to_crawl(url, entries, dir_urls)
+            self.change_detector.record_listing(url, entries)
+        if self.checkpoint is not None:
+            self.checkpoint.record_listing(url, dir_urls, file_urls)
+
+        for new_url in file_urls:
+            self._add_found(new_url)
+
+        for new_url in dir_urls:
+            self._enqueue(frontier, new_url)
+
+    async def _worker(self, frontier, executor):
+        loop = asyncio.get_running_loop()
+        while True:
+            url = await frontier.get()
+            try:
+                async with self._host_semaphore(url):
+                    href_list = await loop.run_in_executor(executor, self.fetch, url)
+                self.listing_count += 1
+                self._handle_listing(frontier, url, href_list)
+            except Exception as e:
+                LOGGER.error(f"listing failed for {url}: {e}")
+                self.failed_urls.append(url)
+                if self.checkpoint is not None:
+                    self.checkpoint.record_failure(url)
+            finally:
+                frontier.task_done()
+
+    async def crawl(self, start_urls):
+        """
+        Crawls every url in start_urls and returns the sorted list of .tar.gz urls found beneath them.
+        :param start_urls:
+        :return found_urls:
+        """
+        frontier = asyncio.Queue()
+        self.seen_files = open_url_dedupe(self.found_urls)
+        if self.checkpoint is not None and self.checkpoint.resumed:
+            # files found before the interruption are handed to on_file again, since its output may have been lost
+            for new_url in self.checkpoint.file_urls():
+                self._add_found(new_url)
+            self.visited_urls.update(self.checkpoint.directory_urls())
+            for url in self.checkpoint.pending_urls():
+                frontier.put_nowait(url)
+        else:
+            for url in start_urls:
+                self._enqueue(frontier, url)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            workers = [asyncio.ensure_future(self._worker(frontier, executor)) for _ in range(self.max_workers)]
+            await frontier.join()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        if self.checkpoint is not None:
+            self.checkpoint.finish()
+        if len(self.failed_urls) > 0:
+            LOGGER.warning(f"{len(self.failed_urls)} listings failed: {self.failed_urls}")
+        if len(self.failed_files) > 0:
+            LOGGER.warning(f"on_file failed for {len(self.failed_files)} files: {self.failed_files[:10]}")
+        format_dedupe_summary(self.seen_files)
+        self.seen_files.close()
+        if self.change_detector is not None:
+            LOGGER.info(self.change_detector.summary())
+
+        return sorted(self.found_urls)
+
+
+def crawl_urls(start_urls, max_workers=default_max_workers, per_host_limit=default_per_host_limit, on_file=None,
+               checkpoint=None, change_detector=None):
+    """
+    Function runs an AsyncCrawler over the input urls and returns the sorted list of .tar.gz urls found. This is the
+    concurrent replacement for calling recursive_scrape once per url.
+    :param start_urls:
+    :param max_workers:
+    :param per_host_limit:
+    :param on_file:
+    :param checkpoint:
+    :param change_detector:
+    :return found_urls:
+    """
+    crawler = AsyncCrawler(max_workers=max_workers, per_host_limit=per_host_limit, on_file=on_file,
+                           checkpoint=checkpoint, change_detector=change_detector)
+    return asyncio.run(crawler.crawl(start_urls))
+
+
+class ManifestRecorder:
+    """
+    Callback that records a found .tar.gz url the way recursive_scrape does: a url not seen before is appended to the
+    global ucar_urls list and to the mission's binary manifest (see binary_manifest). Manifest writes are buffered per
+    mission until close, when the crawl state (see crawl_state) is updated with the urls recorded. A url the manifest
+    cannot hold (a filename over filename_width bytes or a non-standard layout) is logged and kept in skipped_urls.
+    """
+
+    def __init__(self):
+        self.known_urls = open_url_dedupe(ucar_urls)
+        self.writers = {}
+        self.recorded_urls = []
+        self.skipped_urls = []
+
+    def __call__(self, new_url):
+        if self.known_urls.add(new_url):
+            LOGGER.info(new_url)
+            mission = new_url.split('/')[4]
+            if mission not in self.writers:
+                self.writers[mission] = open_mission_manifest(ucar_repo_status.ucar_manifests_loc, mission,
+                                                              site=ucar_repo_status.ucar_site)
+            try:
+                self.writers[mission].append(new_url)
+            except ValueError as e:
+                # the file is still transferred, only the manifest cannot hold it (see import_legacy_manifest)
+                LOGGER.warning(f"{new_url} left out of the {mission} manifest: {e}")
+                self.skipped_urls.append(new_url)
+            else:
+                self.recorded_urls.append(new_url)
+            ucar_urls.append(new_url)
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+        format_dedupe_summary(self.known_urls)
+        self.known_urls.close()
+
+        crawl_state = get_crawl_state()
+        if crawl_state.is_empty():
+            seed_crawl_state(list_manifest_paths(ucar_repo_status.ucar_manifests_loc))
+        # urls arrive in whatever order the concurrent listings finish; recorded sorted, the last url found is the one a
+        # serial walk of the listings would have ended on, which is what last_searched_info.json is built from
+        crawl_state.record_urls(sorted(self.recorded_urls), site=ucar_repo_status.ucar_site)
+        self.recorded_urls = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def crawl_to_manifests(start_urls, max_workers=default_max_workers, per_host_limit=default_per_host_limit,
+                       change_detector=None):
+    """
+    Function crawls the input urls concurrently and records each new .tar.gz url as it is found, appending it to the
+    global ucar_urls list and the mission manifest like recursive_scrape. The crawl is checkpointed (see
+    crawl_checkpoint), so if an earlier run of the same urls died part way this one resumes where it stopped. With a
+    ChangeDetector only new or changed files are found; the caller commits it once they have been handled. Returns the
+    urls found.
+    :param start_urls:
+    :param max_workers:
+    :param per_host_limit:
+    :param change_detector:
+    :return found_urls:
+    """
+    checkpoint = open_crawl_checkpoint(start_urls)
+    try:
+        with ManifestRecorder() as record_file:
+            return crawl_urls(start_urls, max_workers=max_workers, per_host_limit=per_host_limit, on_file=record_file,
+                              checkpoint=checkpoint, change_detector=change_detector)
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
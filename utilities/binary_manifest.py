@@ -0,0 +1,349 @@
+import os
+import json
+import logging
+from .lazy_import import lazy_module
+
+# numpy is imported the first time a manifest is read or written, not with the module
+np = lazy_module('numpy')
+
+
+LOGGER = logging.getLogger(__name__)
+
+ucar_site = os.environ.get('UCAR_SITE', "https://data.cosmic.ucar.edu/gnss-ro/")
+
+manifest_extension = '.manifest'
+manifest_version = 1
+filename_width = 48
+default_buffer_rows = 4096
+
+# dictionary encoded columns hold a code into the sidecar's list of values for that column
+dictionary_columns = ['mission', 'subdir', 'proctype', 'level', 'filetype']
+manifest_fields = [('mission', 'u1'), ('subdir', 'u1'), ('proctype', 'u1'), ('level', 'u1'),
+                   ('year', 'u2'), ('doy', 'u2'), ('filetype', 'u1'), ('filename', f'S{filename_width}')]
+manifest_columns = [name for name, _ in manifest_fields]
+
+
+def manifest_dtype():
+    """
+    Function returns the numpy dtype of a manifest row, built on first use since numpy is imported lazily.
+    :return dtype:
+    """
+    return np.dtype(manifest_fields)
+
+
+def sidecar_path(manifest_path):
+    return f"{manifest_path}.json"
+
+
+def binary_manifest_path(directory, mission):
+    """
+    Function returns the path of the binary manifest of a mission in the input directory.
+    :param directory:
+    :param mission:
+    :return manifest_path:
+    """
+    return os.path.join(directory, f"{mission}{manifest_extension}")
+
+
+def is_binary_manifest(manifest_path):
+    return manifest_path.endswith(manifest_extension)
+
+
+def list_manifest_paths(directory):
+    """
+    Function returns one manifest path per mission in the input directory, sorted by mission. A binary manifest is
+    preferred over a legacy <mission>.txt of the same mission; sidecar files are skipped.
+    :param directory:
+    :return manifest_paths:
+    """
+    manifest_paths = {}
+    for filename in sorted(os.listdir(directory)):
+        mission, extension = os.path.splitext(filename)
+        if extension == manifest_extension:
+            manifest_paths[mission] = os.path.join(directory, filename)
+        elif extension == '.txt' and mission not in manifest_paths:
+            manifest_paths[mission] = os.path.join(directory, filename)
+
+    return [manifest_paths[mission] for mission in sorted(manifest_paths.keys())]
+
+
+def split_manifest_url(url, site=ucar_site):
+    """
+    Function splits a ucar .tar.gz url into the column values of a manifest record. spire and geoopt urls carry an
+    extra directory (noaa) after the mission, kept in the subdir column. Raises ValueError for urls that do not follow
+    the <mission>/[subdir/]<proctype>/<level>/<year>/<doy>/<filename> layout, as they could not be rebuilt exactly.
+    :param url:
+    :param site:
+    :return record_values:
+    """
+    if not url.startswith(site):
+        raise ValueError(f"{url} is not under {site}")
+    url_contents = url[len(site):].split('/')
+
+    if len(url_contents) == 7:
+        mission, subdir, proctype, level, year, doy, filename = url_contents
+    elif len(url_contents) == 6:
+        mission, proctype, level, year, doy, filename = url_contents
+        subdir = ''
+    else:
+        raise ValueError(f"{url} does not follow the ucar directory layout")
+
+    if not (year.isdigit() and doy.isdigit() and len(year) == 4 and len(doy) == 3):
+        raise ValueError(f"{url} has no zero padded year/doy directories")
+    if len(filename.encode()) > filename_width:
+        raise ValueError(f"filename of {url} is longer than {filename_width} bytes")
+
+    return {'mission': mission, 'subdir': subdir, 'proctype': proctype, 'level': level, 'year': int(year),
+            'doy': int(doy), 'filetype': filename.split('_')[0], 'filename': filename}
+
+
+class ManifestWriter:
+    """
+    Buffered writer of a binary manifest. Records are packed into manifest_dtype rows and appended to the .manifest file
+    buffer_rows at a time; the dictionaries of the encoded columns and the committed row count live in a json sidecar
+    that is replaced atomically after every flush, so a reader never sees a half written row. Opening an existing
+    manifest appends to it.
+    """
+
+    def __init__(self, manifest_path, site=ucar_site, buffer_rows=default_buffer_rows):
+        self.manifest_path = manifest_path
+        self.buffer_rows = buffer_rows
+        self._buffer = []
+
+        if os.path.exists(sidecar_path(manifest_path)):
+            sidecar = read_sidecar(manifest_path)
+            self.site = sidecar['site']
+            self.rows = sidecar['rows']
+            self.dictionaries = sidecar['dictionaries']
+        else:
+            self.site = site
+            self.rows = 0
+            self.dictionaries = {column: [] for column in dictionary_columns}
+        self._codes = {column: {value: code for code, value in enumerate(values)}
+                       for column, values in self.dictionaries.items()}
+
+        # drop rows past the committed count, left by a run that stopped between writing rows and the sidecar
+        with open(self.manifest_path, 'ab') as manifest_file:
+            manifest_file.truncate(self.rows * manifest_dtype().itemsize)
+
+    def _code(self, column, value):
+        codes = self._codes[column]
+        if value not in codes:
+            if len(codes) > np.iinfo(manifest_dtype()[column]).max:
+                raise ValueError(f"too many distinct {column} values for the manifest")
+            codes[value] = len(codes)
+            self.dictionaries[column].append(value)
+        return codes[value]
+
+    def append(self, url):
+        record_values = split_manifest_url(url, self.site)
+        self._buffer.append(tuple(self._code(column, record_values[column]) if column in self._codes
+                                  else record_values[column] for column in manifest_columns))
+        if len(self._buffer) >= self.buffer_rows:
+            self.flush()
+
+    def extend(self, urls):
+        for url in urls:
+            self.append(url)
+
+    def flush(self):
+        if len(self._buffer) == 0:
+            return
+        records = np.array(self._buffer, dtype=manifest_dtype())
+        with open(self.manifest_path, 'ab') as manifest_file:
+            records.tofile(manifest_file)
+        self.rows += len(records)
+        self._buffer = []
+
+        sidecar = {'version': manifest_version, 'site': self.site, 'rows': self.rows,
+                   'dictionaries': self.dictionaries}
+        tmp_path = f"{sidecar_path(self.manifest_path)}.tmp"
+        with open(tmp_path, 'w') as sidecar_file:
+            json.dump(sidecar, sidecar_file)
+        os.replace(tmp_path, sidecar_path(self.manifest_path))
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_sidecar(manifest_path):
+    with open(sidecar_path(manifest_path), 'r') as sidecar_file:
+        sidecar = json.load(sidecar_file)
+    if sidecar['version'] != manifest_version:
+        raise ValueError(f"unsupported manifest version {sidecar['version']} in {manifest_path}")
+    return sidecar
+
+
+class ManifestReader:
+    """
+    Read access to a binary manifest. The rows are memory mapped, so opening a manifest costs nothing whatever its size
+    and select only touches the columns it filters on. Predicates on dictionary encoded columns are resolved against
+    the dictionary first: a value that never occurs returns no rows without scanning.
+    """
+
+    def __init__(self, manifest_path):
+        self.manifest_path = manifest_path
+        sidecar = read_sidecar(manifest_path)
+        self.site = sidecar['site']
+        self.rows = sidecar['rows']
+        self.dictionaries = sidecar['dictionaries']
+
+        if self.rows > 0:
+            self.records = np.memmap(manifest_path, dtype=manifest_dtype(), mode='r', shape=(self.rows,))
+        else:
+            self.records = np.zeros(0, dtype=manifest_dtype())
+
+    def __len__(self):
+        return self.rows
+
+    def select(self, mission=None, proctype=None, level=None, filetype=None, year=None, doy=None, date_range=None):
+        """
+        Returns the row indices matching every given predicate. mission, proctype, level and filetype take a value or a
+        list of values; year and doy a number or an inclusive (first, last) tuple; date_range an inclusive
+        ((year, doy), (year, doy)) tuple.
+        """
+        mask = np.ones(self.rows, dtype=bool)
+
+        for column, values in [('mission', mission), ('proctype', proctype), ('level', level),
+                               ('filetype', filetype)]:
+            if values is None:
+                continue
+            if isinstance(values, str):
+                values = [values]
+            codes = [self.dictionaries[column].index(value) for value in values if value in self.dictionaries[column]]
+            if len(codes) == 0:
+                return np.zeros(0, dtype=np.int64)
+            mask &= np.isin(self.records[column], codes)
+
+        for column, values in [('year', year), ('doy', doy)]:
+            if values is None:
+                continue
+            if isinstance(values, tuple):
+                mask &= (self.records[column] >= int(values[0])) & (self.records[column] <= int(values[1]))
+            else:
+                mask &= self.records[column] == int(values)
+
+        if date_range is not None:
+            year_doy = self.records['year'].astype(np.uint32) * 1000 + self.records['doy']
+            (first_year, first_doy), (last_year, last_doy) = date_range
+            mask &= (year_doy >= int(first_year) * 1000 + int(first_doy)) & \
+                    (year_doy <= int(last_year) * 1000 + int(last_doy))
+
+        return np.flatnonzero(mask)
+
+    def column(self, name, indices=None):
+        """
+        Returns the decoded values of a column for the input row indices, or for every row.
+        """
+        values = self.records[name] if indices is None else self.records[name][indices]
+        if name in self.dictionaries:
+            return [self.dictionaries[name][code] for code in values]
+        if name == 'filename':
+            return [filename.decode() for filename in values]
+        return values.tolist()
+
+    def unique(self, name, indices=None):
+        """
+        Returns the distinct values of a dictionary encoded column in the order they first occur.
+        """
+        values = self.records[name] if indices is None else self.records[name][indices]
+        codes, first_rows = np.unique(values, return_index=True)
+        return [self.dictionaries[name][code] for code in codes[np.argsort(first_rows)]]
+
+    def urls(self, indices=None):
+        """
+        Returns the urls of the input row indices, or of every row, in manifest order.
+        """
+        records = self.records if indices is None else self.records[indices]
+        if len(records) == 0:
+            return []
+
+        # the directory up to the level is shared by many rows, build each distinct one once
+        directory_keys = (records['mission'].astype(np.uint32) << 24 | records['subdir'].astype(np.uint32) << 16 |
+                          records['proctype'].astype(np.uint32) << 8 | records['level'])
+        directories = {}
+        for directory_key in np.unique(directory_keys).tolist():
+            mission, subdir, proctype, level = [self.dictionaries[column][directory_key >> shift & 0xff] for
+                                                column, shift in [('mission', 24), ('subdir', 16), ('proctype', 8),
+                                                                  ('level', 0)]]
+            directories[directory_key] = os.path.join(self.site, mission, subdir, proctype, level, '')
+
+        filenames = records['filename'].astype(str).tolist()
+        return [f"{directories[directory_key]}{year}/{doy:03d}/{filename}" for directory_key, year, doy, filename in
+                zip(directory_keys.tolist(), records['year'].tolist(), records['doy'].tolist(), filenames)]
+
+    def last_url(self):
+        if self.rows == 0:
+            return None
+        return self.urls([self.rows - 1])[0]
+
+
+def read_legacy_manifest_urls(txt_path):
+    """
+    Function returns the urls of a legacy comma terminated <mission>.txt manifest.
+    :param txt_path:
+    :return urls:
+    """
+    with open(txt_path, 'r') as manifest_doc:
+        return [url.strip() for url in manifest_doc.read().split(',') if url.strip() != '']
+
+
+def read_manifest_urls(manifest_path):
+    """
+    Function returns the urls of a binary or legacy .txt manifest, in manifest order.
+    :param manifest_path:
+    :return urls:
+    """
+    if is_binary_manifest(manifest_path):
+        return ManifestReader(manifest_path).urls()
+    return read_legacy_manifest_urls(manifest_path)
+
+
+def import_legacy_manifest(txt_path, manifest_path=None, site=ucar_site):
+    """
+    Function converts a legacy <mission>.txt manifest into a binary manifest next to it (or at manifest_path) and
+    returns the binary manifest path. Urls that do not fit the binary layout are logged and left out.
+    :param txt_path:
+    :param manifest_path:
+    :param site:
+    :return manifest_path:
+    """
+    manifest_path = manifest_path or f"{os.path.splitext(txt_path)[0]}{manifest_extension}"
+
+    skipped_urls = []
+    with ManifestWriter(manifest_path, site=site) as writer:
+        for url in read_legacy_manifest_urls(txt_path):
+            try:
+                writer.append(url)
+            except ValueError:
+                skipped_urls.append(url)
+
+    if len(skipped_urls) > 0:
+        LOGGER.warning(f"{len(skipped_urls)} urls of {txt_path} do not fit the binary manifest: {skipped_urls[:10]}")
+    LOGGER.info(f"imported {txt_path} into {manifest_path}")
+
+    return manifest_path
+
+
+def open_mission_manifest(directory, mission, site=ucar_site, buffer_rows=default_buffer_rows):
+    """
+    Function returns a ManifestWriter appending to the binary manifest of a mission, importing the mission's legacy
+    .txt manifest first if there is one and no binary manifest yet.
+    :param directory:
+    :param mission:
+    :param site:
+    :param buffer_rows:
+    :return writer:
+    """
+    manifest_path = binary_manifest_path(directory, mission)
+    txt_path = os.path.join(directory, f"{mission}.txt")
+    if not os.path.exists(sidecar_path(manifest_path)) and os.path.exists(txt_path):
+        import_legacy_manifest(txt_path, manifest_path, site=site)
+
+    return ManifestWriter(manifest_path, site=site, buffer_rows=buffer_rows)
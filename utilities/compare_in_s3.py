@@ -1,48 +1,39 @@
 import os
 import logging
-from .ucar_repo_status import check_if_correct_level, check_if_correct_filetype
+from .ucar_repo_status import check_if_correct_filetype
+from .key_index import load_key_index
+from .binary_manifest import is_binary_manifest, read_manifest_urls
+from .instrumentation import timed
+from .key_normalizer import default_output_path
 
 
 LOGGER = logging.getLogger(__name__)
 
-local_s3_obj_key_file = "/home/i28373/zero_pad_ucar_objKey.txt"
-ucar_site = "https://data.cosmic.ucar.edu/gnss-ro/"
+# the zero padded obj key file add_zero_pad_doy_to_key_file writes
+local_s3_obj_key_file = default_output_path
+ucar_site = os.environ.get('UCAR_SITE', "https://data.cosmic.ucar.edu/gnss-ro/")
 
 
-def compare_against_obj_key_file(to_download_list):
+def compare_against_obj_key_file(to_download_list, obj_key_file_path=None):
     """
     Function uses an input list of urls (ending in .tar.gz) to compare against a list of s3 obj_file_keys to find what is
-    not in the list of s3 keys and returns a list of those entries
+    not in the list of s3 keys and returns a list of those entries. The obj key file is loaded once into an S3KeyIndex
+    so each url costs a single hash lookup.
     :param to_download_list:
+    :param obj_key_file_path:
     :return c:
     """
-    with open(local_s3_obj_key_file, 'r') as the_s3_obj_file:
-        obj_file_content = the_s3_obj_file.read().split('\n')
-
-    #with open(filepath, 'r') as the_ucar_inventory_file:
-    #    the_ucar_inventory = the_ucar_inventory_file.read().split(',')
+    key_index = load_key_index(obj_key_file_path or local_s3_obj_key_file)
 
     the_ucar_keys = []
     for the_item in to_download_list:
         if len(the_item.split(ucar_site)) == 2:
             the_ucar_keys.append(the_item.split(ucar_site)[1])
 
-    the_obj_file_keys = []
-    for the_item in obj_file_content:
-        #obj_doy_key = os.path.join(os.path.split(the_item)[0], '')
-        #print(the_item, '--->', obj_doy_key)
-        #if mission in the_item:
-        if check_if_correct_level(the_item):
-            if check_if_correct_filetype(the_item):
-                if the_item not in the_obj_file_keys:
-                    the_obj_file_keys.append(the_item)
-
-    a = set(the_ucar_keys)
-    b = set(the_obj_file_keys)
-    c = a.difference(b)
-    #with open('diff.txt', 'a') as diff_txt:
-    #    diff_txt.write(f"{mission}---------------------------------------\n")
-    #    diff_txt.write(f"{c}, \n")
+    # an s3 key only counts as present if it is also a valid filetype
+    with timed('obj_key_compare'):
+        c = set([the_key for the_key in the_ucar_keys
+                 if the_key not in key_index or not check_if_correct_filetype(the_key)])
 
     LOGGER.info("SET DIFFERENCES ----------------------------------------")
     LOGGER.info(c)
@@ -50,24 +41,23 @@ def compare_against_obj_key_file(to_download_list):
     return list(c)
 
 
-def get_obj_key_file_list(mission):
-
-    #bucket_url = 's3://ucar-earth-ro-archive/'
-    with open(local_s3_obj_key_file, 'r') as the_s3_obj_file:
-        obj_file_content = the_s3_obj_file.read().split('\n')
-
-    the_obj_file_keys = []
-    for the_item in obj_file_content:
-        if check_if_correct_level(the_item):
-            if the_item not in the_obj_file_keys and mission in the_item:
-                #the_obj_file_keys.append(os.path.join(bucket_url, the_item))
-                the_obj_file_keys.append(the_item)
+def get_obj_key_file_list(mission, obj_key_file_path=None):
+    """
+    Function returns the s3 obj keys under the input mission, in obj key file order.
+    :param mission:
+    :param obj_key_file_path:
+    :return the_obj_file_keys:
+    """
+    key_index = load_key_index(obj_key_file_path or local_s3_obj_key_file)
 
-    return the_obj_file_keys
+    return key_index.keys(mission=mission)
 
 
 def get_ucar_file_url_list(filepath):
 
+    if is_binary_manifest(filepath):
+        return read_manifest_urls(filepath)
+
     with open(filepath, 'r') as the_ucar_inventory_file:
         #the_ucar_inventory = the_ucar_inventory_file.read().split(',')
         the_ucar_inventory = the_ucar_inventory_file.read().split(',')[:-1]
@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import logging
+import threading
+from .lazy_import import lazy_module
+
+hashlib = lazy_module('hashlib')
+sqlite3 = lazy_module('sqlite3')
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Settings for crawl checkpoints; change with configure_crawl_checkpoint
+crawl_checkpoint_config = {
+    'enabled': True,
+    'path': os.environ.get('UCAR_CRAWL_CHECKPOINT', 'crawl_checkpoint.sqlite'),
+    'commit_every': 50,             # listings per transaction, a crash re-lists at most this many directories
+    'max_age': 24 * 60 * 60,        # seconds after which an unfinished crawl is started over instead of resumed
+}
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def crawl_id(start_urls):
+    """
+    Function returns the id of a crawl: a hash of its sorted, de-duplicated start urls, so re-running the same crawl
+    finds its checkpoint.
+    :param start_urls:
+    :return crawl_id:
+    """
+    return hashlib.sha1('\n'.join(sorted(set(start_urls))).encode()).hexdigest()
+
+
+class CrawlCheckpoint:
+    """
+    SQLite checkpoint of one crawl: every directory the crawl has queued with its status (pending, done or failed) and
+    every .tar.gz url found. A listing's children and files are written in the same transaction that marks it done,
+    so after a crash each directory is either done with all of its children recorded or still pending, and resuming
+    only lists the pending and failed ones. Writes are committed every commit_every listings.
+    """
+
+    def __init__(self, path, start_urls, commit_every=None, max_age=None):
+        self.path = os.path.expanduser(path)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.crawl_id = crawl_id(start_urls)
+        self.start_urls = list(dict.fromkeys(start_urls))
+        self.commit_every = commit_every or crawl_checkpoint_config['commit_every']
+        self.max_age = max_age or crawl_checkpoint_config['max_age']
+        self._uncommitted = 0
+        self._lock = threading.Lock()
+
+        # the crawler writes from its event loop thread, the lock keeps any other caller out of the open transaction
+        self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS crawls (crawl_id TEXT PRIMARY KEY, start_urls TEXT NOT NULL, "
+                                "started_at REAL NOT NULL, finished_at REAL)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS directories (crawl_id TEXT NOT NULL, url TEXT NOT NULL, "
+                                "status TEXT NOT NULL, PRIMARY KEY (crawl_id, url))")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS files (crawl_id TEXT NOT NULL, url TEXT NOT NULL, "
+                                "PRIMARY KEY (crawl_id, url))")
+        self.connection.commit()
+
+        self.resumed = self._begin()
+
+    def _begin(self):
+        """
+        Resumes an unfinished crawl younger than max_age, or starts over. Failed directories are queued again on
+        resume. Returns whether the crawl was resumed.
+        """
+        with self._lock, self.connection:
+            row = self.connection.execute("SELECT started_at, finished_at FROM crawls WHERE crawl_id = ?",
+                                          (self.crawl_id,)).fetchone()
+            if row is not None and row[1] is None and time.time() - row[0] < self.max_age:
+                self.connection.execute("UPDATE directories SET status = ? WHERE crawl_id = ? AND status = ?",
+                                        (PENDING, self.crawl_id, FAILED))
+                return True
+
+            self.connection.execute("DELETE FROM directories WHERE crawl_id = ?", (self.crawl_id,))
+            self.connection.execute("DELETE FROM files WHERE crawl_id = ?", (self.crawl_id,))
+            self.connection.execute("INSERT OR REPLACE INTO crawls (crawl_id, start_urls, started_at, finished_at) "
+                                    "VALUES (?, ?, ?, NULL)", (self.crawl_id, json.dumps(self.start_urls), time.time()))
+            self.connection.executemany("INSERT OR IGNORE INTO directories (crawl_id, url, status) VALUES (?, ?, ?)",
+                                        [(self.crawl_id, url, PENDING) for url in self.start_urls])
+            return False
+
+    def _select_urls(self, query, parameters):
+        with self._lock:
+            return [row[0] for row in self.connection.execute(query, parameters).fetchall()]
+
+    def directory_urls(self):
+        """
+        Returns every directory url the crawl has queued, whatever its status.
+        """
+        return self._select_urls("SELECT url FROM directories WHERE crawl_id = ?", (self.crawl_id,))
+
+    def pending_urls(self):
+        return self._select_urls("SELECT url FROM directories WHERE crawl_id = ? AND status = ? ORDER BY rowid",
+                                 (self.crawl_id, PENDING))
+
+    def file_urls(self):
+        return self._select_urls("SELECT url FROM files WHERE crawl_id = ? ORDER BY rowid", (self.crawl_id,))
+
+    def counts(self):
+        with self._lock:
+            status_counts = dict(self.connection.execute(
+                "SELECT status, COUNT(*) FROM directories WHERE crawl_id = ? GROUP BY status",
+                (self.crawl_id,)).fetchall())
+            status_counts['files'] = self.connection.execute("SELECT COUNT(*) FROM files WHERE crawl_id = ?",
+                                                             (self.crawl_id,)).fetchone()[0]
+        return status_counts
+
+    def record_listing(self, url, dir_urls, file_urls):
+        """
+        Marks the directory url done and records the directories and files found on its listing.
+        """
+        with self._lock:
+            self.connection.executemany("INSERT OR IGNORE INTO directories (crawl_id, url, status) VALUES (?, ?, ?)",
+                                        [(self.crawl_id, dir_url, PENDING) for dir_url in dir_urls])
+            self.connection.executemany("INSERT OR IGNORE INTO files (crawl_id, url) VALUES (?, ?)",
+                                        [(self.crawl_id, file_url) for file_url in file_urls])
+            self.connection.execute("UPDATE directories SET status = ? WHERE crawl_id = ? AND url = ?",
+                                    (DONE, self.crawl_id, url))
+            self._count_write()
+
+    def record_failure(self, url):
+        with self._lock:
+            self.connection.execute("UPDATE directories SET status = ? WHERE crawl_id = ? AND url = ?",
+                                    (FAILED, self.crawl_id, url))
+            self._count_write()
+
+    def _count_write(self):
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every:
+            self.connection.commit()
+            self._uncommitted = 0
+
+    def commit(self):
+        with self._lock:
+            self.connection.commit()
+            self._uncommitted = 0
+
+    def finish(self):
+        """
+        Commits, and marks the crawl finished if no directory is left pending or failed, so the next run of the same
+        crawl starts over. A crawl with failed listings stays open and a re-run retries only those.
+        """
+        with self._lock, self.connection:
+            self._uncommitted = 0
+            open_count = self.connection.execute("SELECT COUNT(*) FROM directories WHERE crawl_id = ? AND status != ?",
+                                                 (self.crawl_id, DONE)).fetchone()[0]
+            if open_count == 0:
+                self.connection.execute("UPDATE crawls SET finished_at = ? WHERE crawl_id = ?",
+                                        (time.time(), self.crawl_id))
+        if open_count > 0:
+            LOGGER.warning(f"crawl {self.crawl_id[:12]} left {open_count} directories to retry, re-run to resume it")
+
+        return open_count == 0
+
+    def close(self):
+        self.commit()
+        self.connection.close()
+
+
+def configure_crawl_checkpoint(**config):
+    """
+    Function updates crawl_checkpoint_config with the input keyword arguments (enabled, path, commit_every, max_age).
+    :param config:
+    :return crawl_checkpoint_config:
+    """
+    unknown_keys = set(config.keys()).difference(set(crawl_checkpoint_config.keys()))
+    if len(unknown_keys) > 0:
+        raise ValueError(f"unknown crawl checkpoint settings: {sorted(unknown_keys)}")
+
+    crawl_checkpoint_config.update(config)
+
+    return crawl_checkpoint_config
+
+
+def open_crawl_checkpoint(start_urls):
+    """
+    Function opens the checkpoint of the crawl of the input urls at the configured path, resuming it if an earlier run
+    did not finish, or returns None if checkpoints are disabled.
+    :param start_urls:
+    :return checkpoint:
+    """
+    if not crawl_checkpoint_config['enabled']:
+        return None
+
+    checkpoint = CrawlCheckpoint(crawl_checkpoint_config['path'], start_urls)
+    if checkpoint.resumed:
+        LOGGER.info(f"resuming crawl {checkpoint.crawl_id[:12]} from its checkpoint: {checkpoint.counts()}")
+
+    return checkpoint
@@ -0,0 +1,256 @@
+import os
+import json
+import logging
+import threading
+from . import ucar_repo_status
+from .lazy_import import lazy_module
+from .url_classifier import classify_url
+from .binary_manifest import ManifestReader, is_binary_manifest, read_legacy_manifest_urls
+
+np = lazy_module('numpy')
+sqlite3 = lazy_module('sqlite3')
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Settings for the crawl state store; change with configure_crawl_state
+crawl_state_config = {
+    'path': os.environ.get('UCAR_CRAWL_STATE', 'crawl_state.sqlite'),
+}
+
+_state = None
+_state_lock = threading.Lock()
+
+
+def url_state_fields(url, site=None):
+    """
+    Function returns the (mission, proctype, level, year, doy) of a ucar .tar.gz url, or None if the url does not reach
+    the doy directory.
+    :param url:
+    :param site:
+    :return fields:
+    """
+    ucar_path = classify_url(url.replace(site or ucar_repo_status.ucar_site, ''))
+    if ucar_path is None or ucar_path.doy is None:
+        return None
+
+    return ucar_path.mission, ucar_path.proctype, ucar_path.level, ucar_path.year, ucar_path.doy
+
+
+def year_doy_number(year, doy):
+    return int(year) * 1000 + int(doy)
+
+
+class CrawlStateStore:
+    """
+    SQLite store of what the crawl has found so far, updated as urls are recorded: per mission the last url found and
+    the proctypes in the order they were first seen, and per mission, proctype and level the high-water mark, i.e. the
+    latest year/doy found. Building last_searched_info from it reads one row per mission, whatever the size of the
+    manifests.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._local = threading.local()
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS last_found (mission TEXT PRIMARY KEY, url TEXT NOT NULL, "
+                           "proctype TEXT NOT NULL, year TEXT NOT NULL, doy TEXT NOT NULL)")
+        # a state written when the marks were kept per mission and level is emptied, to be seeded from the manifests
+        mission_level_marks = self._has_mission_level_marks(connection)
+        if mission_level_marks:
+            LOGGER.info(f"clearing {self.path}: high-water marks are now kept per proctype")
+            connection.execute("DROP TABLE high_water")
+        connection.execute("CREATE TABLE IF NOT EXISTS high_water (mission TEXT NOT NULL, proctype TEXT NOT NULL, "
+                           "level TEXT NOT NULL, year TEXT NOT NULL, doy TEXT NOT NULL, year_doy INTEGER NOT NULL, "
+                           "url TEXT NOT NULL, PRIMARY KEY (mission, proctype, level))")
+        # rowid keeps the order proctypes were first seen in
+        connection.execute("CREATE TABLE IF NOT EXISTS proctypes (mission TEXT NOT NULL, proctype TEXT NOT NULL, "
+                           "UNIQUE (mission, proctype))")
+        connection.commit()
+        if mission_level_marks:
+            self.clear()
+
+    @staticmethod
+    def _has_mission_level_marks(connection):
+        primary_key = [row[1] for row in connection.execute("PRAGMA table_info(high_water)").fetchall() if row[5] > 0]
+        return len(primary_key) > 0 and 'proctype' not in primary_key
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            self._local.connection = connection
+        return connection
+
+    def is_empty(self):
+        return self._connection().execute("SELECT COUNT(*) FROM last_found").fetchone()[0] == 0
+
+    def record_urls(self, urls, site=None):
+        """
+        Updates the state with the input urls, in the order they were found, in one transaction. The urls are folded
+        per mission, proctype and level in memory first, so the database sees one write per mark per call.
+        """
+        last_found = {}
+        high_water = {}
+        proctypes = {}
+        for url in urls:
+            fields = url_state_fields(url, site)
+            if fields is None:
+                continue
+            mission, proctype, level, year, doy = fields
+            last_found[mission] = (mission, url, proctype, year, doy)
+            proctypes.setdefault((mission, proctype), None)
+            year_doy = year_doy_number(year, doy)
+            mark_key = (mission, proctype, level)
+            if mark_key not in high_water or year_doy > high_water[mark_key][5]:
+                high_water[mark_key] = (mission, proctype, level, year, doy, year_doy, url)
+
+        self._write(last_found.values(), high_water.values(), proctypes.keys())
+
+    def _write(self, last_found_rows, high_water_rows, proctype_rows):
+        connection = self._connection()
+        with connection:
+            connection.executemany("INSERT OR REPLACE INTO last_found (mission, url, proctype, year, doy) "
+                                   "VALUES (?, ?, ?, ?, ?)", list(last_found_rows))
+            connection.executemany("INSERT INTO high_water (mission, proctype, level, year, doy, year_doy, url) "
+                                   "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (mission, proctype, level) DO UPDATE SET "
+                                   "year = excluded.year, doy = excluded.doy, year_doy = excluded.year_doy, "
+                                   "url = excluded.url WHERE excluded.year_doy > high_water.year_doy",
+                                   list(high_water_rows))
+            connection.executemany("INSERT OR IGNORE INTO proctypes (mission, proctype) VALUES (?, ?)",
+                                   list(proctype_rows))
+
+    def record_manifest(self, manifest_path):
+        """
+        Updates the state with every url of a binary or legacy .txt manifest. A binary manifest is folded from its
+        columns without building the urls of every row.
+        """
+        if not is_binary_manifest(manifest_path):
+            self.record_urls(read_legacy_manifest_urls(manifest_path))
+            return
+
+        reader = ManifestReader(manifest_path)
+        if len(reader) == 0:
+            return
+        records = reader.records
+        year_doy = records['year'].astype(np.uint32) * 1000 + records['doy']
+
+        last_row = len(reader) - 1
+        mission, proctype = reader.column('mission', [last_row])[0], reader.column('proctype', [last_row])[0]
+        last_found_rows = [(mission, reader.last_url(), proctype, str(records['year'][last_row]),
+                            str(records['doy'][last_row]).zfill(3))]
+
+        high_water_rows = []
+        # one mark per proctype and level code pair, both codes fit in a byte
+        mark_codes = records['proctype'].astype(np.uint16) * 256 + records['level']
+        for mark_code in np.unique(mark_codes).tolist():
+            mark_rows = np.flatnonzero(mark_codes == mark_code)
+            row = int(mark_rows[np.argmax(year_doy[mark_rows])])
+            high_water_rows.append((reader.column('mission', [row])[0], reader.dictionaries['proctype'][mark_code >> 8],
+                                    reader.dictionaries['level'][mark_code & 255], str(records['year'][row]),
+                                    str(records['doy'][row]).zfill(3), int(year_doy[row]), reader.urls([row])[0]))
+
+        proctype_rows = [(mission, manifest_proctype) for manifest_proctype in reader.unique('proctype')]
+        self._write(last_found_rows, high_water_rows, proctype_rows)
+
+    def mission_proctypes(self, mission):
+        return [row[0] for row in self._connection().execute(
+            "SELECT proctype FROM proctypes WHERE mission = ? ORDER BY rowid", (mission,)).fetchall()]
+
+    def high_water_marks(self, mission=None):
+        """
+        Returns {(mission, proctype, level): {'year', 'doy', 'url'}} for every mission, or for the input mission.
+        """
+        query = "SELECT mission, proctype, level, year, doy, url FROM high_water"
+        rows = self._connection().execute(query + " WHERE mission = ?", (mission,)).fetchall() \
+            if mission is not None else self._connection().execute(query).fetchall()
+
+        return {(row[0], row[1], row[2]): {'year': row[3], 'doy': row[4], 'url': row[5]} for row in rows}
+
+    def last_searched_info(self):
+        """
+        Returns the last_searched_info dictionary of create_last_searched_json: per mission the proctype, year and doy
+        of the last url found and the mission's proctypes.
+        """
+        last_searched_dict = {}
+        for mission, proctype, year, doy in self._connection().execute(
+                "SELECT mission, proctype, year, doy FROM last_found ORDER BY mission").fetchall():
+            last_searched_dict[mission] = {
+                "last_searched_proctype": proctype,
+                "last_searched_yr": year,
+                "last_searched_doy": doy,
+                "mission_proctypes": self.mission_proctypes(mission)
+            }
+
+        return last_searched_dict
+
+    def clear(self):
+        connection = self._connection()
+        with connection:
+            connection.execute("DELETE FROM last_found")
+            connection.execute("DELETE FROM high_water")
+            connection.execute("DELETE FROM proctypes")
+
+
+def configure_crawl_state(**config):
+    """
+    Function updates crawl_state_config with the input keyword arguments (path). The store is reopened on next use.
+    :param config:
+    :return crawl_state_config:
+    """
+    global _state
+
+    unknown_keys = set(config.keys()).difference(set(crawl_state_config.keys()))
+    if len(unknown_keys) > 0:
+        raise ValueError(f"unknown crawl state settings: {sorted(unknown_keys)}")
+
+    with _state_lock:
+        crawl_state_config.update(config)
+        _state = None
+
+    return crawl_state_config
+
+
+def get_crawl_state():
+    """
+    Function returns the shared CrawlStateStore, opening it on first use.
+    :return state:
+    """
+    global _state
+
+    if _state is None:
+        with _state_lock:
+            if _state is None:
+                _state = CrawlStateStore(crawl_state_config['path'])
+
+    return _state
+
+
+def seed_crawl_state(manifest_file_path_list):
+    """
+    Function fills an empty crawl state from existing manifests, once; later runs keep it current as urls are recorded.
+    :param manifest_file_path_list:
+    :return state:
+    """
+    state = get_crawl_state()
+    if state.is_empty():
+        LOGGER.info(f"seeding crawl state from {len(manifest_file_path_list)} manifests")
+        for manifest_file_path in manifest_file_path_list:
+            state.record_manifest(manifest_file_path)
+
+    return state
+
+
+def write_last_searched_json(path="last_searched_info.json"):
+    """
+    Function writes last_searched_info.json from the crawl state and returns its path.
+    :param path:
+    :return path_to_file:
+    """
+    with open(path, 'w+') as json_file:
+        json.dump(get_crawl_state().last_searched_info(), json_file)
+
+    return path
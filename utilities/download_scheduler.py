@@ -0,0 +1,214 @@
+import os
+import heapq
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from .listing_cache import listing_cache_config, get_listing_cache
+from .resumable_download import remote_file_size
+from .lazy_import import lazy_module
+
+statistics = lazy_module('statistics')
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Settings for the order downloads are handed to workers in; change with configure_download_scheduler. The transfer
+# workers pull from one shared queue, so the order is the whole schedule: largest_first is the LPT rule, which keeps a
+# large tarball from starting last and holding up the end of the backlog, shortest_first gets the most files done
+# soonest. per_file_seconds and bytes_per_second only model a transfer's cost for the makespan prediction.
+download_scheduler_config = {
+    'policy': os.environ.get('UCAR_DOWNLOAD_ORDER', 'fifo'),
+    'head_unknown': True,           # HEAD files whose size no listing showed, unless the policy is fifo
+    'head_workers': 8,
+    'per_file_seconds': 0.5,
+    'bytes_per_second': 20e6,
+}
+
+
+def fifo_order(urls, sizes):
+    return list(urls)
+
+
+def shortest_first_order(urls, sizes):
+    return sorted(urls, key=lambda url: sizes[url])
+
+
+def largest_first_order(urls, sizes):
+    return sorted(urls, key=lambda url: sizes[url], reverse=True)
+
+
+# Policies take the urls in discovery order and {url: size} with a size for every url, and return the urls in the
+# order they are to be transferred; add one with register_download_policy
+download_policies = {
+    'fifo': fifo_order,
+    'shortest_first': shortest_first_order,
+    'largest_first': largest_first_order,
+}
+
+
+def register_download_policy(name, order_func):
+    """
+    Function adds a download ordering policy. order_func(urls, sizes) gets the urls in discovery order and a size for
+    each, and returns them in transfer order.
+    :param name:
+    :param order_func:
+    :return:
+    """
+    download_policies[name] = order_func
+
+
+def configure_download_scheduler(**config):
+    """
+    Function updates download_scheduler_config with the input keyword arguments (policy, head_unknown, head_workers,
+    per_file_seconds, bytes_per_second).
+    :param config:
+    :return download_scheduler_config:
+    """
+    unknown_keys = set(config.keys()).difference(set(download_scheduler_config.keys()))
+    if len(unknown_keys) > 0:
+        raise ValueError(f"unknown download scheduler settings: {sorted(unknown_keys)}")
+    if config.get('policy', download_scheduler_config['policy']) not in download_policies:
+        raise ValueError(f"unknown download policy {config['policy']}, expected one of {list(download_policies)}")
+
+    download_scheduler_config.update(config)
+
+    return download_scheduler_config
+
+
+def listed_file_sizes(urls):
+    """
+    Function returns {url: size} for the input file urls whose size is shown in a directory listing in the listing
+    cache, which holds every listing the crawl that found them fetched.
+    :param urls:
+    :return sizes:
+    """
+    if not listing_cache_config['enabled']:
+        return {}
+
+    cache = get_listing_cache()
+    directory_sizes = {}
+    sizes = {}
+    for url in urls:
+        directory, href = url.rsplit('/', 1)
+        if directory not in directory_sizes:
+            cached = cache.get(directory + '/')
+            directory_sizes[directory] = {} if cached is None else \
+                {entry.href: entry.size for entry in cached['entries'] if entry.size is not None}
+        size = directory_sizes[directory].get(href)
+        if size is not None:
+            sizes[url] = size
+
+    return sizes
+
+
+def head_file_sizes(urls, workers=None):
+    """
+    Function returns {url: size} for the input urls from the Content-Length of HEAD requests; urls that fail or have no
+    Content-Length are left out.
+    :param urls:
+    :param workers:
+    :return sizes:
+    """
+    def head(url):
+        try:
+            return remote_file_size(url)
+        except Exception as e:
+            LOGGER.warning(f"could not get the size of {url}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers or download_scheduler_config['head_workers']) as executor:
+        head_sizes = list(executor.map(head, urls))
+
+    return {url: size for url, size in zip(urls, head_sizes) if size is not None}
+
+
+def learn_file_sizes(urls, sizes=None, head=False):
+    """
+    Function returns {url: size} for the input urls, from the input sizes (e.g. from the listing metadata store), then
+    the listing cache, then with head HEAD requests for the rest. Urls whose size could not be learnt are left out.
+    :param urls:
+    :param sizes:
+    :param head:
+    :return sizes:
+    """
+    # sizes may be a whole metadata store, only the input urls are kept
+    sizes = sizes or {}
+    learnt_sizes = {url: sizes[url] for url in urls if sizes.get(url) is not None}
+    unknown_urls = [url for url in urls if url not in learnt_sizes]
+    if len(unknown_urls) > 0:
+        learnt_sizes.update(listed_file_sizes(unknown_urls))
+    unknown_urls = [url for url in urls if url not in learnt_sizes]
+    if head and len(unknown_urls) > 0:
+        LOGGER.info(f"sending HEAD requests for the size of {len(unknown_urls)} files")
+        learnt_sizes.update(head_file_sizes(unknown_urls))
+
+    return learnt_sizes
+
+
+def predict_makespan(ordered_urls, sizes, workers):
+    """
+    Function returns the seconds workers transfers pulling the input urls in order from a shared queue would take to
+    finish them all, costing each file per_file_seconds plus its size at bytes_per_second.
+    :param ordered_urls:
+    :param sizes:
+    :param workers:
+    :return makespan:
+    """
+    worker_free_at = [0.0] * max(1, workers)
+    for url in ordered_urls:
+        start = heapq.heappop(worker_free_at)
+        heapq.heappush(worker_free_at, start + download_scheduler_config['per_file_seconds'] +
+                       sizes[url] / download_scheduler_config['bytes_per_second'])
+
+    return max(worker_free_at)
+
+
+class DownloadSchedule:
+    """
+    The order a backlog of downloads is transferred in under a policy, with the sizes it was ordered by (files of
+    unknown size count as the median known size) and the makespan predicted for it and for every other policy.
+    """
+
+    def __init__(self, urls, sizes, policy, workers):
+        self.policy = policy
+        self.workers = workers
+        sizes = {url: sizes[url] for url in urls if url in sizes}
+        self.known_sizes = len(sizes)
+        default_size = statistics.median(sizes.values()) if len(sizes) > 0 else 0
+        self.sizes = {url: sizes.get(url, default_size) for url in urls}
+        self.urls = download_policies[policy](list(urls), self.sizes)
+        self.predicted = {name: predict_makespan(order_func(list(urls), self.sizes), self.sizes, workers)
+                          for name, order_func in download_policies.items()}
+
+    def __len__(self):
+        return len(self.urls)
+
+    def summary(self, measured_seconds=None):
+        total_bytes = sum(self.sizes.values())
+        predicted = ', '.join(f"{name} {seconds:.1f}s" for name, seconds in self.predicted.items())
+        summary = (f"download schedule: {len(self)} files, {total_bytes / 1e6:.1f} MB ({self.known_sizes} sizes known) "
+                   f"on {self.workers} workers, policy {self.policy}")
+        if measured_seconds is not None:
+            summary += f", makespan {measured_seconds:.1f}s"
+        return summary + f" | predicted makespan: {predicted}"
+
+
+def schedule_downloads(urls, workers, policy=None, sizes=None):
+    """
+    Function orders the input download urls for workers transfer workers sharing one queue under the input policy
+    (download_scheduler_config['policy'] by default) and returns the DownloadSchedule. Sizes come from the input
+    sizes, the listing cache and, unless the policy is fifo, HEAD requests for whatever is still unknown.
+    :param urls:
+    :param workers:
+    :param policy:
+    :param sizes:
+    :return schedule:
+    """
+    policy = policy or download_scheduler_config['policy']
+    if policy not in download_policies:
+        raise ValueError(f"unknown download policy {policy}, expected one of {list(download_policies)}")
+
+    head = download_scheduler_config['head_unknown'] and policy != 'fifo'
+    schedule = DownloadSchedule(urls, learn_file_sizes(urls, sizes, head=head), policy, workers)
+    LOGGER.info(schedule.summary())
+
+    return schedule
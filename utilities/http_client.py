@@ -0,0 +1,256 @@
+import time
+import logging
+import threading
+from .rate_scheduler import scheduler_config, get_scheduler, parse_retry_after
+from .lazy_import import lazy_module
+
+# requests takes longer to import than the rest of the package, it is imported once a request is made
+requests = lazy_module('requests')
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Defaults for the shared session; change with configure_http_client before the first request of a run
+http_config = {
+    'pool_connections': 10,     # number of hosts to keep a connection pool for
+    'pool_maxsize': 32,         # connections kept alive per host, should be >= the crawler worker count
+    'max_retries': 3,
+    'backoff_factor': 0.5,      # sleeps 0.5, 1, 2 ... seconds between retries
+    'status_forcelist': (500, 502, 504),  # 429/503 are throttling, retried by http_request after Retry-After
+    'timeout': 60,
+}
+
+_session = None
+_session_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {'requests': 0, 'retries': 0, 'throttled': 0, 'errors': 0, 'total_latency': 0.0, 'max_latency': 0.0}
+
+
+def configure_http_client(**config):
+    """
+    Function updates http_config with the input keyword arguments and drops the current shared session so that the next
+    request builds one with the new settings.
+    :param config:
+    :return http_config:
+    """
+    global _session
+
+    unknown_keys = set(config.keys()).difference(set(http_config.keys()))
+    if len(unknown_keys) > 0:
+        raise ValueError(f"unknown http client settings: {sorted(unknown_keys)}")
+
+    with _session_lock:
+        http_config.update(config)
+        if _session is not None:
+            _session.close()
+        _session = None
+
+    return http_config
+
+
+def create_session():
+    """
+    Function builds a requests session with a keep-alive connection pool and retry/backoff mounted for http and https.
+    :return session:
+    """
+    # 429/503 with a Retry-After go back to http_request, so the rate scheduler sees the throttling
+    retry = requests.adapters.Retry(total=http_config['max_retries'],
+                                    backoff_factor=http_config['backoff_factor'],
+                                    status_forcelist=http_config['status_forcelist'],
+                                    allowed_methods=frozenset(['GET', 'HEAD']),
+                                    respect_retry_after_header=False,
+                                    raise_on_status=False)
+    adapter = requests.adapters.HTTPAdapter(pool_connections=http_config['pool_connections'],
+                                            pool_maxsize=http_config['pool_maxsize'],
+                                            max_retries=retry)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return session
+
+
+def get_session():
+    """
+    Function returns the shared session, creating it on first use.
+    :return session:
+    """
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+
+    return _session
+
+
+def http_get(url, traffic_class=None, **kwargs):
+    """
+    Function performs a GET through the shared pooled session and records its latency. Accepts the same keyword
+    arguments as requests.get; the configured timeout is used unless one is given. traffic_class picks the rate
+    scheduler the request goes through, 'listing' or 'download', by default 'download' for streamed requests.
+    :param url:
+    :param traffic_class:
+    :param kwargs:
+    :return response:
+    """
+    return http_request('GET', url, traffic_class=traffic_class, **kwargs)
+
+
+def http_head(url, traffic_class=None, **kwargs):
+    """
+    Function performs a HEAD through the shared pooled session, see http_get.
+    :param url:
+    :param traffic_class:
+    :param kwargs:
+    :return response:
+    """
+    return http_request('HEAD', url, traffic_class=traffic_class, **kwargs)
+
+
+def _release_on_close(response, scheduler, latency):
+    """
+    Holds the scheduler slot of a streamed response until the response is closed, so a download counts against the
+    concurrency limit for as long as its body is being read.
+    """
+    close = response.close
+    released = []
+
+    def close_and_release():
+        try:
+            close()
+        finally:
+            if not released:
+                released.append(True)
+                scheduler.release(latency=latency)
+
+    response.close = close_and_release
+
+
+def http_request(method, url, traffic_class=None, **kwargs):
+    """
+    Function sends a request through the shared session under the rate scheduler of its traffic class. A 429 or 503
+    reply pauses the class for its Retry-After and the request is sent again, up to max_throttle_retries times, after
+    which the throttled response is returned. Streamed responses hold their scheduler slot until they are closed.
+    :param method:
+    :param url:
+    :param traffic_class:
+    :param kwargs:
+    :return response:
+    """
+    kwargs.setdefault('timeout', http_config['timeout'])
+    if traffic_class is None:
+        traffic_class = 'download' if kwargs.get('stream') else 'listing'
+    scheduler = get_scheduler(traffic_class)
+
+    throttle_count = 0
+    while True:
+        if scheduler is not None:
+            scheduler.acquire()
+        start = time.perf_counter()
+        try:
+            response = get_session().request(method, url, **kwargs)
+        except requests.RequestException:
+            if scheduler is not None:
+                scheduler.release()
+            with _stats_lock:
+                _stats['errors'] += 1
+            raise
+        elapsed = time.perf_counter() - start
+
+        retries = response_retries(response)
+        throttled = response.status_code in scheduler_config['throttle_statuses']
+        with _stats_lock:
+            _stats['requests'] += 1
+            _stats['retries'] += retries
+            _stats['throttled'] += int(throttled)
+            _stats['total_latency'] += elapsed
+            _stats['max_latency'] = max(_stats['max_latency'], elapsed)
+
+        if not throttled or throttle_count >= scheduler_config['max_throttle_retries']:
+            break
+
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        response.close()
+        throttle_count += 1
+        LOGGER.info(f"{url} throttled with {response.status_code}, retry {throttle_count} after {retry_after}s")
+        if scheduler is not None:
+            # the scheduler pauses every request of the class, this one waits in acquire
+            scheduler.release(throttled=True, retry_after=retry_after)
+        else:
+            time.sleep(min(retry_after if retry_after is not None else scheduler_config['default_retry_after'],
+                           scheduler_config['max_retry_after']))
+
+    if scheduler is not None:
+        if kwargs.get('stream') and not throttled:
+            _release_on_close(response, scheduler, elapsed)
+        else:
+            scheduler.release(latency=elapsed, throttled=throttled)
+
+    return response
+
+
+def response_retries(response):
+    """
+    Function returns how many times urllib3 retried the request behind the input response.
+    :param response:
+    :return retries:
+    """
+    if response.raw is not None and getattr(response.raw, 'retries', None) is not None:
+        return len(response.raw.retries.history)
+
+    return 0
+
+
+def count_connections_opened():
+    """
+    Function returns how many connections (i.e. TCP/TLS handshakes) the shared session has opened across its pools.
+    :return connection_count:
+    """
+    if _session is None:
+        return 0
+
+    connection_count = 0
+    # the same adapter is mounted for http and https, count each one once
+    adapters = {id(adapter): adapter for adapter in _session.adapters.values()}
+    for adapter in adapters.values():
+        pools = adapter.poolmanager.pools
+        for pool_key in list(pools.keys()):
+            pool = pools.get(pool_key)
+            if pool is not None:
+                connection_count += pool.num_connections
+
+    return connection_count
+
+
+def get_http_stats():
+    """
+    Function returns a snapshot of the request, handshake and latency counters for the shared session.
+    :return stats_dict:
+    """
+    with _stats_lock:
+        stats_dict = dict(_stats)
+
+    stats_dict['handshakes'] = count_connections_opened()
+    if stats_dict['requests'] > 0:
+        stats_dict['mean_latency'] = stats_dict['total_latency'] / stats_dict['requests']
+    else:
+        stats_dict['mean_latency'] = 0.0
+
+    return stats_dict
+
+
+def format_http_summary():
+    """
+    Function returns a one-line summary of the http stats for the run summary, and logs it.
+    :return summary:
+    """
+    stats = get_http_stats()
+    summary = (f"http: {stats['requests']} requests over {stats['handshakes']} handshakes | "
+               f"retries: {stats['retries']} | throttled: {stats['throttled']} | errors: {stats['errors']} | "
+               f"latency mean: {stats['mean_latency']:.3f}s max: {stats['max_latency']:.3f}s")
+    LOGGER.info(summary)
+
+    return summary
@@ -0,0 +1,343 @@
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from .url_classifier import classify_url
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Settings for the run report; change with configure_instrumentation
+instrumentation_config = {
+    'enabled': True,
+    'report_dir': os.environ.get('UCAR_METRICS_DIR', '.'),
+    'report_name': 'ucar_sync_metrics',     # written as <report_name>.json and <report_name>.prom
+}
+
+# upper bounds (seconds) of the latency histogram buckets, the last bucket is +Inf
+latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+listing_depths = ['mission', 'proctype', 'level', 'year', 'doy']
+
+_endpoints = {}
+_endpoints_lock = threading.Lock()
+_run_start = time.time()
+
+
+class EndpointStats:
+    """
+    Latency histogram and counters of one endpoint type (a listing depth, download, upload, an aws operation, ...):
+    calls, errors, retries and bytes transferred.
+    """
+
+    def __init__(self):
+        self.bucket_counts = [0] * (len(latency_buckets) + 1)
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, seconds, num_bytes=0, retries=0, error=False):
+        self.bucket_counts[bisect.bisect_left(latency_buckets, seconds)] += 1
+        self.count += 1
+        self.errors += 1 if error else 0
+        self.retries += retries
+        self.bytes += num_bytes
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def merge(self, stats_dict):
+        self.bucket_counts = [count + other for count, other in zip(self.bucket_counts, stats_dict['bucket_counts'])]
+        self.count += stats_dict['count']
+        self.errors += stats_dict['errors']
+        self.retries += stats_dict['retries']
+        self.bytes += stats_dict['bytes']
+        self.total_seconds += stats_dict['total_seconds']
+        self.max_seconds = max(self.max_seconds, stats_dict['max_seconds'])
+
+    def quantile(self, q):
+        """
+        Returns the upper bound of the bucket holding the q quantile, or max_seconds for the +Inf bucket.
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for upper_bound, bucket_count in zip(latency_buckets, self.bucket_counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(upper_bound, self.max_seconds)
+        return self.max_seconds
+
+    def as_dict(self):
+        return {'count': self.count, 'errors': self.errors, 'retries': self.retries, 'bytes': self.bytes,
+                'total_seconds': self.total_seconds, 'max_seconds': self.max_seconds,
+                'mean_seconds': self.total_seconds / self.count if self.count > 0 else 0.0,
+                'p50_seconds': self.quantile(0.5), 'p90_seconds': self.quantile(0.9),
+                'p99_seconds': self.quantile(0.99), 'bucket_counts': list(self.bucket_counts)}
+
+
+class CallMeasurement:
+    """
+    What a timed call fills in while it runs: the bytes it moved, its retries and whether it failed.
+    """
+
+    def __init__(self):
+        self.num_bytes = 0
+        self.retries = 0
+        self.error = False
+
+    def add_bytes(self, num_bytes):
+        self.num_bytes += num_bytes
+
+
+def configure_instrumentation(**config):
+    """
+    Function updates instrumentation_config with the input keyword arguments (enabled, report_dir, report_name).
+    :param config:
+    :return instrumentation_config:
+    """
+    unknown_keys = set(config.keys()).difference(set(instrumentation_config.keys()))
+    if len(unknown_keys) > 0:
+        raise ValueError(f"unknown instrumentation settings: {sorted(unknown_keys)}")
+
+    instrumentation_config.update(config)
+
+    return instrumentation_config
+
+
+def record_call(endpoint, seconds, num_bytes=0, retries=0, error=False):
+    """
+    Function records one call of the input endpoint type.
+    :param endpoint:
+    :param seconds:
+    :param num_bytes:
+    :param retries:
+    :param error:
+    :return:
+    """
+    if not instrumentation_config['enabled']:
+        return
+
+    with _endpoints_lock:
+        stats = _endpoints.get(endpoint)
+        if stats is None:
+            stats = _endpoints[endpoint] = EndpointStats()
+        stats.record(seconds, num_bytes, retries, error)
+
+    return
+
+
+@contextmanager
+def timed(endpoint):
+    """
+    Context manager that records the wall time of its block as one call of the input endpoint type. The block gets a
+    CallMeasurement to add bytes and retries to; an exception leaving the block counts the call as an error.
+    :param endpoint:
+    :return measurement:
+    """
+    measurement = CallMeasurement()
+    start = time.perf_counter()
+    try:
+        yield measurement
+    except BaseException:
+        measurement.error = True
+        raise
+    finally:
+        record_call(endpoint, time.perf_counter() - start, measurement.num_bytes, measurement.retries,
+                    measurement.error)
+
+
+def listing_endpoint(url):
+    """
+    Function returns the endpoint type of a ucar directory listing from the depth of its url: listing_root,
+    listing_mission, listing_proctype, listing_level, listing_year or listing_doy (listing_other if it does not follow
+    the ucar layout).
+    :param url:
+    :return endpoint:
+    """
+    if url.rstrip('/').endswith('/gnss-ro'):
+        return 'listing_root'
+    ucar_path = classify_url(url)
+    if ucar_path is None:
+        return 'listing_other'
+
+    depth = 'mission'
+    for field in listing_depths[1:]:
+        if getattr(ucar_path, field) is not None:
+            depth = field
+
+    return f"listing_{depth}"
+
+
+def _before_aws_call(context, **kwargs):
+    context['instrumentation_start'] = time.perf_counter()
+
+
+def _after_aws_call(event_name, http_response, parsed, context, **kwargs):
+    start = context.pop('instrumentation_start', None)
+    if start is None:
+        return
+    retries = parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+    num_bytes = int(http_response.headers.get('Content-Length') or 0) + context.pop('instrumentation_bytes', 0)
+    record_call(aws_endpoint(event_name), time.perf_counter() - start, num_bytes, retries,
+                http_response.status_code >= 300)
+
+
+def _after_aws_call_error(event_name, context, **kwargs):
+    start = context.pop('instrumentation_start', None)
+    if start is not None:
+        record_call(aws_endpoint(event_name), time.perf_counter() - start, error=True)
+
+
+def _count_aws_request_bytes(params, context, **kwargs):
+    # only reached once boto3 is in use, so importing botocore here costs nothing extra
+    from botocore.utils import determine_content_length
+
+    # bodies are bytes, file objects or the file chunks of upload_file
+    if params.get('body') is not None:
+        context['instrumentation_bytes'] = determine_content_length(params['body']) or 0
+
+
+def aws_endpoint(event_name):
+    # after-call.s3.ListObjectsV2 --> s3.ListObjectsV2
+    return '.'.join(event_name.split('.')[1:3])
+
+
+def instrument_boto3_session(session):
+    """
+    Function hooks the input boto3 session so that every call of every client and resource made from it (s3 listings,
+    uploads, dynamodb writes, ...) is recorded as an '<service>.<operation>' endpoint, with its retries and bytes.
+    :param session:
+    :return session:
+    """
+    session.events.register('before-call', _before_aws_call, unique_id='ucar-instrumentation-before')
+    session.events.register('before-call', _count_aws_request_bytes, unique_id='ucar-instrumentation-bytes')
+    session.events.register('after-call', _after_aws_call, unique_id='ucar-instrumentation-after')
+    session.events.register('after-call-error', _after_aws_call_error, unique_id='ucar-instrumentation-error')
+
+    return session
+
+
+def take_metrics(reset=True):
+    """
+    Function returns a snapshot of every endpoint's stats as plain dictionaries, by default resetting them, so a worker
+    process can hand its calls to the parent with merge_metrics.
+    :param reset:
+    :return snapshot:
+    """
+    with _endpoints_lock:
+        snapshot = {endpoint: stats.as_dict() for endpoint, stats in _endpoints.items()}
+        if reset:
+            _endpoints.clear()
+
+    return snapshot
+
+
+def merge_metrics(snapshot):
+    """
+    Function adds a snapshot from take_metrics (for example from a worker process) to this process's stats.
+    :param snapshot:
+    :return:
+    """
+    with _endpoints_lock:
+        for endpoint, stats_dict in snapshot.items():
+            _endpoints.setdefault(endpoint, EndpointStats()).merge(stats_dict)
+
+    return
+
+
+def reset_metrics():
+    global _run_start
+
+    with _endpoints_lock:
+        _endpoints.clear()
+        _run_start = time.time()
+
+
+def metrics_report():
+    """
+    Function returns the run report: the run's start and duration, and per endpoint the call count, errors, retries,
+    bytes, latency mean / p50 / p90 / p99 / max and the histogram bucket counts.
+    :return report:
+    """
+    return {'run_start': _run_start, 'run_seconds': time.time() - _run_start,
+            'latency_buckets': list(latency_buckets), 'endpoints': dict(sorted(take_metrics(reset=False).items()))}
+
+
+def format_prometheus(report):
+    """
+    Function renders a metrics_report in the Prometheus text exposition format, for the node_exporter textfile
+    collector.
+    :param report:
+    :return text:
+    """
+    lines = ["# HELP ucar_sync_run_seconds Wall time of the run so far.", "# TYPE ucar_sync_run_seconds gauge",
+             f"ucar_sync_run_seconds {report['run_seconds']:.6f}",
+             "# HELP ucar_sync_call_seconds Latency of ucar http and aws calls by endpoint type.",
+             "# TYPE ucar_sync_call_seconds histogram"]
+    for endpoint, stats in report['endpoints'].items():
+        cumulative = 0
+        for upper_bound, bucket_count in zip(report['latency_buckets'] + ['+Inf'], stats['bucket_counts']):
+            cumulative += bucket_count
+            lines.append(f'ucar_sync_call_seconds_bucket{{endpoint="{endpoint}",le="{upper_bound}"}} {cumulative}')
+        lines.append(f'ucar_sync_call_seconds_sum{{endpoint="{endpoint}"}} {stats["total_seconds"]:.6f}')
+        lines.append(f'ucar_sync_call_seconds_count{{endpoint="{endpoint}"}} {stats["count"]}')
+
+    for counter, field, help_text in [('ucar_sync_call_bytes_total', 'bytes', "Bytes transferred by endpoint type."),
+                                      ('ucar_sync_call_retries_total', 'retries', "Retries by endpoint type."),
+                                      ('ucar_sync_call_errors_total', 'errors', "Failed calls by endpoint type.")]:
+        lines.append(f"# HELP {counter} {help_text}")
+        lines.append(f"# TYPE {counter} counter")
+        for endpoint, stats in report['endpoints'].items():
+            lines.append(f'{counter}{{endpoint="{endpoint}"}} {stats[field]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def _write_atomic(path, text):
+    # the textfile collector may read at any time, so never leave a half written file in place
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as tmp_file:
+        tmp_file.write(text)
+    os.replace(tmp_path, path)
+
+
+def write_metrics_report(report_dir=None):
+    """
+    Function writes the run report as <report_name>.json and <report_name>.prom under report_dir and returns both paths.
+    :param report_dir:
+    :return json_path, prom_path:
+    """
+    report_dir = os.path.expanduser(report_dir or instrumentation_config['report_dir'])
+    os.makedirs(report_dir, exist_ok=True)
+    report = metrics_report()
+
+    json_path = os.path.join(report_dir, f"{instrumentation_config['report_name']}.json")
+    prom_path = os.path.join(report_dir, f"{instrumentation_config['report_name']}.prom")
+    _write_atomic(json_path, json.dumps(report, indent=2))
+    _write_atomic(prom_path, format_prometheus(report))
+    LOGGER.info(f"metrics report written to {json_path} and {prom_path}")
+
+    return json_path, prom_path
+
+
+def format_metrics_summary():
+    """
+    Function returns a summary of the run with one line per endpoint type, slowest total first, and logs it.
+    :return summary:
+    """
+    report = metrics_report()
+    lines = [f"calls by endpoint over {report['run_seconds']:.1f}s:"]
+    for endpoint, stats in sorted(report['endpoints'].items(), key=lambda item: -item[1]['total_seconds']):
+        lines.append(f"  {endpoint}: {stats['count']} calls, {stats['total_seconds']:.2f}s total | "
+                     f"p50 {stats['p50_seconds']:.3f}s p99 {stats['p99_seconds']:.3f}s max {stats['max_seconds']:.3f}s | "
+                     f"{stats['bytes']} bytes | {stats['retries']} retries | {stats['errors']} errors")
+    summary = '\n'.join(lines)
+    LOGGER.info(summary)
+
+    return summary
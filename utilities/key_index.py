@@ -0,0 +1,125 @@
+import os
+import logging
+import threading
+from .ucar_repo_status import check_if_correct_level
+from .instrumentation import timed
+
+
+LOGGER = logging.getLogger(__name__)
+
+_loaded_indexes = {}
+_loaded_indexes_lock = threading.Lock()
+
+
+def key_group(obj_key):
+    """
+    Function returns the (mission, proctype, level) group of an s3 object key or ucar path, for example
+    cosmic2/nrt/level2/2021/001/atmPrf_nrt_2021_001.tar.gz --> ('cosmic2', 'nrt', 'level2'). spire and geoopt keys
+    carry an extra directory after the mission. Returns None for keys that are too short to have a level.
+    :param obj_key:
+    :return group:
+    """
+    key_contents = obj_key.split('/')
+    if key_contents[0] == 'spire' or key_contents[0] == 'geoopt':
+        if len(key_contents) < 4:
+            return None
+        return key_contents[0], key_contents[2], key_contents[3]
+
+    if len(key_contents) < 3:
+        return None
+    return key_contents[0], key_contents[1], key_contents[2]
+
+
+class S3KeyIndex:
+    """
+    In-memory index of the s3 object keys listed in an obj key file. Keys are held in hash tables grouped by
+    (mission, proctype, level), so membership and difference queries cost O(1) per key whatever the size of the file,
+    and listing the keys of one mission or proctype only touches that group. Keys keep the order they were added in.
+    """
+
+    def __init__(self):
+        self.groups = {}
+        self.all_keys = {}
+
+    def add(self, obj_key):
+        if obj_key in self.all_keys:
+            return
+        self.all_keys[obj_key] = None
+        group = key_group(obj_key)
+        if group not in self.groups:
+            self.groups[group] = {}
+        self.groups[group][obj_key] = None
+
+    def update(self, obj_keys):
+        for obj_key in obj_keys:
+            self.add(obj_key)
+
+    def __contains__(self, obj_key):
+        return obj_key in self.all_keys
+
+    def __len__(self):
+        return len(self.all_keys)
+
+    def keys(self, mission=None, proctype=None, level=None):
+        """
+        Returns the list of keys in the groups matching the given mission, proctype and level (None matches anything).
+        """
+        if mission is None and proctype is None and level is None:
+            return list(self.all_keys)
+
+        matching_keys = []
+        for group, group_keys in self.groups.items():
+            if group is None:
+                continue
+            if mission is not None and group[0] != mission:
+                continue
+            if proctype is not None and group[1] != proctype:
+                continue
+            if level is not None and group[2] != level:
+                continue
+            matching_keys.extend(group_keys)
+
+        return matching_keys
+
+    def missing(self, obj_keys):
+        """
+        Returns the keys of the input iterable that are not in the index, in input order and without duplicates.
+        """
+        return [obj_key for obj_key in dict.fromkeys(obj_keys) if obj_key not in self.all_keys]
+
+    @classmethod
+    def from_file(cls, obj_key_file_path):
+        """
+        Builds an index from an obj key file (one key per line). Only keys that pass check_if_correct_level are kept.
+        """
+        key_index = cls()
+        with open(obj_key_file_path, 'r') as the_s3_obj_file:
+            for line in the_s3_obj_file:
+                obj_key = line.rstrip('\n')
+                if obj_key != '' and check_if_correct_level(obj_key):
+                    key_index.add(obj_key)
+
+        return key_index
+
+
+def load_key_index(obj_key_file_path):
+    """
+    Function returns the S3KeyIndex for the input obj key file. The file is read once per process and the index is
+    re-used until the file changes on disk.
+    :param obj_key_file_path:
+    :return key_index:
+    """
+    file_stat = os.stat(obj_key_file_path)
+    file_path = os.path.abspath(obj_key_file_path)
+    file_version = (file_stat.st_mtime_ns, file_stat.st_size)
+
+    with _loaded_indexes_lock:
+        loaded_version, key_index = _loaded_indexes.get(file_path, (None, None))
+        if loaded_version != file_version:
+            with timed('obj_key_index_load') as measurement:
+                key_index = S3KeyIndex.from_file(obj_key_file_path)
+                measurement.add_bytes(file_stat.st_size)
+            LOGGER.info(f"loaded {len(key_index)} keys from {obj_key_file_path}")
+            _loaded_indexes[file_path] = (file_version, key_index)
+
+    return key_index
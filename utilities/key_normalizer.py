@@ -0,0 +1,164 @@
+import os
+import re
+import time
+import logging
+
+
+LOGGER = logging.getLogger(__name__)
+
+default_chunk_bytes = 64 * 1024 * 1024
+# the normalized key file is the obj key file compare_in_s3 reads (it imports this), in the working directory unless
+# overridden
+default_output_path = os.environ.get('UCAR_OBJ_KEY_FILE', "zero_pad_ucar_objKey.txt")
+
+one_digit_pattern = re.compile(r"/([0-9])/")
+two_digit_pattern = re.compile(r"/([0-9][0-9])/")
+# matches wherever either of the two above does, used to skip the keys (and chunks) that need no padding
+short_number_pattern = re.compile(r"/[0-9]{1,2}/")
+# whitespace other than the newline; the ascii ones are checked with plain substring scans, which are much faster
+whitespace_pattern = re.compile(r"[^\S\n]")
+ascii_whitespace = [' ', '\t', '\r', '\x0b', '\x0c', '\x1c', '\x1d', '\x1e', '\x1f']
+
+
+class NormalizeReport:
+    """
+    Result of normalize_key_file: how many keys were read and changed, how long it took, and the (old, new) pairs of the
+    first max_changes keys that changed.
+    """
+
+    def __init__(self, max_changes):
+        self.keys = 0
+        self.changed = 0
+        self.changes = []
+        self.max_changes = max_changes
+        self.seconds = 0.0
+
+    def record_change(self, old_key, new_key):
+        self.changed += 1
+        if len(self.changes) < self.max_changes:
+            self.changes.append((old_key, new_key))
+
+    def keys_per_second(self):
+        if self.seconds == 0:
+            return 0.0
+        return self.keys / self.seconds
+
+    def summary(self):
+        return (f"key normalization: {self.keys} keys in {self.seconds:.2f}s = {self.keys_per_second():.0f} keys/s | "
+                f"{self.changed} keys changed")
+
+
+def normalize_key(obj_file_key):
+    """
+    Function zero pads a one or two digit directory of an s3 obj key (.../2021/1/... --> .../2021/001/...) with the
+    same rules as check_zero_pad_doy: one digit directories take precedence over two digit ones, and every directory of
+    that width is replaced by the padded value of the first.
+    :param obj_file_key:
+    :return zero_pad_key or obj_file_key:
+    """
+    for pattern in [one_digit_pattern, two_digit_pattern]:
+        number_match = pattern.search(obj_file_key)
+        if number_match is not None:
+            LOGGER.debug(f"zero padding {number_match.groups()} in {obj_file_key}")
+            return pattern.sub(f"/{number_match.group(1).zfill(3)}/", obj_file_key)
+
+    return obj_file_key
+
+
+def has_whitespace(text):
+    if text.isascii():
+        for whitespace in ascii_whitespace:
+            if whitespace in text:
+                return True
+        return False
+    return whitespace_pattern.search(text) is not None
+
+
+def normalize_chunk(text, report):
+    """
+    Function normalizes a chunk of whole key lines (ending in a newline) and returns the new text and the (old, new)
+    pairs of the keys it changed. The chunk is scanned once for short numeric directories; only the lines they are on
+    are normalized and every other line is copied through untouched. If the chunk holds any whitespace besides the
+    newlines its lines are stripped first, as the original line by line loop did.
+    :param text:
+    :param report:
+    :return text, changes:
+    """
+    report.keys += text.count('\n')
+    if has_whitespace(text):
+        text = ''.join([f"{line.strip()}\n" for line in text.split('\n')[:-1]])
+
+    pieces = []
+    changes = []
+    copied_to = 0
+    for number_match in short_number_pattern.finditer(text):
+        if number_match.start() < copied_to:
+            # another match on a line already normalized
+            continue
+        line_start = text.rfind('\n', 0, number_match.start()) + 1
+        line_end = text.find('\n', number_match.end() - 1)
+        obj_file_key = text[line_start:line_end]
+        zero_pad_key = normalize_key(obj_file_key)
+        if zero_pad_key != obj_file_key:
+            report.record_change(obj_file_key, zero_pad_key)
+            changes.append((obj_file_key, zero_pad_key))
+            pieces.append(text[copied_to:line_start])
+            pieces.append(zero_pad_key)
+            copied_to = line_end
+    if copied_to == 0:
+        return text, changes
+    pieces.append(text[copied_to:])
+
+    return ''.join(pieces), changes
+
+
+def normalize_key_file(input_path, output_path, chunk_bytes=default_chunk_bytes, changes_path=None, max_changes=1000):
+    """
+    Function zero pads every key of an obj key file, reading and writing it chunk_bytes at a time, and returns a
+    NormalizeReport. Keys are stripped and written one per line, as add_zero_pad_doy_to_key_file did. If changes_path is
+    given every changed key is also written there as '<old key>\t<new key>'. The output is written to a .tmp file
+    that replaces output_path once complete, so output_path may be input_path.
+    :param input_path:
+    :param output_path:
+    :param chunk_bytes:
+    :param changes_path:
+    :param max_changes:
+    :return report:
+    """
+    report = NormalizeReport(max_changes)
+    start = time.perf_counter()
+
+    tmp_path = f"{output_path}.tmp"
+    changes_file = open(changes_path, 'w') if changes_path is not None else None
+    try:
+        with open(input_path, 'r') as input_file, open(tmp_path, 'w') as output_file:
+            partial_line = ''
+            while True:
+                chunk = input_file.read(chunk_bytes)
+                if chunk == '':
+                    # a last key without a newline
+                    text = f"{partial_line}\n" if partial_line != '' else ''
+                else:
+                    text = partial_line + chunk
+                    # the piece after the last newline may be cut mid key, it is completed by the next chunk
+                    line_cut = text.rfind('\n') + 1
+                    text, partial_line = text[:line_cut], text[line_cut:]
+
+                text, changes = normalize_chunk(text, report)
+                output_file.write(text)
+                if changes_file is not None:
+                    changes_file.writelines([f"{old_key}\t{new_key}\n" for old_key, new_key in changes])
+
+                if chunk == '':
+                    break
+        os.replace(tmp_path, output_path)
+    finally:
+        if changes_file is not None:
+            changes_file.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    report.seconds = time.perf_counter() - start
+    LOGGER.info(report.summary())
+
+    return report
@@ -0,0 +1,33 @@
+import importlib
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is imported the first time one of its attributes is used, e.g.
+    np = lazy_module('numpy') at the top of a module keeps numpy out of its import time. Attributes are cached on the
+    stand-in once looked up, so later uses cost a plain attribute lookup.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        value = getattr(self._module, attribute)
+        setattr(self, attribute, value)
+        return value
+
+    def __repr__(self):
+        state = 'imported' if self._module is not None else 'not imported yet'
+        return f"<lazy module '{self._name}', {state}>"
+
+
+def lazy_module(name):
+    """
+    Function returns a LazyModule for the input module name, which imports the module on first attribute access.
+    :param name:
+    :return lazy_module:
+    """
+    return LazyModule(name)
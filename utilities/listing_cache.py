@@ -0,0 +1,283 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+from datetime import date
+from concurrent.futures import Future
+from .http_client import http_get, response_retries
+from .listing_parser import ListingEntry, parse_listing_entries
+from .instrumentation import timed, listing_endpoint
+from .lazy_import import lazy_module
+
+sqlite3 = lazy_module('sqlite3')
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Settings for the listing cache; change with configure_listing_cache
+listing_cache_config = {
+    'enabled': True,
+    'path': os.environ.get('UCAR_LISTING_CACHE', os.path.join('~', '.cache', 'ucar_listing_cache.sqlite')),
+    'default_ttl': 60 * 60,                 # seconds before a listing is revalidated
+    'immutable_ttl': 30 * 24 * 60 * 60,     # same, for past years of reprocessed proctypes
+}
+
+# Proctypes whose past years are no longer written to
+immutable_proc_types = ['postProc/', 'repro2013/', 'repro2016/']
+year_pattern = re.compile(r'/((?:19|20)[0-9]{2})/')
+
+_cache = None
+_cache_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'revalidated': 0, 'fetched': 0, 'shared': 0}
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+class ListingCache:
+    """
+    SQLite store of parsed directory listings keyed by url. Each row keeps the hrefs of the page, with the modification
+    time and size listed for each, together with the ETag and Last-Modified headers it was served with, used to
+    revalidate it, and the time it was last confirmed current.
+    Connections are per thread so the cache can be shared by the crawler's worker threads.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._local = threading.local()
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS listings (url TEXT PRIMARY KEY, hrefs TEXT NOT NULL, "
+                           "etag TEXT, last_modified TEXT, checked_at REAL NOT NULL)")
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(listings)").fetchall()]
+        if 'stamps' not in columns:
+            # caches written before entry metadata was kept, their rows read back without it
+            connection.execute("ALTER TABLE listings ADD COLUMN stamps TEXT")
+        connection.commit()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            self._local.connection = connection
+        return connection
+
+    def get(self, url):
+        """
+        Returns the cached row for url as a dictionary, or None if it has not been cached.
+        """
+        row = self._connection().execute("SELECT hrefs, stamps, etag, last_modified, checked_at FROM listings "
+                                         "WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+
+        hrefs = json.loads(row[0])
+        stamps = json.loads(row[1]) if row[1] is not None else [(None, None)] * len(hrefs)
+        entries = [ListingEntry(href, mtime, size) for href, (mtime, size) in zip(hrefs, stamps)]
+
+        return {'entries': entries, 'etag': row[2], 'last_modified': row[3], 'checked_at': row[4]}
+
+    def put(self, url, entries, etag, last_modified):
+        hrefs = [entry.href for entry in entries]
+        stamps = [(entry.mtime, entry.size) for entry in entries]
+        connection = self._connection()
+        connection.execute("INSERT OR REPLACE INTO listings (url, hrefs, stamps, etag, last_modified, checked_at) "
+                           "VALUES (?, ?, ?, ?, ?, ?)",
+                           (url, json.dumps(hrefs), json.dumps(stamps), etag, last_modified, time.time()))
+        connection.commit()
+
+    def touch(self, url):
+        connection = self._connection()
+        connection.execute("UPDATE listings SET checked_at = ? WHERE url = ?", (time.time(), url))
+        connection.commit()
+
+    def clear(self):
+        connection = self._connection()
+        connection.execute("DELETE FROM listings")
+        connection.commit()
+
+
+def configure_listing_cache(**config):
+    """
+    Function updates listing_cache_config with the input keyword arguments (enabled, path, default_ttl, immutable_ttl).
+    The cache is reopened on next use.
+    :param config:
+    :return listing_cache_config:
+    """
+    global _cache
+
+    unknown_keys = set(config.keys()).difference(set(listing_cache_config.keys()))
+    if len(unknown_keys) > 0:
+        raise ValueError(f"unknown listing cache settings: {sorted(unknown_keys)}")
+
+    with _cache_lock:
+        listing_cache_config.update(config)
+        _cache = None
+
+    return listing_cache_config
+
+
+def get_listing_cache():
+    """
+    Function returns the shared ListingCache, opening it on first use.
+    :return cache:
+    """
+    global _cache
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ListingCache(listing_cache_config['path'])
+
+    return _cache
+
+
+def listing_ttl(url):
+    """
+    Function returns how many seconds a cached listing of the input url stays valid without revalidation. Listings
+    inside a past year of a reprocessed proctype (postProc, repro2013, repro2016) never change and get the long
+    immutable_ttl; everything else, including nrt and the current year, gets default_ttl.
+    :param url:
+    :return ttl:
+    """
+    year_match = year_pattern.search(url)
+    if year_match is not None and int(year_match.group(1)) < date.today().year:
+        for proc_type in immutable_proc_types:
+            if proc_type in url:
+                return listing_cache_config['immutable_ttl']
+
+    return listing_cache_config['default_ttl']
+
+
+def fetch_listing_hrefs(url, raise_for_status=False):
+    """
+    Function returns the hrefs of the ucar directory listing at the input url, going through the listing cache, see
+    fetch_listing_entries.
+    :param url:
+    :param raise_for_status:
+    :return href_list:
+    """
+    return [entry.href for entry in fetch_listing_entries(url, raise_for_status)]
+
+
+def fetch_listing_entries(url, raise_for_status=False, revalidate=False):
+    """
+    Function returns the entries (href, mtime, size) of the ucar directory listing at the input url, going through the
+    listing cache. A cached listing younger than its ttl is returned without any request. An older one, or any cached
+    listing with revalidate, is revalidated with If-None-Match / If-Modified-Since, and a 304 reply re-uses the cached
+    entries. Only successful listings are cached. Concurrent calls for the same url share a single fetch.
+    :param url:
+    :param raise_for_status:
+    :param revalidate:
+    :return entry_list:
+    """
+    with _in_flight_lock:
+        in_flight = _in_flight.get(url)
+        if in_flight is None:
+            in_flight = _in_flight[url] = Future()
+            is_owner = True
+        else:
+            is_owner = False
+
+    if not is_owner:
+        with _stats_lock:
+            _stats['shared'] += 1
+        entry_list = in_flight.result()
+        if entry_list is None:
+            # the shared fetch failed or was not a listing, fetch again so this caller sees the error itself
+            return _fetch_listing_entries(url, raise_for_status, revalidate)[0]
+        return list(entry_list)
+
+    shared_result = None
+    try:
+        entry_list, is_listing = _fetch_listing_entries(url, raise_for_status, revalidate)
+        if is_listing:
+            shared_result = entry_list
+    finally:
+        in_flight.set_result(shared_result)
+        with _in_flight_lock:
+            del _in_flight[url]
+
+    return entry_list
+
+
+def _fetch_listing_entries(url, raise_for_status, revalidate=False):
+    """
+    Does the actual fetch for fetch_listing_entries. Returns the entries and whether the page was a successful listing.
+    """
+    if not listing_cache_config['enabled']:
+        response = _get_listing_page(url)
+        if raise_for_status:
+            response.raise_for_status()
+        return _parse_listing_page(response), response.status_code == 200
+
+    cache = get_listing_cache()
+    cached = cache.get(url)
+
+    headers = {}
+    if cached is not None:
+        if not revalidate and time.time() - cached['checked_at'] < listing_ttl(url):
+            with _stats_lock:
+                _stats['hits'] += 1
+            return cached['entries'], True
+        if cached['etag'] is not None:
+            headers['If-None-Match'] = cached['etag']
+        if cached['last_modified'] is not None:
+            headers['If-Modified-Since'] = cached['last_modified']
+
+    response = _get_listing_page(url, headers)
+    if response.status_code == 304 and cached is not None:
+        cache.touch(url)
+        with _stats_lock:
+            _stats['revalidated'] += 1
+        return cached['entries'], True
+
+    if raise_for_status:
+        response.raise_for_status()
+
+    entry_list = _parse_listing_page(response)
+    if response.status_code == 200:
+        cache.put(url, entry_list, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+    with _stats_lock:
+        _stats['fetched'] += 1
+
+    return entry_list, response.status_code == 200
+
+
+def _get_listing_page(url, headers=None):
+    # recorded per listing depth (listing_year, listing_doy, ...) with the page size and retries
+    with timed(listing_endpoint(url)) as measurement:
+        response = http_get(url, headers=headers or {})
+        measurement.add_bytes(len(response.content))
+        measurement.retries = response_retries(response)
+        measurement.error = response.status_code >= 400
+
+    return response
+
+
+def _parse_listing_page(response):
+    with timed('listing_parse') as measurement:
+        measurement.add_bytes(len(response.content))
+        return parse_listing_entries(response.text)
+
+
+def get_listing_cache_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def format_listing_cache_summary():
+    """
+    Function returns a one-line summary of how listings were served this run, and logs it.
+    :return summary:
+    """
+    stats = get_listing_cache_stats()
+    summary = (f"listing cache: {stats['hits']} hits | {stats['revalidated']} revalidated (304) | "
+               f"{stats['fetched']} fetched | {stats['shared']} shared with a concurrent fetch")
+    LOGGER.info(summary)
+
+    return summary
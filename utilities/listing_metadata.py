@@ -0,0 +1,223 @@
+import os
+import re
+import time
+import logging
+import threading
+from . import ucar_repo_status
+from .crawl_state import url_state_fields, year_doy_number, get_crawl_state
+from .lazy_import import lazy_module
+
+sqlite3 = lazy_module('sqlite3')
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Settings for the listing metadata store; change with configure_listing_metadata. path None keeps the store next to
+# the manifests, in ucar_manifests_loc.
+listing_metadata_config = {
+    'path': os.environ.get('UCAR_LISTING_METADATA'),
+    'filename': 'listing_metadata.sqlite',
+}
+
+doy_directory_pattern = re.compile(r'/(?:19|20)[0-9]{2}/[0-9]{3}/$')
+
+
+def is_doy_directory(url):
+    return doy_directory_pattern.search(url) is not None
+
+
+class ListingMetadataStore:
+    """
+    SQLite store of the entries of every directory listing crawled: per entry its modification time and size as the
+    listing showed them, and per directory the modification time its parent listed for it when it was crawled. Writes
+    are only committed by commit(), so a run that dies before its manifests are written leaves the store as the last
+    complete run saw the site.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+
+        self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS directories (url TEXT PRIMARY KEY, mtime TEXT, "
+                                "crawled_at REAL NOT NULL)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS entries (directory TEXT NOT NULL, href TEXT NOT NULL, "
+                                "mtime TEXT, size INTEGER, PRIMARY KEY (directory, href)) WITHOUT ROWID")
+        self.connection.commit()
+
+    def directory_mtime(self, url):
+        """
+        Returns (recorded, mtime): whether the directory url has been crawled before, and the modification time its
+        parent listed for it then.
+        """
+        with self._lock:
+            row = self.connection.execute("SELECT mtime FROM directories WHERE url = ?", (url,)).fetchone()
+        return (False, None) if row is None else (True, row[0])
+
+    def listing_stamps(self, url):
+        """
+        Returns {href: (mtime, size)} of the directory url's listing as last recorded.
+        """
+        with self._lock:
+            rows = self.connection.execute("SELECT href, mtime, size FROM entries WHERE directory = ?",
+                                           (url,)).fetchall()
+        return {row[0]: (row[1], row[2]) for row in rows}
+
+    def file_sizes(self, file_urls):
+        """
+        Returns {url: size} for the input file urls whose size was shown in their directory listing.
+        """
+        sizes = {}
+        with self._lock:
+            for file_url in file_urls:
+                directory, href = file_url.rsplit('/', 1)
+                row = self.connection.execute("SELECT size FROM entries WHERE directory = ? AND href = ?",
+                                              (directory + '/', href)).fetchone()
+                if row is not None and row[0] is not None:
+                    sizes[file_url] = row[0]
+        return sizes
+
+    def record_listing(self, url, entries, mtime):
+        """
+        Replaces the recorded entries of the directory url and records the modification time listed for it.
+        """
+        with self._lock:
+            self.connection.execute("DELETE FROM entries WHERE directory = ?", (url,))
+            self.connection.executemany("INSERT OR REPLACE INTO entries (directory, href, mtime, size) "
+                                        "VALUES (?, ?, ?, ?)",
+                                        [(url, entry.href, entry.mtime, entry.size) for entry in entries])
+            self.connection.execute("INSERT OR REPLACE INTO directories (url, mtime, crawled_at) VALUES (?, ?, ?)",
+                                    (url, mtime, time.time()))
+
+    def commit(self):
+        with self._lock:
+            self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+class ChangeDetector:
+    """
+    Decides from listing metadata which parts of the tree a crawl has to look at. A doy directory whose listed
+    modification time is the one recorded when it was last crawled is not listed again. In a doy directory that has
+    changed, e.g. a day reprocessed inside an old year, only the files whose modification time or size differ from the
+    last crawl are reported. Year and higher directories are always listed: their modification time only changes when
+    a directory is added or removed directly under them, not when a day inside them is rewritten.
+
+    A doy directory seen for the first time is reported in full, unless it is at or before the high-water mark of its
+    mission, proctype and level in the crawl state (see crawl_state). Those days are taken to be in the manifests
+    already, as check_for_new_ucar_entries assumes, and are only recorded, so the first run with change detection does
+    not report the whole archive as new. A proctype with no mark is not in the manifests and is reported in full.
+    """
+
+    def __init__(self, store, high_water_marks=None, site=None):
+        self.store = store
+        self.site = site or ucar_repo_status.ucar_site
+        self.high_water = {key: year_doy_number(mark['year'], mark['doy'])
+                           for key, mark in (high_water_marks or {}).items()}
+        self.listed_mtimes = {}
+        self.stats = {'skipped_directories': 0, 'changed_directories': 0, 'baseline_directories': 0,
+                      'unchanged_files': 0, 'changed_files': 0}
+
+    def _is_baseline(self, url):
+        fields = url_state_fields(url, self.site)
+        if fields is None:
+            return False
+        mission, proctype, level, year, doy = fields
+        high_water = self.high_water.get((mission, proctype, level))
+        return high_water is not None and year_doy_number(year, doy) <= high_water
+
+    def directories_to_crawl(self, url, entries, dir_urls):
+        """
+        Returns the input directory urls of the listing at url less the doy directories that have not changed since
+        they were last crawled.
+        """
+        mtimes = {url + entry.href: entry.mtime for entry in entries if entry.href.endswith('/')}
+        to_crawl = []
+        for dir_url in dir_urls:
+            mtime = mtimes.get(dir_url)
+            if is_doy_directory(dir_url) and mtime is not None and self.store.directory_mtime(dir_url) == (True, mtime):
+                self.stats['skipped_directories'] += 1
+                continue
+            self.listed_mtimes[dir_url] = mtime
+            to_crawl.append(dir_url)
+        return to_crawl
+
+    def changed_files(self, url, entries, file_urls):
+        """
+        Returns the input file urls of the listing at url that are new or changed since it was last crawled.
+        """
+        if len(file_urls) == 0:
+            return file_urls
+        recorded, _ = self.store.directory_mtime(url)
+        if not recorded:
+            if self._is_baseline(url):
+                self.stats['baseline_directories'] += 1
+                self.stats['unchanged_files'] += len(file_urls)
+                return []
+            self.stats['changed_files'] += len(file_urls)
+            return file_urls
+
+        self.stats['changed_directories'] += 1
+        previous_stamps = self.store.listing_stamps(url)
+        stamps = {url + entry.href: (entry.mtime, entry.size) for entry in entries}
+        changed_urls = [file_url for file_url in file_urls
+                        if previous_stamps.get(file_url[len(url):]) != stamps.get(file_url)
+                        or stamps.get(file_url) == (None, None)]
+        self.stats['changed_files'] += len(changed_urls)
+        self.stats['unchanged_files'] += len(file_urls) - len(changed_urls)
+        return changed_urls
+
+    def record_listing(self, url, entries):
+        self.store.record_listing(url, entries, self.listed_mtimes.pop(url, None))
+
+    def commit(self):
+        """
+        Makes what this run saw the reference for the next one. Call once the files found have been handled, so a run
+        that fails before then finds them again.
+        """
+        self.store.commit()
+
+    def close(self):
+        self.store.close()
+
+    def summary(self):
+        return (f"change detection: {self.stats['skipped_directories']} unchanged doy directories skipped | "
+                f"{self.stats['changed_directories']} changed | {self.stats['baseline_directories']} recorded as a "
+                f"baseline | {self.stats['changed_files']} new or changed files, {self.stats['unchanged_files']} "
+                f"unchanged")
+
+
+def configure_listing_metadata(**config):
+    """
+    Function updates listing_metadata_config with the input keyword arguments (path, filename).
+    :param config:
+    :return listing_metadata_config:
+    """
+    unknown_keys = set(config.keys()).difference(set(listing_metadata_config.keys()))
+    if len(unknown_keys) > 0:
+        raise ValueError(f"unknown listing metadata settings: {sorted(unknown_keys)}")
+
+    listing_metadata_config.update(config)
+
+    return listing_metadata_config
+
+
+def listing_metadata_path():
+    return listing_metadata_config['path'] or os.path.join(ucar_repo_status.ucar_manifests_loc,
+                                                           listing_metadata_config['filename'])
+
+
+def open_change_detector(baseline=True):
+    """
+    Function opens the listing metadata store at the configured path and returns a ChangeDetector over it. With
+    baseline, doy directories up to the crawl state's high-water marks are taken to be in the manifests already.
+    :param baseline:
+    :return change_detector:
+    """
+    high_water_marks = get_crawl_state().high_water_marks() if baseline else None
+
+    return ChangeDetector(ListingMetadataStore(listing_metadata_path()), high_water_marks)
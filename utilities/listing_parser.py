@@ -0,0 +1,153 @@
+import re
+import logging
+from datetime import datetime
+from collections import namedtuple
+from .lazy_import import lazy_module
+
+# html.entities is only loaded when a listing has an escaped href
+html = lazy_module('html')
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Matches the href of every anchor tag in an autoindex page, e.g. <a href="2021/">2021/</a>
+href_pattern = re.compile(r'<a\s[^>]*?href\s*=\s*["\']([^"\']*)["\']', re.IGNORECASE)
+
+# Matches an anchor with the modification time and size autoindex prints after it, in nginx (27-Oct-2021 16:29   1234),
+# Apache <pre> (2021-10-27 16:29  4.0K) or Apache table (<td align="right">2021-10-27 16:29  </td><td ...>4.0K</td>) form
+entry_pattern = re.compile(r'<a\s[^>]*?href\s*=\s*["\']([^"\']*)["\'][^>]*>[^<]*</a>(?:\s|</?td[^>]*>)*'
+                           r'([0-9]{1,2}-[A-Za-z]{3}-[0-9]{4} [0-9]{2}:[0-9]{2}|[0-9]{4}-[0-9]{2}-[0-9]{2} [0-9]{2}:[0-9]{2})'
+                           r'(?::[0-9]{2})?(?:\s|</?td[^>]*>)*([0-9.]+[KMGT]?|-)', re.IGNORECASE)
+size_multipliers = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+# An entry of a directory listing: its href, its modification time as 'YYYY-MM-DD HH:MM' and its size in bytes (None for
+# directories, or if the listing does not show them)
+ListingEntry = namedtuple('ListingEntry', ['href', 'mtime', 'size'])
+
+default_backend = 'regex'
+
+
+def iter_hrefs_regex(page_text):
+    """
+    Function yields the href of each anchor in the input page, in document order, straight from a precompiled regex
+    without building a DOM.
+    :param page_text:
+    :return href generator:
+    """
+    for match in href_pattern.finditer(page_text):
+        href = match.group(1)
+        if '&' in href:
+            href = html.unescape(href)
+        yield href
+
+
+def iter_hrefs_lxml(page_text):
+    """
+    Function yields the href of each anchor in the input page using lxml. Requires lxml to be installed.
+    :param page_text:
+    :return href generator:
+    """
+    import lxml.html
+
+    for href in lxml.html.fromstring(page_text).xpath('//a/@href'):
+        yield str(href)
+
+
+def iter_hrefs_bs4(page_text):
+    """
+    Function yields the href of each anchor in the input page using BeautifulSoup and html.parser. This is the original
+    parse and is kept as a fallback for pages the faster backends get wrong.
+    :param page_text:
+    :return href generator:
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(page_text, 'html.parser')
+    for a_tag in soup.findAll('a'):
+        yield a_tag.attrs.get('href')
+
+
+listing_backends = {
+    'regex': iter_hrefs_regex,
+    'lxml': iter_hrefs_lxml,
+    'bs4': iter_hrefs_bs4,
+}
+
+
+def set_default_backend(backend):
+    """
+    Function sets the backend used by parse_listing_hrefs when none is given.
+    :param backend:
+    :return:
+    """
+    global default_backend
+
+    if backend not in listing_backends:
+        raise ValueError(f"unknown listing parser backend '{backend}', expected one of {sorted(listing_backends)}")
+    default_backend = backend
+
+    return
+
+
+def parse_listing_hrefs(page_text, backend=None):
+    """
+    Function returns the list of hrefs found in a ucar directory listing page. The first entry is the parent directory
+    link, which is why callers skip href_list[0]. If the regex backend finds no anchors at all the page is re-parsed with
+    BeautifulSoup in case it is not a plain autoindex page.
+    :param page_text:
+    :param backend:
+    :return href_list:
+    """
+    if backend is None:
+        backend = default_backend
+
+    href_list = list(listing_backends[backend](page_text))
+    if len(href_list) == 0 and backend == 'regex' and '<a' in page_text.lower():
+        LOGGER.warning("regex listing parser found no hrefs, falling back to BeautifulSoup")
+        href_list = list(iter_hrefs_bs4(page_text))
+
+    return href_list
+
+
+def parse_entry_mtime(stamp):
+    """
+    Function returns an autoindex modification time (27-Oct-2021 16:29 or 2021-10-27 16:29) as 'YYYY-MM-DD HH:MM', so
+    stamps from either layout compare equal.
+    :param stamp:
+    :return mtime:
+    """
+    if stamp[0:4].isdigit() and stamp[4] == '-':
+        return stamp
+    return datetime.strptime(stamp, '%d-%b-%Y %H:%M').strftime('%Y-%m-%d %H:%M')
+
+
+def parse_entry_size(size_text):
+    """
+    Function returns an autoindex size column in bytes: exact for nginx, rounded for Apache's 4.0K style, and None for
+    the '-' of a directory.
+    :param size_text:
+    :return size:
+    """
+    if size_text == '-':
+        return None
+    suffix = size_text[-1].upper() if not size_text[-1].isdigit() else ''
+
+    return int(float(size_text[:len(size_text) - len(suffix)]) * size_multipliers[suffix])
+
+
+def parse_listing_entries(page_text, backend=None):
+    """
+    Function returns the entries of a ucar directory listing page as ListingEntry(href, mtime, size), in the order of
+    parse_listing_hrefs, so entry.href is href_list[i] and the first entry is the parent directory link. The
+    modification time and size printed after each link are read with one regex pass; links without them get None.
+    :param page_text:
+    :param backend:
+    :return entry_list:
+    """
+    href_list = parse_listing_hrefs(page_text, backend)
+    stamps = {}
+    for match in entry_pattern.finditer(page_text):
+        href = html.unescape(match.group(1)) if '&' in match.group(1) else match.group(1)
+        stamps[href] = (parse_entry_mtime(match.group(2)), parse_entry_size(match.group(3)))
+
+    return [ListingEntry(href, *stamps.get(href, (None, None))) for href in href_list]
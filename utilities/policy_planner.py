@@ -0,0 +1,196 @@
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from . import ucar_repo_status
+from .ucar_repo_status import check_new_proctype, get_href_list
+from .crawl_state import year_doy_number
+
+
+LOGGER = logging.getLogger(__name__)
+
+default_planning_workers = 16
+policy_levels = ['level1b/', 'level2/']
+
+
+class CrawlPlan:
+    """
+    Result of evaluating policies.json: the urls the crawl should search, in policy order and without duplicates, the
+    new processing types found per mission, and how long planning took.
+    """
+
+    def __init__(self):
+        self.to_search_urls = []
+        self.new_proc_types = {}
+        self.planning_seconds = 0.0
+        self.task_count = 0
+        self._seen_urls = set()
+
+    def add_urls(self, urls):
+        for url in urls:
+            if url not in self._seen_urls:
+                self._seen_urls.add(url)
+                self.to_search_urls.append(url)
+
+    def summary(self):
+        return (f"crawl plan: {len(self.to_search_urls)} urls to search from {self.task_count} listing checks, "
+                f"planned in {self.planning_seconds:.2f}s")
+
+
+class DateWindow:
+    """
+    Window of a proctype policy as exclusive year/doy bounds, with the same strict comparisons as check_new_doy /
+    check_before_doy: after is the (year, doy) the data must be later than, before the (year, doy) it must be earlier
+    than; either may be None for an open end. Year directories are classified against it before anything below them
+    is listed.
+    """
+
+    def __init__(self, after=None, before=None):
+        self.after = year_doy_number(*after) if after is not None else None
+        self.before = year_doy_number(*before) if before is not None else None
+
+    def contains(self, year, doy):
+        number = year_doy_number(year, doy)
+        return (self.after is None or number > self.after) and (self.before is None or number < self.before)
+
+    def year_coverage(self, year):
+        """
+        Returns 'all' if every day of the input year is inside the window, 'none' if no day is, and 'some' otherwise.
+        """
+        first_day, last_day = year_doy_number(year, 0), year_doy_number(year, 366)
+        if (self.after is not None and last_day <= self.after) or (self.before is not None and first_day >= self.before):
+            return 'none'
+        if (self.after is None or first_day > self.after) and (self.before is None or last_day < self.before):
+            return 'all'
+        return 'some'
+
+    def __eq__(self, other):
+        return isinstance(other, DateWindow) and (self.after, self.before) == (other.after, other.before)
+
+    def __hash__(self):
+        return hash((self.after, self.before))
+
+    def __repr__(self):
+        return f"DateWindow(after={self.after}, before={self.before})"
+
+
+def window_urls(policy_url, window, levels=policy_levels):
+    """
+    Function returns the urls to crawl for the part of a proctype inside a DateWindow. Each level directory is listed
+    once; years entirely inside the window are returned as year urls without listing them, years partly inside are
+    listed and their days inside the window returned as doy urls, and years outside are never fetched. A window of any
+    length costs at most three listings per level.
+    :param policy_url:
+    :param window:
+    :param levels:
+    :return new_url_entries:
+    """
+    new_url_entries = []
+
+    for level in levels:
+        url_with_level = os.path.join(policy_url, level)
+
+        for yr_link in get_href_list(url_with_level)[1:]:
+            the_yr = yr_link.split('/')[0]
+            if not the_yr.isdigit():
+                continue
+
+            coverage = window.year_coverage(the_yr)
+            if coverage == 'all':
+                new_url_entries.append(os.path.join(url_with_level, the_yr, ''))
+            elif coverage == 'some':
+                url_with_year = os.path.join(url_with_level, the_yr, '')
+                for doy_link in get_href_list(url_with_year)[1:]:
+                    doy = doy_link.split('/')[0]
+                    if doy.isdigit() and window.contains(the_yr, doy):
+                        new_url_entries.append(os.path.join(url_with_year, doy, ''))
+
+    return new_url_entries
+
+
+def policy_window(proc_type_policy):
+    """
+    Function returns the DateWindow of a proctype policy, or None for keep_all / keep_none. start_date and end_date are
+    <year>-<doy>... strings.
+    :param proc_type_policy:
+    :return window:
+    """
+    policy = proc_type_policy['policy']
+    start = tuple(proc_type_policy['start_date'].split('-')[:2])
+    end = tuple(proc_type_policy['end_date'].split('-')[:2])
+
+    if policy == 'keep_after':
+        return DateWindow(after=start)
+    if policy == 'keep_before':
+        return DateWindow(before=end)
+    if policy == 'keep_after_and_before':
+        return DateWindow(after=start, before=end)
+    return None
+
+
+def policy_tasks(policy_url, proc_type_policy):
+    """
+    Function returns the listing checks, as (function, args) tuples, that find the urls to search for one proctype
+    policy of policies.json. keep_all needs no listing and is returned as a plain url instead.
+    :param policy_url:
+    :param proc_type_policy:
+    :return tasks:
+    """
+    if proc_type_policy['policy'] == 'keep_all':
+        return [policy_url]
+
+    window = policy_window(proc_type_policy)
+    if window is None:
+        return []
+
+    return [(window_urls, (policy_url, window))]
+
+
+def plan_policies(policy_dict, max_workers=default_planning_workers):
+    """
+    Function evaluates every policy in the input policies.json dictionary and returns a CrawlPlan. All listing checks of
+    all missions run concurrently on a thread pool; identical checks are only run once, and checks that need the same
+    directory listing share one fetch through the listing cache. The urls of the plan come out in the same order as a
+    serial walk of the policies would produce them.
+    :param policy_dict:
+    :param max_workers:
+    :return plan:
+    """
+    start = time.perf_counter()
+    plan = CrawlPlan()
+
+    ordered_tasks = []
+    proctype_checks = {}
+    for mission in policy_dict.keys():
+        proc_type_list = []
+        for proc_type in policy_dict[mission].keys():
+            proc_type_list.append(proc_type)
+            if policy_dict[mission][proc_type]['policy'] != "keep_none":
+                policy_url = os.path.join(ucar_repo_status.ucar_site, mission, proc_type, '')
+                ordered_tasks.extend(policy_tasks(policy_url, policy_dict[mission][proc_type]))
+
+        mission_url = os.path.join(ucar_repo_status.ucar_site, mission, '')
+        proctype_checks[mission] = (check_new_proctype, (mission_url, tuple(proc_type_list)))
+
+    unique_tasks = [task for task in dict.fromkeys(ordered_tasks + list(proctype_checks.values()))
+                    if not isinstance(task, str)]
+    plan.task_count = len(unique_tasks)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        task_futures = {task: executor.submit(task[0], *task[1]) for task in unique_tasks}
+
+        for task in ordered_tasks:
+            if isinstance(task, str):
+                plan.add_urls([task])
+            else:
+                plan.add_urls(task_futures[task].result())
+
+        for mission, task in proctype_checks.items():
+            new_proc_types = task_futures[task].result()
+            if len(new_proc_types) > 0:
+                plan.new_proc_types[mission] = new_proc_types
+
+    plan.planning_seconds = time.perf_counter() - start
+    LOGGER.info(plan.summary())
+
+    return plan
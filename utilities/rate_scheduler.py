@@ -0,0 +1,243 @@
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+from .lazy_import import lazy_module
+
+# only http dates in Retry-After need the email package, which is slow to import
+email_utils = lazy_module('email.utils')
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Settings per traffic class; change with configure_rate_scheduler. rate is requests/s (None for no limit), burst the
+# token bucket size, and the concurrency limit moves between min and max_concurrency: +1 per window of good responses,
+# halved on a throttle reply or when the smoothed latency rises above latency_tolerance x the best latency seen. After a
+# throttle the limit stays below the concurrency that tripped it for probe_interval seconds before probing past it.
+scheduler_config = {
+    'enabled': True,
+    'throttle_statuses': (429, 503),
+    'max_throttle_retries': 6,          # times a throttled request is sent again after waiting out its Retry-After
+    'default_retry_after': 2.0,         # seconds to pause a class after a throttle reply without Retry-After
+    'max_retry_after': 300.0,
+    'classes': {
+        'listing': {'rate': 50.0, 'burst': 50, 'initial_concurrency': 8, 'min_concurrency': 1,
+                    'max_concurrency': 32, 'latency_tolerance': 3.0, 'decrease_factor': 0.5, 'probe_interval': 60.0},
+        # downloads are long and few, their pace is left to the concurrency limit alone
+        'download': {'rate': None, 'burst': 1, 'initial_concurrency': 4, 'min_concurrency': 1,
+                     'max_concurrency': 16, 'latency_tolerance': 3.0, 'decrease_factor': 0.5, 'probe_interval': 60.0},
+    },
+}
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def parse_retry_after(value, now=None):
+    """
+    Function returns the seconds to wait from a Retry-After header, given either as seconds or as an HTTP date, or None
+    if it cannot be parsed.
+    :param value:
+    :param now:
+    :return seconds:
+    """
+    if value is None:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email_utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+
+    return max(0.0, (retry_at - (now or datetime.now(timezone.utc))).total_seconds())
+
+
+class AdaptiveScheduler:
+    """
+    Admission control for one traffic class (listings or downloads). A request takes a token from a token bucket
+    refilled at rate per second, then a slot under the concurrency limit, and gives the slot back with the outcome when
+    it is done. The limit is AIMD: it grows by one per limit good responses and is cut by decrease_factor, at most once
+    per smoothed latency, when the server answers 429/503 or latency climbs past latency_tolerance x the best seen. A
+    Retry-After pauses the whole class until it has passed, and the limit that was throttled becomes a ceiling for
+    probe_interval seconds, so the limit settles just under what the server accepts instead of tripping it again
+    every few round trips.
+    """
+
+    def __init__(self, name, rate=None, burst=1, initial_concurrency=8, min_concurrency=1, max_concurrency=32,
+                 latency_tolerance=3.0, decrease_factor=0.5, probe_interval=60.0):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.latency_tolerance = latency_tolerance
+        self.decrease_factor = decrease_factor
+        self.probe_interval = probe_interval
+
+        self.limit = float(min(max(initial_concurrency, min_concurrency), max_concurrency))
+        self.in_flight = 0
+        self.tokens = float(self.burst)
+        self.last_refill = time.monotonic()
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.throttled_limit = None
+        self.last_throttle = 0.0
+        self.best_latency = None
+        self.smoothed_latency = None
+
+        self.stats = {'requests': 0, 'throttled': 0, 'decreases': 0, 'wait_seconds': 0.0, 'peak_limit': self.limit}
+        self._condition = threading.Condition()
+
+    def _refill(self, now):
+        if self.rate is None:
+            self.tokens = float(self.burst)
+        else:
+            self.tokens = min(float(self.burst), self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self):
+        """
+        Blocks until the class is not paused, a token is available and a slot is free under the concurrency limit.
+        """
+        start = time.monotonic()
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.in_flight >= int(self.limit):
+                    wait = None
+                elif self.tokens < 1.0:
+                    wait = (1.0 - self.tokens) / self.rate
+                else:
+                    self.tokens -= 1.0
+                    self.in_flight += 1
+                    self.stats['requests'] += 1
+                    self.stats['wait_seconds'] += now - start
+                    return
+                self._condition.wait(wait)
+
+    def release(self, latency=None, throttled=False, retry_after=None):
+        """
+        Gives back a slot with the outcome of the request: its latency (time to the response headers), whether the
+        server throttled it and the Retry-After it sent.
+        """
+        with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                self.stats['throttled'] += 1
+                pause = retry_after if retry_after is not None else scheduler_config['default_retry_after']
+                self.paused_until = max(self.paused_until, now + min(pause, scheduler_config['max_retry_after']))
+                if now - self.last_decrease >= (self.smoothed_latency or 0.1):
+                    self.throttled_limit, self.last_throttle = int(self.limit), now
+                self._decrease(now, f"throttled, pausing {pause:.1f}s")
+            elif latency is not None:
+                self._observe_latency(now, latency)
+            self._condition.notify_all()
+
+    def _observe_latency(self, now, latency):
+        self.best_latency = latency if self.best_latency is None else min(self.best_latency, latency)
+        self.smoothed_latency = latency if self.smoothed_latency is None else \
+            0.8 * self.smoothed_latency + 0.2 * latency
+        if self.smoothed_latency > self.best_latency * self.latency_tolerance and \
+                self.smoothed_latency - self.best_latency > 0.05:
+            self._decrease(now, f"latency {self.smoothed_latency:.3f}s against a best of {self.best_latency:.3f}s")
+        elif self.in_flight + 1 >= int(self.limit):
+            # only grow while the limit is actually being used
+            ceiling = self.max_concurrency
+            if self.throttled_limit is not None and now - self.last_throttle < self.probe_interval:
+                ceiling = max(self.min_concurrency, self.throttled_limit - 1)
+            if self.limit < ceiling:
+                self.limit = min(float(ceiling), self.limit + 1.0 / self.limit)
+                self.stats['peak_limit'] = max(self.stats['peak_limit'], self.limit)
+
+    def _decrease(self, now, reason):
+        # one cut per round trip, the other replies in flight saw the same congestion
+        if now - self.last_decrease < (self.smoothed_latency or 0.1):
+            return
+        self.last_decrease = now
+        self.limit = max(float(self.min_concurrency), self.limit * self.decrease_factor)
+        self.stats['decreases'] += 1
+        LOGGER.info(f"{self.name} concurrency cut to {int(self.limit)}: {reason}")
+
+    def summary(self):
+        return (f"{self.name} scheduler: {self.stats['requests']} requests | {self.stats['throttled']} throttled | "
+                f"{self.stats['decreases']} decreases | concurrency now {int(self.limit)} "
+                f"(peak {int(self.stats['peak_limit'])}) | {self.stats['wait_seconds']:.1f}s waiting")
+
+
+def configure_rate_scheduler(**config):
+    """
+    Function updates scheduler_config with the input keyword arguments. classes is merged per class, e.g.
+    configure_rate_scheduler(classes={'download': {'rate': 2.0}}). The schedulers are rebuilt on next use.
+    :param config:
+    :return scheduler_config:
+    """
+    unknown_keys = set(config.keys()).difference(set(scheduler_config.keys()))
+    if len(unknown_keys) > 0:
+        raise ValueError(f"unknown rate scheduler settings: {sorted(unknown_keys)}")
+
+    with _schedulers_lock:
+        for traffic_class, class_config in config.pop('classes', {}).items():
+            scheduler_config['classes'].setdefault(traffic_class, {}).update(class_config)
+        scheduler_config.update(config)
+        _schedulers.clear()
+
+    return scheduler_config
+
+
+def scheduler_share(shares):
+    """
+    Function returns a copy of scheduler_config with the rate, burst and concurrency of every class divided by the
+    input number of shares, for worker processes that each run their own schedulers against the same server.
+    :param shares:
+    :return share_config:
+    """
+    share_config = dict(scheduler_config)
+    share_config['classes'] = {}
+    for traffic_class, class_config in scheduler_config['classes'].items():
+        class_share = dict(class_config)
+        if class_share['rate'] is not None:
+            class_share['rate'] = class_share['rate'] / shares
+        for key in ('burst', 'initial_concurrency', 'max_concurrency'):
+            class_share[key] = max(class_share['min_concurrency'] if key != 'burst' else 1, class_share[key] // shares)
+        share_config['classes'][traffic_class] = class_share
+
+    return share_config
+
+
+def get_scheduler(traffic_class):
+    """
+    Function returns the shared AdaptiveScheduler of the input traffic class, or None if scheduling is disabled.
+    :param traffic_class:
+    :return scheduler:
+    """
+    if not scheduler_config['enabled']:
+        return None
+
+    scheduler = _schedulers.get(traffic_class)
+    if scheduler is None:
+        with _schedulers_lock:
+            scheduler = _schedulers.get(traffic_class)
+            if scheduler is None:
+                scheduler = _schedulers[traffic_class] = AdaptiveScheduler(
+                    traffic_class, **scheduler_config['classes'][traffic_class])
+
+    return scheduler
+
+
+def format_scheduler_summary():
+    """
+    Function returns a summary of each traffic class's scheduler for the run summary, and logs it.
+    :return summary:
+    """
+    summary = '\n'.join([scheduler.summary() for scheduler in list(_schedulers.values())]) or "rate scheduler: unused"
+    LOGGER.info(summary)
+
+    return summary
@@ -0,0 +1,218 @@
+import os
+import re
+import time
+import random
+import logging
+from .http_client import http_get, http_head, response_retries
+from .instrumentation import timed
+from .lazy_import import lazy_module
+
+requests = lazy_module('requests')
+hashlib = lazy_module('hashlib')
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Settings for download_with_resume; change with configure_downloads
+download_config = {
+    'max_attempts': 8,          # requests per file before giving up, each one resuming where the last stopped
+    'base_backoff': 0.5,        # seconds, doubled per attempt with full jitter
+    'max_backoff': 30.0,
+    'part_suffix': '.part',     # an incomplete download is kept as <file><part_suffix> until it is verified
+}
+
+content_range_pattern = re.compile(r'bytes\s+(?:[0-9]+-[0-9]+|\*)/([0-9]+)')
+
+
+class IncompleteDownload(IOError):
+    """
+    The server ended a response before the whole file had arrived.
+    """
+
+
+def resumable_errors():
+    """
+    Function returns the errors after which the rest of the body can be asked for again: connection drops, truncated
+    bodies and timeouts, and incomplete downloads.
+    :return error_types:
+    """
+    return requests.ConnectionError, requests.exceptions.ChunkedEncodingError, requests.Timeout, IncompleteDownload
+
+
+def configure_downloads(**config):
+    """
+    Function updates download_config with the input keyword arguments (max_attempts, base_backoff, max_backoff,
+    part_suffix).
+    :param config:
+    :return download_config:
+    """
+    unknown_keys = set(config.keys()).difference(set(download_config.keys()))
+    if len(unknown_keys) > 0:
+        raise ValueError(f"unknown download settings: {sorted(unknown_keys)}")
+
+    download_config.update(config)
+
+    return download_config
+
+
+def backoff_seconds(attempt):
+    return random.uniform(0, min(download_config['max_backoff'], download_config['base_backoff'] * 2 ** attempt))
+
+
+def remote_file_size(url):
+    """
+    Function returns the size of the file at the input url from the Content-Length of a HEAD request, or None if the
+    server does not give one.
+    :param url:
+    :return size:
+    """
+    response = http_head(url, traffic_class='download', allow_redirects=True)
+    response.raise_for_status()
+    content_length = response.headers.get('Content-Length')
+
+    return int(content_length) if content_length is not None else None
+
+
+def response_total_size(response):
+    """
+    Function returns the full size of the file a GET response is part of: the total of a 206 Content-Range, or the
+    Content-Length of a 200. None if the server gives neither.
+    :param response:
+    :return size:
+    """
+    if response.status_code in (206, 416):
+        range_match = content_range_pattern.match(response.headers.get('Content-Range', ''))
+        return int(range_match.group(1)) if range_match is not None else None
+
+    content_length = response.headers.get('Content-Length')
+    return int(content_length) if content_length is not None else None
+
+
+def file_checksum(path, algorithm, chunk_size=1024 * 1024):
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as the_file:
+        for chunk in iter(lambda: the_file.read(chunk_size), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def checksum_matches(path, checksum):
+    """
+    Function checks the file at path against a '<algorithm>:<hex digest>' checksum (for example 'md5:9e10...'). A
+    checksum of None always matches.
+    :param path:
+    :param checksum:
+    :return matches:
+    """
+    if checksum is None:
+        return True
+    algorithm, expected_digest = checksum.split(':', 1)
+
+    return file_checksum(path, algorithm) == expected_digest.lower()
+
+
+def is_complete_file(path, expected_size, checksum=None):
+    """
+    Function returns whether the file at path exists, has the expected size and matches the checksum, if given.
+    :param path:
+    :param expected_size:
+    :param checksum:
+    :return is_complete:
+    """
+    if expected_size is None or not os.path.exists(path) or os.path.getsize(path) != expected_size:
+        return False
+
+    return checksum_matches(path, checksum)
+
+
+def _fetch_rest(url, part_path, chunk_size, measurement, expected_size):
+    """
+    Appends the bytes of url from the current size of part_path onwards, with a Range request when there is a partial
+    file. Returns the full size of the file as reported by the server, or None if it did not say. If the file has
+    changed size since the partial file was started, the partial file is dropped.
+    """
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {'Range': f"bytes={offset}-"} if offset > 0 else {}
+
+    with http_get(url, stream=True, headers=headers) as response:
+        measurement.retries += response_retries(response)
+        total_size = response_total_size(response)
+        if response.status_code == 416:
+            # nothing past offset, the partial file is already the whole file if the sizes agree
+            if total_size != offset:
+                os.remove(part_path)
+                raise IncompleteDownload(f"{url}: partial file of {offset} bytes does not match {total_size} bytes")
+            return total_size
+        response.raise_for_status()
+
+        # a server that ignores Range answers 200 with the whole body, which then replaces the partial file
+        mode = 'ab' if response.status_code == 206 else 'wb'
+        if mode == 'ab' and expected_size is not None and total_size is not None and total_size != expected_size:
+            os.remove(part_path)
+            raise IncompleteDownload(f"{url} changed from {expected_size} to {total_size} bytes, starting over")
+        if mode == 'ab':
+            LOGGER.info(f"resuming {url} at byte {offset} of {total_size}")
+        with open(part_path, mode) as part_file:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                part_file.write(chunk)
+                measurement.add_bytes(len(chunk))
+
+    return total_size
+
+
+def download_with_resume(url, full_path, chunk_size=8192, expected_size=None, checksum=None):
+    """
+    Function downloads the file at the input url to full_path so that an interrupted transfer is continued instead of
+    started over, and returns full_path. A file already at full_path with the remote size (from expected_size or a HEAD
+    request) and checksum is kept without downloading. Otherwise the body is written to <full_path>.part; after a
+    dropped connection or a short body the rest is requested with an HTTP Range from the end of the partial file, up to
+    max_attempts requests with backoff. The file is only moved to full_path once its size matches the Content-Length /
+    Content-Range total and its checksum, if given ('<algorithm>:<hex digest>'), matches, so a truncated file never
+    appears at full_path. Raises IOError if that cannot be achieved.
+    :param url:
+    :param full_path:
+    :param chunk_size:
+    :param expected_size:
+    :param checksum:
+    :return full_path:
+    """
+    if os.path.exists(full_path):
+        if expected_size is None:
+            expected_size = remote_file_size(url)
+        if is_complete_file(full_path, expected_size, checksum):
+            LOGGER.info(f"{full_path} is already complete, skipping download")
+            return full_path
+
+    part_path = full_path + download_config['part_suffix']
+    if os.path.exists(full_path) and not os.path.exists(part_path) and expected_size is not None \
+            and os.path.getsize(full_path) < expected_size and checksum is None:
+        # a truncated file left by an earlier download is resumed like a partial file
+        os.replace(full_path, part_path)
+
+    with timed('download') as measurement:
+        attempt = 0
+        while True:
+            if expected_size is not None and os.path.exists(part_path) and os.path.getsize(part_path) > expected_size:
+                os.remove(part_path)
+            try:
+                total_size = _fetch_rest(url, part_path, chunk_size, measurement, expected_size)
+                expected_size = total_size if total_size is not None else expected_size
+                received_size = os.path.getsize(part_path)
+                if expected_size is not None and received_size != expected_size:
+                    raise IncompleteDownload(f"{url}: received {received_size} of {expected_size} bytes")
+                break
+            except resumable_errors() as e:
+                attempt += 1
+                measurement.retries += 1
+                if attempt >= download_config['max_attempts']:
+                    raise IOError(f"{url}: download incomplete after {attempt} attempts: {e}") from e
+                LOGGER.warning(f"download of {url} interrupted ({e}), retry {attempt}")
+                time.sleep(backoff_seconds(attempt))
+
+        if not checksum_matches(part_path, checksum):
+            os.remove(part_path)
+            raise IOError(f"{url}: checksum mismatch, expected {checksum}")
+        os.replace(part_path, full_path)
+
+    return full_path
@@ -0,0 +1,221 @@
+import io
+import os
+import csv
+import gzip
+import glob
+import json
+import logging
+from datetime import date
+from urllib.parse import unquote_plus, urlsplit
+from concurrent.futures import ThreadPoolExecutor
+from .key_index import load_key_index
+from .ucar_repo_status import check_if_correct_level
+
+
+LOGGER = logging.getLogger(__name__)
+
+catalog_filetypes = ['conPhs', 'atmPhs', 'atmPrf', 'wetPrf', 'wetPf2']
+default_list_workers = 16
+
+
+def is_catalog_key(obj_key):
+    """
+    Function returns True if the input s3 key is one of the filetypes kept in the obj key file.
+    :param obj_key:
+    :return True/False:
+    """
+    for filetype in catalog_filetypes:
+        if filetype in obj_key:
+            return True
+    return False
+
+
+def touched_prefixes(ucar_keys):
+    """
+    Function returns the sorted, de-duplicated day of year directory prefixes of the input s3 keys / ucar paths, i.e.
+    the parts of the bucket a run has written to.
+    :param ucar_keys:
+    :return prefixes:
+    """
+    return sorted(set([os.path.join(os.path.dirname(ucar_key), '') for ucar_key in ucar_keys]))
+
+
+def list_child_prefixes(s3_client, bucket_name, prefix):
+    """
+    Function returns the 'sub-directories' directly under the input prefix using a delimited list_objects_v2.
+    :param s3_client:
+    :param bucket_name:
+    :param prefix:
+    :return child_prefixes:
+    """
+    child_prefixes = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix, Delimiter='/'):
+        for common_prefix in page.get('CommonPrefixes', []):
+            child_prefixes.append(common_prefix['Prefix'])
+
+    return child_prefixes
+
+
+def list_prefix_keys(s3_client, bucket_name, prefix):
+    """
+    Function returns every catalog key under the input prefix.
+    :param s3_client:
+    :param bucket_name:
+    :param prefix:
+    :return obj_keys:
+    """
+    obj_keys = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            if is_catalog_key(obj['Key']):
+                obj_keys.append(obj['Key'])
+
+    return obj_keys
+
+
+def list_prefixes_parallel(s3_client, bucket_name, prefixes, max_workers=default_list_workers, shard_depth=0):
+    """
+    Function lists the catalog keys under each input prefix with max_workers concurrent list_objects_v2 calls. With
+    shard_depth > 0 each prefix is first split into its child prefixes that many levels down (for example a mission
+    prefix into its proctypes), so a single broad prefix is also listed in parallel. Returns the sorted keys.
+    :param s3_client:
+    :param bucket_name:
+    :param prefixes:
+    :param max_workers:
+    :param shard_depth:
+    :return obj_keys:
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        shards = list(prefixes)
+        for _ in range(shard_depth):
+            child_lists = list(executor.map(lambda prefix: list_child_prefixes(s3_client, bucket_name, prefix), shards))
+            # a prefix without children holds its objects directly and is listed as is
+            shards = [child for prefix, children in zip(shards, child_lists) for child in (children or [prefix])]
+
+        LOGGER.info(f"listing {len(shards)} prefixes of {bucket_name}")
+        key_lists = executor.map(lambda prefix: list_prefix_keys(s3_client, bucket_name, prefix), shards)
+        obj_keys = sorted(set([obj_key for key_list in key_lists for obj_key in key_list]))
+
+    return obj_keys
+
+
+def write_obj_key_file(obj_keys, file_path):
+    """
+    Function writes the input keys to an obj key file, one per line. The file is replaced atomically so a reader never
+    sees a partial file.
+    :param obj_keys:
+    :param file_path:
+    :return file_path:
+    """
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, 'w') as new_obj_file:
+        for obj_key in obj_keys:
+            new_obj_file.write(f"{obj_key}\n")
+    os.replace(tmp_path, file_path)
+
+    return file_path
+
+
+def find_latest_obj_key_file(directory):
+    """
+    Function returns the most recent s3_obj_keys_<date>.txt file in the input directory, or None if there is none.
+    :param directory:
+    :return file_path:
+    """
+    obj_key_files = sorted(glob.glob(os.path.join(directory, 's3_obj_keys_*.txt')))
+    if len(obj_key_files) == 0:
+        return None
+
+    return obj_key_files[-1]
+
+
+def split_s3_url(s3_url):
+    """
+    Function splits an s3://bucket/key url into its bucket and key.
+    :param s3_url:
+    :return bucket_name, key:
+    """
+    url_parts = urlsplit(s3_url)
+    if url_parts.scheme != 's3' or url_parts.netloc == '' or url_parts.path in ('', '/'):
+        raise ValueError(f"expected an s3://bucket/key url, got '{s3_url}'")
+
+    return url_parts.netloc, url_parts.path.lstrip('/')
+
+
+def sync_obj_key_file(bucket, prefixes, base_obj_key_file, max_workers=default_list_workers, shard_depth=0,
+                      inventory_manifest=None, output_dir='.'):
+    """
+    Function brings an obj key file up to date by listing only the input prefixes of the bucket instead of the whole
+    bucket. Keys of the base file under those prefixes are replaced by what the listing returns, every other key is kept
+    as is. With inventory_manifest, the s3:// url of an S3 Inventory manifest.json, the keys of the report are merged
+    into the base keys first, so objects written outside this run's prefixes are picked up too; the listing still
+    decides the keys under its prefixes, as it is newer than any report. Only keys that pass check_if_correct_level are
+    kept, as in the key index. The merged keys are written to s3_obj_keys_<date>.txt in output_dir, which
+    load_key_index then indexes, and the path is returned.
+    :param bucket:
+    :param prefixes:
+    :param base_obj_key_file:
+    :param max_workers:
+    :param shard_depth: split each prefix into its child prefixes this many levels down before listing
+    :param inventory_manifest:
+    :param output_dir:
+    :return file_loc:
+    """
+    prefixes = sorted(set(prefixes))
+    listed_keys = list_prefixes_parallel(bucket.meta.client, bucket.name, prefixes, max_workers=max_workers,
+                                         shard_depth=shard_depth)
+    listed_keys = [obj_key for obj_key in listed_keys if check_if_correct_level(obj_key)]
+
+    base_keys = load_key_index(base_obj_key_file).keys()
+    known_keys = set(base_keys)
+    if inventory_manifest is not None:
+        manifest_bucket, manifest_key = split_s3_url(inventory_manifest)
+        inventory_keys = read_inventory_manifest(bucket.meta.client, manifest_bucket, manifest_key)
+        known_keys.update(obj_key for obj_key in inventory_keys if check_if_correct_level(obj_key))
+    if len(prefixes) > 0:
+        prefix_tuple = tuple(prefixes)
+        kept_keys = [obj_key for obj_key in known_keys if not obj_key.startswith(prefix_tuple)]
+    else:
+        kept_keys = known_keys
+    merged_keys = sorted(set(kept_keys).union(listed_keys))
+    LOGGER.info(f"obj key sync: {len(prefixes)} prefixes listed, {len(listed_keys)} keys found, "
+                f"{len(known_keys) - len(base_keys)} keys added from the inventory, "
+                f"{len(merged_keys) - len(base_keys)} keys net change")
+
+    filename = f"s3_obj_keys_{date.today().isoformat()}.txt"
+    return write_obj_key_file(merged_keys, os.path.join(output_dir, filename))
+
+
+def read_inventory_manifest(s3_client, manifest_bucket, manifest_key):
+    """
+    Function reads an S3 Inventory report and returns the catalog keys it lists. manifest_key is the manifest.json of
+    the report; its data files are read from manifest_bucket. CSV reports are read directly, Parquet reports need
+    pyarrow.
+    :param s3_client:
+    :param manifest_bucket:
+    :param manifest_key:
+    :return obj_keys:
+    """
+    manifest = json.loads(s3_client.get_object(Bucket=manifest_bucket, Key=manifest_key)['Body'].read())
+    file_format = manifest.get('fileFormat', 'CSV').upper()
+    schema = [column.strip() for column in manifest.get('fileSchema', 'Bucket, Key').split(',')]
+
+    obj_keys = []
+    for data_file in manifest['files']:
+        body = s3_client.get_object(Bucket=manifest_bucket, Key=data_file['key'])['Body'].read()
+        if file_format == 'CSV':
+            key_column = schema.index('Key')
+            rows = csv.reader(gzip.decompress(body).decode().splitlines())
+            # keys in CSV inventory reports are url encoded
+            file_keys = [unquote_plus(row[key_column]) for row in rows]
+        elif file_format == 'PARQUET':
+            import pyarrow.parquet as pq
+            file_keys = pq.read_table(io.BytesIO(body), columns=['key']).column('key').to_pylist()
+        else:
+            raise ValueError(f"unsupported S3 Inventory format '{file_format}' in {manifest_key}")
+        obj_keys.extend([obj_key for obj_key in file_keys if is_catalog_key(obj_key)])
+
+    LOGGER.info(f"read {len(obj_keys)} catalog keys from inventory {manifest_key}")
+    return sorted(set(obj_keys))
@@ -0,0 +1,165 @@
+import os
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from . import listing_parser
+from .http_client import http_config, configure_http_client
+from .listing_cache import listing_cache_config, configure_listing_cache
+from .rate_scheduler import configure_rate_scheduler, scheduler_share
+from .url_dedupe import url_dedupe_config, configure_url_dedupe
+from .async_crawler import AsyncCrawler, ManifestRecorder, fetch_href_list
+from .url_classifier import crawl_listing_actions
+from .instrumentation import take_metrics, merge_metrics
+from .crawl_checkpoint import open_crawl_checkpoint
+from .lazy_import import lazy_module
+
+asyncio = lazy_module('asyncio')
+multiprocessing = lazy_module('multiprocessing')
+
+
+LOGGER = logging.getLogger(__name__)
+
+default_threads_per_process = 8
+shards_per_process = 4
+max_expand_depth = 4
+
+
+def _try_fetch_href_list(url):
+    try:
+        return fetch_href_list(url)
+    except Exception as e:
+        LOGGER.warning(f"could not expand {url}, leaving it as a shard: {e}")
+        return None
+
+
+def expand_shards(start_urls, min_shards, max_depth=max_expand_depth, max_workers=16, checkpoint=None):
+    """
+    Function splits the input crawl urls into smaller independent shards by listing them level by level (mission ->
+    proctype -> level -> year ...) until there are at least min_shards of them or max_depth levels have been expanded.
+    The same links are followed as in the crawl itself. Returns the shard urls and any .tar.gz urls met on the way.
+    With a checkpoint each expanded listing is recorded, which leaves the shards as its pending directories.
+    :param start_urls:
+    :param min_shards:
+    :param max_depth:
+    :param max_workers:
+    :param checkpoint:
+    :return shard_urls, found_urls:
+    """
+    shard_urls = list(dict.fromkeys(start_urls))
+    found_urls = []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        depth = 0
+        while len(shard_urls) < min_shards and depth < max_depth:
+            next_shard_urls = []
+            for url, href_list in zip(shard_urls, executor.map(_try_fetch_href_list, shard_urls)):
+                if href_list is None:
+                    next_shard_urls.append(url)
+                    continue
+                file_urls, dir_urls = crawl_listing_actions(url, href_list[1:])
+                if checkpoint is not None:
+                    checkpoint.record_listing(url, dir_urls, file_urls)
+                found_urls.extend(file_urls)
+                next_shard_urls.extend(dir_urls)
+            shard_urls = list(dict.fromkeys(next_shard_urls))
+            depth += 1
+
+    return shard_urls, found_urls
+
+
+def _init_worker(http_settings, listing_cache_settings, scheduler_settings, url_dedupe_settings, parser_backend):
+    # worker processes are spawned fresh, so carry over the parent's client settings
+    configure_http_client(**http_settings)
+    configure_listing_cache(**listing_cache_settings)
+    configure_rate_scheduler(**scheduler_settings)
+    configure_url_dedupe(**url_dedupe_settings)
+    listing_parser.set_default_backend(parser_backend)
+
+
+def crawl_shard(shard_url, threads=default_threads_per_process):
+    """
+    Function crawls a single shard in a worker process and returns its results explicitly instead of writing them to
+    globals or manifests: the shard url, the sorted .tar.gz urls found under it, the listings that failed and the
+    instrumentation metrics of the shard's calls.
+    :param shard_url:
+    :param threads:
+    :return shard_url, found_urls, failed_urls, metrics:
+    """
+    crawler = AsyncCrawler(max_workers=threads, per_host_limit=threads)
+    found_urls = asyncio.run(crawler.crawl([shard_url]))
+
+    return shard_url, found_urls, crawler.failed_urls, take_metrics()
+
+
+def sharded_crawl(start_urls, processes=None, threads_per_process=default_threads_per_process, checkpoint=None):
+    """
+    Function crawls the input urls with a pool of worker processes so parsing runs on every core. The urls are first
+    expanded into shards (proctype / level / year directories), each shard is crawled by one worker, and the parent
+    merges what the workers return. The merged list is sorted, so the result does not depend on which worker finished
+    first. With a CrawlCheckpoint each shard is recorded as it comes back, and a resumed checkpoint only crawls the
+    shards that had not finished (or had failed listings) when the earlier run stopped.
+    :param start_urls:
+    :param processes:
+    :param threads_per_process:
+    :param checkpoint:
+    :return found_urls:
+    """
+    processes = processes or os.cpu_count() or 1
+    if checkpoint is not None and checkpoint.resumed:
+        shard_urls, found_urls = checkpoint.pending_urls(), checkpoint.file_urls()
+    else:
+        shard_urls, found_urls = expand_shards(start_urls, min_shards=processes * shards_per_process,
+                                               checkpoint=checkpoint)
+    LOGGER.info(f"sharded crawl: {len(shard_urls)} shards over {processes} processes")
+
+    merged_urls = set(found_urls)
+    failed_urls = []
+    context = multiprocessing.get_context('spawn')
+    # each worker schedules its own traffic, so it gets an even share of the rate and concurrency limits
+    init_args = (dict(http_config), dict(listing_cache_config), scheduler_share(processes),
+                 dict(url_dedupe_config), listing_parser.default_backend)
+    with context.Pool(processes, initializer=_init_worker, initargs=init_args) as pool:
+        shard_results = pool.imap_unordered(functools.partial(crawl_shard, threads=threads_per_process), shard_urls)
+        for shard_url, shard_found_urls, shard_failed_urls, shard_metrics in shard_results:
+            merged_urls.update(shard_found_urls)
+            failed_urls.extend(shard_failed_urls)
+            merge_metrics(shard_metrics)
+            if checkpoint is not None:
+                # a shard with failed listings is crawled again in full on resume
+                checkpoint.record_listing(shard_url, [], shard_found_urls)
+                if len(shard_failed_urls) > 0:
+                    checkpoint.record_failure(shard_url)
+                checkpoint.commit()
+
+    if checkpoint is not None:
+        checkpoint.finish()
+
+    if len(failed_urls) > 0:
+        LOGGER.warning(f"{len(failed_urls)} listings failed: {failed_urls}")
+
+    return sorted(merged_urls)
+
+
+def sharded_crawl_to_manifests(start_urls, processes=None, threads_per_process=default_threads_per_process):
+    """
+    Function runs sharded_crawl over the input urls and records the merged results in the global ucar_urls list and the
+    mission manifests, in sorted order. The crawl is checkpointed per shard and resumes if an earlier run of the same
+    urls died part way. Returns the urls found.
+    :param start_urls:
+    :param processes:
+    :param threads_per_process:
+    :return found_urls:
+    """
+    checkpoint = open_crawl_checkpoint(start_urls)
+    try:
+        found_urls = sharded_crawl(start_urls, processes=processes, threads_per_process=threads_per_process,
+                                   checkpoint=checkpoint)
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
+
+    with ManifestRecorder() as record_file:
+        for found_url in found_urls:
+            record_file(found_url)
+
+    return found_urls
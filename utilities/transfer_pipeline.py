@@ -0,0 +1,355 @@
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from . import ucar_repo_status
+from .http_client import http_get
+from .ucar_repo_status import download_file
+from .instrumentation import record_call
+from .download_scheduler import schedule_downloads
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Defaults for run_transfer_pipeline
+pipeline_config = {
+    'mode': 'spool',                    # 'spool' through the local mirror or 'stream' straight from ucar to s3
+    'download_workers': 4,              # in stream mode, the number of concurrent transfers
+    'upload_workers': 4,
+    'queue_size': 8,                    # downloaded files waiting for upload; downloaders block when it is full
+    'download_chunk_size': 1024 * 1024,
+    'stream_part_size': 16 * 1024 * 1024,
+    'stream_parts_in_flight': 2,        # part buffers held per streamed file, caps its memory at this * part size
+    'download_order': None,             # download policy, see download_scheduler; None uses its configured policy
+}
+
+# s3 rejects multipart parts smaller than this, except for the last one
+min_part_size = 5 * 1024 * 1024
+
+_stop = object()
+
+
+class StageMetrics:
+    """
+    Thread-safe counters for one stage of the transfer pipeline: files done, bytes moved, files failed and the time
+    workers spent busy. Throughput is measured over the stage's wall time.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.files = 0
+        self.bytes = 0
+        self.failed = []
+        self.busy_seconds = 0.0
+        self.start_time = None
+        self.end_time = None
+        self._lock = threading.Lock()
+
+    def record(self, num_bytes, seconds):
+        with self._lock:
+            self.files += 1
+            self.bytes += num_bytes
+            self.busy_seconds += seconds
+            return self.files
+
+    def record_failure(self, url):
+        with self._lock:
+            self.failed.append(url)
+
+    def wall_seconds(self):
+        if self.start_time is None:
+            return 0.0
+        return (self.end_time or time.perf_counter()) - self.start_time
+
+    def as_dict(self):
+        wall = self.wall_seconds()
+        return {'stage': self.name, 'files': self.files, 'bytes': self.bytes, 'failed': len(self.failed),
+                'wall_seconds': wall, 'busy_seconds': self.busy_seconds,
+                'mb_per_second': self.bytes / wall / 1e6 if wall > 0 else 0.0}
+
+    def summary(self):
+        stats = self.as_dict()
+        return (f"{self.name}: {stats['files']} files, {stats['bytes'] / 1e6:.1f} MB in {stats['wall_seconds']:.1f}s "
+                f"({stats['mb_per_second']:.2f} MB/s), {stats['failed']} failed")
+
+
+class BufferAccount:
+    """
+    Tracks the bytes held in streaming part buffers across all transfers, and the peak reached.
+    """
+
+    def __init__(self):
+        self.current_bytes = 0
+        self.peak_bytes = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, num_bytes):
+        with self._lock:
+            self.current_bytes += num_bytes
+            self.peak_bytes = max(self.peak_bytes, self.current_bytes)
+
+    def release(self, num_bytes):
+        with self._lock:
+            self.current_bytes -= num_bytes
+
+
+def ucar_url_to_s3_key(url):
+    return url.replace(ucar_repo_status.ucar_site, '')
+
+
+def read_part(raw_stream, part_size):
+    """
+    Function reads up to part_size bytes from the input raw http stream, returning fewer only at the end of the body.
+    :param raw_stream:
+    :param part_size:
+    :return part:
+    """
+    part = bytearray()
+    while len(part) < part_size:
+        chunk = raw_stream.read(part_size - len(part))
+        if not chunk:
+            break
+        part.extend(chunk)
+
+    return part
+
+
+def stream_file_to_s3(url, s3_client, bucket_name, key, part_size=None, parts_in_flight=None, buffer_account=None):
+    """
+    Function streams the file at the input ucar url straight into s3 without touching local disk. The http body is read
+    in part_size buffers that are sent as the parts of a multipart upload; a file smaller than one part is sent with a
+    single put_object. At most parts_in_flight buffers are held at a time, which caps the memory of a transfer at
+    part_size * parts_in_flight. Nothing is written to the key if the body is shorter than its Content-Length or
+    anything fails: the put_object is not made or the multipart upload is aborted, so an existing object is kept.
+    Returns the number of bytes transferred.
+    :param url:
+    :param s3_client:
+    :param bucket_name:
+    :param key:
+    :param part_size:
+    :param parts_in_flight:
+    :param buffer_account:
+    :return num_bytes:
+    """
+    part_size = part_size or pipeline_config['stream_part_size']
+    parts_in_flight = parts_in_flight or pipeline_config['stream_parts_in_flight']
+    if part_size < min_part_size:
+        raise ValueError(f"part_size must be at least {min_part_size} bytes for s3 multipart uploads")
+    if buffer_account is None:
+        buffer_account = BufferAccount()
+
+    free_buffers = threading.BoundedSemaphore(parts_in_flight)
+
+    with http_get(url, stream=True) as response:
+        response.raise_for_status()
+        expected_bytes = response.headers.get('Content-Length')
+
+        free_buffers.acquire()
+        part = read_part(response.raw, part_size)
+        buffer_account.acquire(len(part))
+        if len(part) < part_size:
+            num_bytes = len(part)
+            try:
+                # a truncated body is never put, so it cannot replace a good object already under the key
+                if expected_bytes is not None and num_bytes != int(expected_bytes):
+                    raise IOError(f"{url}: received {num_bytes} of {expected_bytes} bytes")
+                s3_client.put_object(Bucket=bucket_name, Key=key, Body=bytes(part))
+            finally:
+                buffer_account.release(len(part))
+                free_buffers.release()
+            return num_bytes
+
+        upload_id = s3_client.create_multipart_upload(Bucket=bucket_name, Key=key)['UploadId']
+
+        def upload_part(part_number, part_body):
+            try:
+                part_response = s3_client.upload_part(Bucket=bucket_name, Key=key, UploadId=upload_id,
+                                                      PartNumber=part_number, Body=bytes(part_body))
+            finally:
+                buffer_account.release(len(part_body))
+                free_buffers.release()
+            return {'PartNumber': part_number, 'ETag': part_response['ETag']}
+
+        num_bytes = 0
+        part_futures = []
+        try:
+            with ThreadPoolExecutor(max_workers=parts_in_flight) as executor:
+                part_number = 1
+                while len(part) > 0:
+                    num_bytes += len(part)
+                    part_futures.append(executor.submit(upload_part, part_number, part))
+                    part_number += 1
+
+                    free_buffers.acquire()
+                    part = read_part(response.raw, part_size)
+                    buffer_account.acquire(len(part))
+                buffer_account.release(len(part))
+                free_buffers.release()
+
+            if expected_bytes is not None and num_bytes != int(expected_bytes):
+                raise IOError(f"{url}: received {num_bytes} of {expected_bytes} bytes")
+
+            parts = [part_future.result() for part_future in part_futures]
+            s3_client.complete_multipart_upload(Bucket=bucket_name, Key=key, UploadId=upload_id,
+                                                MultipartUpload={'Parts': parts})
+        except Exception:
+            s3_client.abort_multipart_upload(Bucket=bucket_name, Key=key, UploadId=upload_id)
+            raise
+
+    return num_bytes
+
+
+def run_stream_transfers(urls, bucket, key_func, settings):
+    """
+    Function streams every input url into the input bucket with download_workers concurrent transfers and returns the
+    metrics of the stream stage, including the peak bytes held in part buffers.
+    :param urls:
+    :param bucket:
+    :param key_func:
+    :param settings:
+    :return stream_metrics, buffer_account:
+    """
+    stream_metrics = StageMetrics('stream')
+    buffer_account = BufferAccount()
+    s3_client = bucket.meta.client
+
+    def transfer(url):
+        start = time.perf_counter()
+        try:
+            num_bytes = stream_file_to_s3(url, s3_client, bucket.name, key_func(url),
+                                          part_size=settings['stream_part_size'],
+                                          parts_in_flight=settings['stream_parts_in_flight'],
+                                          buffer_account=buffer_account)
+        except Exception as e:
+            LOGGER.error(f"streaming transfer failed for {url}: {e}")
+            stream_metrics.record_failure(url)
+            record_call('stream_transfer', time.perf_counter() - start, error=True)
+            return
+        record_call('stream_transfer', time.perf_counter() - start, num_bytes)
+        done = stream_metrics.record(num_bytes, time.perf_counter() - start)
+        LOGGER.info(f"streamed {done}/{len(urls)}: {key_func(url)}")
+
+    stream_metrics.start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=settings['download_workers']) as executor:
+        list(executor.map(transfer, urls))
+    stream_metrics.end_time = time.perf_counter()
+
+    return stream_metrics, buffer_account
+
+
+def run_transfer_pipeline(urls, bucket, transfer_config=None, key_func=ucar_url_to_s3_key, remove_local=True,
+                          sizes=None, **config):
+    """
+    Function downloads the input ucar urls and uploads them to the input s3 bucket as a two stage pipeline. A pool of
+    download workers feeds a bounded queue that a pool of upload workers drains, so downloads and uploads overlap and
+    the local mirror never holds more than queue_size files waiting for upload. Each file is removed from the mirror
+    once uploaded, unless remove_local is False. transfer_config is the boto3 TransferConfig used for uploads and
+    decides the multipart threshold, part size and per-file concurrency. With
+    mode='stream' nothing is written locally: each file is piped from ucar into an s3 multipart upload by
+    stream_file_to_s3, and the peak memory held in part buffers is reported. Files are handed to the workers in the
+    order the download_order policy of download_scheduler gives, by their sizes in the input sizes or the listings,
+    and the makespan of the transfers is reported against the one each policy predicts. Any of the pipeline_config
+    settings can be overridden as keyword arguments. Returns the metrics of each stage and the schedule.
+    :param urls:
+    :param bucket:
+    :param transfer_config:
+    :param key_func:
+    :param remove_local:
+    :param sizes: {url: size} known beforehand, e.g. from the listing metadata store
+    :param config:
+    :return metrics_dict:
+    """
+    settings = dict(pipeline_config)
+    settings.update(config)
+
+    schedule = schedule_downloads(urls, settings['download_workers'], settings['download_order'], sizes)
+    urls = schedule.urls
+
+    if settings['mode'] == 'stream':
+        stream_metrics, buffer_account = run_stream_transfers(urls, bucket, key_func, settings)
+        buffer_cap = settings['download_workers'] * settings['stream_parts_in_flight'] * settings['stream_part_size']
+        peak_summary = (f"peak part buffer memory: {buffer_account.peak_bytes / 1e6:.1f} MB "
+                        f"(cap {buffer_cap / 1e6:.1f} MB)")
+        for summary in [stream_metrics.summary(), peak_summary, schedule.summary(stream_metrics.wall_seconds())]:
+            LOGGER.info(summary)
+            print(summary)
+        return {'stream': stream_metrics, 'peak_buffer_bytes': buffer_account.peak_bytes, 'schedule': schedule}
+    if settings['mode'] != 'spool':
+        raise ValueError(f"unknown transfer mode '{settings['mode']}', expected 'spool' or 'stream'")
+
+    url_queue = queue.Queue()
+    for url in urls:
+        url_queue.put(url)
+    upload_queue = queue.Queue(maxsize=settings['queue_size'])
+
+    download_metrics = StageMetrics('download')
+    upload_metrics = StageMetrics('upload')
+    total_files = len(urls)
+
+    def download_worker():
+        while True:
+            try:
+                url = url_queue.get_nowait()
+            except queue.Empty:
+                return
+            start = time.perf_counter()
+            try:
+                local_path = download_file(url, chunk_size=settings['download_chunk_size'])
+            except Exception as e:
+                LOGGER.error(f"download failed for {url}: {e}")
+                download_metrics.record_failure(url)
+                continue
+            download_metrics.record(os.path.getsize(local_path), time.perf_counter() - start)
+            upload_queue.put((url, local_path))
+
+    def upload_worker():
+        while True:
+            item = upload_queue.get()
+            if item is _stop:
+                return
+            url, local_path = item
+            start = time.perf_counter()
+            try:
+                size = os.path.getsize(local_path)
+                if transfer_config is not None:
+                    bucket.upload_file(local_path, key_func(url), Config=transfer_config)
+                else:
+                    bucket.upload_file(local_path, key_func(url))
+            except Exception as e:
+                LOGGER.error(f"upload failed for {url}: {e}")
+                upload_metrics.record_failure(url)
+                record_call('upload', time.perf_counter() - start, error=True)
+                continue
+            record_call('upload', time.perf_counter() - start, size)
+            done = upload_metrics.record(size, time.perf_counter() - start)
+            LOGGER.info(f"uploaded {done}/{total_files}: {key_func(url)}")
+            if remove_local:
+                os.remove(local_path)
+
+    download_threads = [threading.Thread(target=download_worker, daemon=True)
+                        for _ in range(settings['download_workers'])]
+    upload_threads = [threading.Thread(target=upload_worker, daemon=True) for _ in range(settings['upload_workers'])]
+
+    download_metrics.start_time = upload_metrics.start_time = time.perf_counter()
+    for thread in download_threads + upload_threads:
+        thread.start()
+
+    for thread in download_threads:
+        thread.join()
+    download_metrics.end_time = time.perf_counter()
+
+    for _ in upload_threads:
+        upload_queue.put(_stop)
+    for thread in upload_threads:
+        thread.join()
+    upload_metrics.end_time = time.perf_counter()
+
+    # the makespan runs until the last upload is done, upload_metrics starts with the downloads
+    for summary in [download_metrics.summary(), upload_metrics.summary(),
+                    schedule.summary(upload_metrics.wall_seconds())]:
+        LOGGER.info(summary)
+        print(summary)
+
+    return {'download': download_metrics, 'upload': upload_metrics, 'schedule': schedule}
@@ -1,30 +1,35 @@
 import os
-import requests
 import logging
 import json
-import re
-import numpy as np
 from datetime import date
-from bs4 import BeautifulSoup
-
-ucar_manifests_loc = "/home/i28373/ucar_webscrape/ucarWebScrapeToS3/ucar_file_manifests_per_mission/"
-ucar_site = "https://data.cosmic.ucar.edu/gnss-ro/"
+from .url_classifier import valid_proc_types, is_valid_proc_type, is_correct_level, is_correct_filetype, \
+    is_in_doy_level
+from .key_normalizer import normalize_key, normalize_key_file, default_output_path
+from .binary_manifest import ManifestReader, is_binary_manifest, list_manifest_paths, open_mission_manifest
+from .url_dedupe import open_url_dedupe
+
+ucar_manifests_loc = os.environ.get('UCAR_MANIFESTS_LOC',
+                                    "/home/i28373/ucar_webscrape/ucarWebScrapeToS3/ucar_file_manifests_per_mission/")
+ucar_site = os.environ.get('UCAR_SITE', "https://data.cosmic.ucar.edu/gnss-ro/")
 LOGGER = logging.getLogger(__name__)
 
 
 ucar_urls = []
+# the dedupe behind is_new_ucar_url, the list it was built from and how many of that list's entries it has seen
+_ucar_url_dedupe = None
+_ucar_url_dedupe_list = None
+_ucar_url_dedupe_count = 0
 current_yr = date.today().year
 date_today = date.today()
-doy_arr = [str(doy).zfill(3) for doy in np.arange(0,367,1)]
-year_arr = [str(yr) for yr in np.arange(1990, current_yr + 1, 1)]
+doy_arr = [str(doy).zfill(3) for doy in range(0, 367)]
+year_arr = [str(yr) for yr in range(1990, current_yr + 1)]
 
 data_description_missions = ['gpsmet/', 'gpsmetas/', 'grace/', 'sacc/', 'champ/', 'cosmic1/', 'cosmic2/',
                              'tsx/', 'tdx/', 'cnofs/', 'metopa/', 'metopb/', 'metopc/', 'kompsat5/', 'paz/']
 
 
-home_path = os.environ['HOME']
-
-valid_proc_types = ['repro2016/', 'postProc/', 'repro2013/', 'nrt/']
+# the local mirror root; None is the HOME of the process, read when a file is first mirrored rather than on import
+home_path = None
 
 
 def check_if_valid_proc_type(url):
@@ -34,10 +39,7 @@ def check_if_valid_proc_type(url):
     :param url:
     :return True/False:
     """
-    for valid_proc in valid_proc_types:
-        if valid_proc in url:
-            return True
-    return False
+    return is_valid_proc_type(url)
 
 
 def check_if_correct_level(url):
@@ -47,11 +49,7 @@ def check_if_correct_level(url):
     :param url:
     :return True/False:
     """
-    excluded_criteria = ['level0/', 'level1a/', 'provisional/', 'tools/']
-    for excluded_level in excluded_criteria:
-        if excluded_level in url:
-            return False
-    return True
+    return is_correct_level(url)
 
 
 def check_if_correct_filetype(new_url):
@@ -61,13 +59,7 @@ def check_if_correct_filetype(new_url):
     :param new_url:
     :return True/False:
     """
-    filetype_list = ['conPhs', 'atmPhs', 'atmPrf', 'wetPrf', 'wetPf2']
-    if new_url.endswith(".tar.gz"):
-        for filetype in filetype_list:
-            if filetype in new_url:
-                return True
-
-    return False
+    return is_correct_filetype(new_url)
 
 
 def check_if_in_doy_level(new_url):
@@ -77,12 +69,44 @@ def check_if_in_doy_level(new_url):
     :param new_url:
     :return True/False:
     """
-    doy = new_url.split('/')[-2]
+    return is_in_doy_level(new_url)
+
+
+def get_href_list(url):
+    """
+    Function fetches the ucar directory listing at the input url, through the local listing cache, and returns the list
+    of hrefs on the page. The first entry is the parent directory link.
+    :param url:
+    :return href_list:
+    """
+    # the listing cache and the http client behind it are imported by the first listing, not with this module
+    from .listing_cache import fetch_listing_hrefs
+
+    return fetch_listing_hrefs(url)
+
+
+def is_new_ucar_url(new_url):
+    """
+    Function returns True if the input url is not yet in the global ucar_urls list, and records it as seen. Lookups go
+    through a dedupe structure (see url_dedupe) kept alongside the list instead of scanning the list. Urls appended to
+    the list since the last call are added to it; it is only rebuilt when ucar_urls is replaced or shrinks. The caller
+    appends new urls to ucar_urls.
+    :param new_url:
+    :return True/False:
+    """
+    global _ucar_url_dedupe, _ucar_url_dedupe_list, _ucar_url_dedupe_count
 
-    if doy in doy_arr:
-        return True
+    if _ucar_url_dedupe is None or _ucar_url_dedupe_list is not ucar_urls or len(ucar_urls) < _ucar_url_dedupe_count:
+        if _ucar_url_dedupe is not None:
+            _ucar_url_dedupe.close()
+        _ucar_url_dedupe = open_url_dedupe(ucar_urls)
+        _ucar_url_dedupe_list = ucar_urls
+    else:
+        for url in ucar_urls[_ucar_url_dedupe_count:]:
+            _ucar_url_dedupe.add(url)
+    _ucar_url_dedupe_count = len(ucar_urls)
 
-    return False
+    return _ucar_url_dedupe.add(new_url)
 
 
 # Only to be used with base ucar url: "https://data.cosmic.ucar.edu/gnss-ro/"
@@ -94,13 +118,7 @@ def get_mission_level_urls(url):
     :param url:
     :return dictionary:
     """
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, 'html.parser')
-
-    href_list = []
-    for a_tag in soup.findAll('a'):
-        href_tag_text = a_tag.attrs.get('href')
-        href_list.append(href_tag_text)
+    href_list = get_href_list(url)
 
     data_description_mission_urls = [os.path.join(url, mission) for mission in href_list[1:]
                                     if mission in data_description_missions]
@@ -113,35 +131,34 @@ def get_mission_level_urls(url):
     return mission_url_dict
 
 
-def recursive_scrape(url):
+def recursive_scrape(url, manifest_writer=None):
     """
     Function recursively searches input ucar url until correct filetype is found. If the correct .tar.gz file is found,
     that file url is added to a global list called ucar_urls which will contain the urls needed to download the files.
-    Additionally the urls are written to a file named <mission>.txt for use after the search has concluded.
+    Additionally the urls are appended to the mission's binary manifest (see binary_manifest) for use after the search
+    has concluded; a url that does not fit the manifest is logged and left out of it, but still kept in ucar_urls.
     :param url:
+    :param manifest_writer:
     :return:
     """
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, 'html.parser')
-    mission = url.split('/')[4]
-    filename = f"{mission}.txt"
-    # Change filepath so that it is not using hard coded paths such as "ucar_manifests_loc" 1/5/2022
-    filepath = os.path.join(ucar_manifests_loc, filename)
+    if manifest_writer is None:
+        mission = url.split('/')[4]
+        with open_mission_manifest(ucar_manifests_loc, mission, site=ucar_site) as manifest_writer:
+            return recursive_scrape(url, manifest_writer)
 
-    href_list = []
-    for a_tag in soup.findAll('a'):
-        href_tag_text = a_tag.attrs.get('href')
-        href_list.append(href_tag_text)
+    href_list = get_href_list(url)
 
     for link in href_list[1:]:
         new_url = os.path.join(url, link)
 
         if new_url.endswith('tar.gz'):
             if check_if_correct_filetype(new_url):
-                if new_url not in ucar_urls:
+                if is_new_ucar_url(new_url):
                     LOGGER.info(new_url)
-                    with open(filepath, 'a') as mission_file:
-                        mission_file.write(f"{new_url},")
+                    try:
+                        manifest_writer.append(new_url)
+                    except ValueError as e:
+                        LOGGER.warning(f"{new_url} left out of the manifest: {e}")
                     ucar_urls.append(new_url)
 
         if new_url.endswith('/'):
@@ -150,13 +167,16 @@ def recursive_scrape(url):
                     #if check_if_in_doy_level(new_url):
                     #LOGGER.info(new_url)
                     print("drilling down ----> ", new_url)
-                    recursive_scrape(new_url)
+                    recursive_scrape(new_url, manifest_writer)
 
     return
 
 
 def check_last_searched(manifest_filepath):
 
+    if is_binary_manifest(manifest_filepath):
+        return ManifestReader(manifest_filepath).last_url()
+
     with open(manifest_filepath, 'r+') as manifest_doc:
         last_searched_url = manifest_doc.read().split(',')[-2]
 
@@ -165,6 +185,9 @@ def check_last_searched(manifest_filepath):
 
 def store_proc_levels(manifest_file_path):
 
+    if is_binary_manifest(manifest_file_path):
+        return ManifestReader(manifest_file_path).unique('proctype')
+
     proc_type_list = []
     with open(manifest_file_path, 'r+') as manifest_doc:
         manifest_urls = manifest_doc.read().replace(ucar_site, '').split(',')
@@ -187,12 +210,16 @@ def store_proc_levels(manifest_file_path):
 
 def create_last_searched_info(manifest_file_path):
 
-    with open(manifest_file_path, 'r+') as manifest_doc:
-        manifest_urls = manifest_doc.read().replace(ucar_site, '').split(',')
-
     proctype_list = store_proc_levels(manifest_file_path)
 
-    last_url = manifest_urls[-2].split('/')
+    if is_binary_manifest(manifest_file_path):
+        # only the last row is read from the memory mapped manifest
+        last_searched_url = ManifestReader(manifest_file_path).last_url() or ''
+        last_url = last_searched_url.replace(ucar_site, '').split('/')
+    else:
+        with open(manifest_file_path, 'r+') as manifest_doc:
+            manifest_urls = manifest_doc.read().replace(ucar_site, '').split(',')
+        last_url = manifest_urls[-2].split('/')
 
     if len(last_url) > 1:
         if "spire" in last_url or 'geoopt' in last_url:
@@ -288,6 +315,45 @@ def check_for_new_ucar_entries(manifest_last_searched_dict):
     return new_url_entries
 
 
+def check_for_changed_ucar_entries(manifest_last_searched_dict):
+    """
+    Function returns the urls to crawl with change detection (see listing_metadata) for an incremental run: every
+    processing type url of each mission in manifest_last_searched_dict, including processing types that are new, and
+    the urls of data description missions not in it yet. Unlike check_for_new_ucar_entries this covers old years too,
+    so days reprocessed since the last run are found; the change detection keeps it to one listing per unchanged year.
+    New processing types are signalled in signal_new_proc_type_<date>.json as check_for_new_ucar_entries does.
+    :param manifest_last_searched_dict:
+    :return new_url_entries:
+    """
+    new_url_entries = []
+    signal_new_proctype_dict = {}
+
+    for mission_url in get_mission_level_urls(ucar_site)['data_description']:
+        if mission_url.rstrip('/').split('/')[-1] not in manifest_last_searched_dict:
+            new_url_entries.append(mission_url)
+
+    for mission, last_searched in manifest_last_searched_dict.items():
+        if mission == 'spire' or mission == 'geoopt':
+            mission_url = os.path.join(ucar_site, mission, 'noaa', '')
+        else:
+            mission_url = os.path.join(ucar_site, mission, '')
+
+        new_proc_type_urls = check_new_proctype(mission_url, last_searched['mission_proctypes'])
+        if len(new_proc_type_urls) > 0:
+            signal_new_proctype_dict.update({mission: new_proc_type_urls})
+
+        new_url_entries.extend([os.path.join(mission_url, proctype.strip('/'), '')
+                                for proctype in last_searched['mission_proctypes']])
+        new_url_entries.extend(new_proc_type_urls)
+
+    if len(signal_new_proctype_dict.keys()) > 0:
+        filename = f"signal_new_proc_type_{date_today}.json"
+        with open(filename, 'w+') as signal_file:
+            json.dump(signal_new_proctype_dict, signal_file)
+
+    return new_url_entries
+
+
 def check_new_proctype(mission_url, proctype_list):
     """
     Function is used to check if there are new processing types under a ucar mission url using a list of already existing
@@ -300,13 +366,7 @@ def check_new_proctype(mission_url, proctype_list):
     """
     new_url_entries = []
 
-    response = requests.get(mission_url)
-    soup = BeautifulSoup(response.text, 'html.parser')
-
-    href_list = []
-    for a_tag in soup.findAll('a'):
-        href_tag_text = a_tag.attrs.get('href')
-        href_list.append(href_tag_text)
+    href_list = get_href_list(mission_url)
 
     for proctype_link in href_list[1:]:
         proctype = proctype_link.split('/')[0]
@@ -334,13 +394,7 @@ def check_new_proctype_year(proctype_url, last_searched_year):
     for level in ['level1b/', 'level2/']:
         url_with_level = os.path.join(proctype_url, level)
 
-        response = requests.get(url_with_level)
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        href_list = []
-        for a_tag in soup.findAll('a'):
-            href_tag_text = a_tag.attrs.get('href')
-            href_list.append(href_tag_text)
+        href_list = get_href_list(url_with_level)
 
         #last_yr_from_url = href_list[-1].split('/')[0]
         for yr_link in href_list[1:]:
@@ -365,13 +419,7 @@ def check_before_proctype_year(proctype_url, last_searched_year):
     for level in ['level1b/', 'level2/']:
         url_with_level = os.path.join(proctype_url, level)
 
-        response = requests.get(url_with_level)
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        href_list = []
-        for a_tag in soup.findAll('a'):
-            href_tag_text = a_tag.attrs.get('href')
-            href_list.append(href_tag_text)
+        href_list = get_href_list(url_with_level)
 
         #last_yr_from_url = href_list[-1].split('/')[0]
         for yr_link in href_list[1:]:
@@ -398,13 +446,7 @@ def check_new_doy(proctype_url, last_searched_year, last_searched_doy):
     for level in ['level1b/', 'level2/']:
         url_with_level = os.path.join(proctype_url, level, last_searched_year, '')
 
-        response = requests.get(url_with_level)
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        href_list = []
-        for a_tag in soup.findAll('a'):
-            href_tag_text = a_tag.attrs.get('href')
-            href_list.append(href_tag_text)
+        href_list = get_href_list(url_with_level)
 
         for doy_link in href_list[1:]:
             doy = doy_link.split('/')[0]
@@ -429,13 +471,7 @@ def check_before_doy(proctype_url, last_searched_year, last_searched_doy):
     for level in ['level1b/', 'level2/']:
         url_with_level = os.path.join(proctype_url, level, last_searched_year, '')
 
-        response = requests.get(url_with_level)
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        href_list = []
-        for a_tag in soup.findAll('a'):
-            href_tag_text = a_tag.attrs.get('href')
-            href_list.append(href_tag_text)
+        href_list = get_href_list(url_with_level)
 
         for doy_link in href_list[1:]:
             doy = doy_link.split('/')[0]
@@ -445,26 +481,24 @@ def check_before_doy(proctype_url, last_searched_year, last_searched_doy):
 
     return new_url_entries
 
-def download_file(url):
+def download_file(url, chunk_size=8192, expected_size=None, checksum=None):
     """
     Function will use the input url (ending in .tar.gz) to download the file at the url to local storage. The function will
-    return the path to the file
+    return the path to the file. A complete local copy is kept as is, and an interrupted download is resumed from where
+    it stopped (see resumable_download.download_with_resume); a file that does not match its size or checksum raises.
     :param url:
+    :param chunk_size:
+    :param expected_size:
+    :param checksum:
     :return full_path:
     """
+    from .resumable_download import download_with_resume
+
     local_filename = url.split('/')[-1]
     local_root_path = create_local_dir_mirror_ucar(url)
     full_path = os.path.join(local_root_path, local_filename)
 
-    # NOTE the stream=True parameter below
-    with requests.get(url, stream=True) as r:
-        r.raise_for_status()
-        with open(full_path, 'wb') as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                # If you have chunk encoded response uncomment if
-                # and set chunk_size parameter to None.
-                #if chunk:
-                f.write(chunk)
+    download_with_resume(url, full_path, chunk_size=chunk_size, expected_size=expected_size, checksum=checksum)
     print("File downloaded to: ", full_path)
     return full_path
 
@@ -476,7 +510,7 @@ def create_local_dir_mirror_ucar(url):
     :return local_path:
     """
     root_path = os.path.split(url.replace(ucar_site, ''))[0]
-    local_path = os.path.join(home_path, 'ucar_repo', root_path)
+    local_path = os.path.join(home_path or os.environ['HOME'], 'ucar_repo', root_path)
 
     os.makedirs(local_path, exist_ok=True)
 
@@ -508,19 +542,16 @@ def create_s3_obj_key_file(bucket):
 
 
 # To be run on ucar-earth-ro-archive bucket obj_key_file 1/10/2022
-def add_zero_pad_doy_to_key_file(s3_obj_key_file_path):
+def add_zero_pad_doy_to_key_file(s3_obj_key_file_path, output_path=default_output_path, changes_path=None):
     """
-    Function will add zero padding to obj key file entries that do not have proper zero padding
+    Function will add zero padding to obj key file entries that do not have proper zero padding. The file is streamed in
+    large chunks (see key_normalizer.normalize_key_file); the changed keys can be written to changes_path.
     :param s3_obj_key_file_path:
-    :return:
+    :param output_path:
+    :param changes_path:
+    :return report:
     """
-    with open(s3_obj_key_file_path, 'r') as s3_obj_key_file:
-        with open("/home/i28373/zero_pad_ucar_objKey.txt", 'w') as new_s3_obj_key_file:
-            for line in s3_obj_key_file:
-                obj_file_key = check_zero_pad_doy(line.strip())
-                new_file_str = obj_file_key + "\n"
-                new_s3_obj_key_file.write(new_file_str)
-    return
+    return normalize_key_file(s3_obj_key_file_path, output_path, changes_path=changes_path)
 
 
 def check_zero_pad_doy(obj_file_key):
@@ -531,23 +562,7 @@ def check_zero_pad_doy(obj_file_key):
     :param obj_file_key:
     :return zero_pad_key or obj_file_key:
     """
-    print(f"obj_file_key: {obj_file_key}")
-    no_zero_pad_two_digit = re.search("/([0-9][0-9])/", obj_file_key)
-    no_zero_pad_one_digit = re.search("/([0-9])/", obj_file_key)
-    if no_zero_pad_one_digit != None:
-        print(f"no_zero_pad_one_digit: {no_zero_pad_one_digit.groups()}")
-        number          = no_zero_pad_one_digit.group(0).split('/')[1].zfill(3)
-        replace_str     = f"/{number}/"
-        zero_pad_key    = re.sub(r"/([0-9])/", replace_str, obj_file_key)
-        return zero_pad_key
-    if no_zero_pad_two_digit != None:
-        print(f"no_zero_pad_two_digit: {no_zero_pad_two_digit.groups()}")
-        number          = no_zero_pad_two_digit.group(0).split('/')[1].zfill(3)
-        replace_str     = f"/{number}/"
-        zero_pad_key    = re.sub(r"/([0-9][0-9])/", replace_str, obj_file_key)
-        return zero_pad_key
-
-    return obj_file_key
+    return normalize_key(obj_file_key)
 
 """
     Get initial manifests 
@@ -557,10 +572,7 @@ if __name__ == "__main__":
     #fp = "/home/i28373/ucar_webscrape/ucarWebScrapeToS3/ucar_file_manifests_per_mission/cosmic2.txt"
 
     manifest_root = "/home/i28373/ucar_webscrape/ucarWebScrapeToS3/ucar_file_manifests_per_mission/"
-    manifest_file_list = os.listdir(manifest_root)
-    file_path_list = []
-    for file in manifest_file_list:
-        file_path_list.append(os.path.join(manifest_root, file))
+    file_path_list = list_manifest_paths(manifest_root)
     create_last_searched_json(file_path_list)
     #print(store_proc_levels(fp))
 
@@ -0,0 +1,232 @@
+from collections import namedtuple
+from .lazy_import import lazy_module
+
+# numpy is only needed by classify_urls
+np = lazy_module('numpy')
+
+
+valid_proc_types = ['repro2016/', 'postProc/', 'repro2013/', 'nrt/']
+excluded_levels = ['level0/', 'level1a/', 'provisional/', 'tools/']
+catalog_filetypes = ['conPhs', 'atmPhs', 'atmPrf', 'wetPrf', 'wetPf2']
+# missions with an extra directory (noaa) between the mission and the proctype
+subdir_missions = frozenset(['spire', 'geoopt'])
+site_marker = '/gnss-ro/'
+
+# lookup tables built once, so each check is a hash lookup or a few short substring tests
+doy_names = frozenset([str(doy).zfill(3) for doy in range(0, 367)])
+filetype_by_prefix = {filetype: filetype for filetype in catalog_filetypes}
+
+UcarPath = namedtuple('UcarPath', ['mission', 'subdir', 'proctype', 'level', 'year', 'doy', 'filetype', 'filename'])
+
+
+def _contains_any(url, substrings):
+    for substring in substrings:
+        if substring in url:
+            return True
+    return False
+
+
+def is_valid_proc_type(url):
+    return _contains_any(url, valid_proc_types)
+
+
+def is_correct_level(url):
+    return not _contains_any(url, excluded_levels)
+
+
+def is_correct_filetype(url):
+    return url.endswith(".tar.gz") and _contains_any(url, catalog_filetypes)
+
+
+def is_in_doy_level(url):
+    url_contents = url.split('/')
+    return len(url_contents) > 1 and url_contents[-2] in doy_names
+
+
+def filename_filetype(filename):
+    """
+    Function returns the catalog filetype of a ucar filename (atmPrf_nrt_2021_001.tar.gz --> atmPrf), or None.
+    :param filename:
+    :return filetype:
+    """
+    # every catalog filetype is 6 characters, so the usual <filetype>_... name needs no split
+    if filename[6:7] == '_':
+        filetype = filetype_by_prefix.get(filename[:6])
+        if filetype is not None:
+            return filetype
+
+    # filenames that do not start with their filetype
+    for candidate in catalog_filetypes:
+        if candidate in filename:
+            return candidate
+    return None
+
+
+def classify_url(url):
+    """
+    Function parses a ucar url, or an s3 key / path relative to the gnss-ro directory, into a UcarPath with a single
+    split. Parts the url does not reach (for example the doy and filename of a year directory) are None; subdir is only
+    set for spire and geoopt. The filetype is taken from the filename. Returns None if the url does not follow the ucar
+    layout, i.e. a year or doy directory that is not a number.
+    :param url:
+    :return ucar_path:
+    """
+    site_index = url.find(site_marker)
+    if site_index >= 0:
+        url = url[site_index + len(site_marker):]
+    if url.endswith('/'):
+        url = url.rstrip('/')
+    url_contents = url.split('/')
+
+    mission = url_contents[0]
+    if mission in subdir_missions and len(url_contents) > 1:
+        subdir = url_contents[1]
+        parts = url_contents[2:]
+    else:
+        subdir = None
+        parts = url_contents[1:]
+    part_count = len(parts)
+    if part_count > 5 or mission == '':
+        return None
+    if part_count < 5:
+        parts.extend([None] * (5 - part_count))
+
+    proctype, level, year, doy, filename = parts
+    if year is not None and not (len(year) == 4 and year.isdigit()):
+        return None
+    if doy is not None and not doy.isdigit():
+        return None
+    filetype = filename_filetype(filename) if filename is not None else None
+
+    return UcarPath(mission, subdir, proctype, level, year, doy, filetype, filename)
+
+
+def classify_urls(urls):
+    """
+    Function is classify_url over a whole sequence or array of urls at once. Returns a numpy structured array with one
+    row per url in the fields of UcarPath, unicode columns in which a part the url does not reach is '', and a boolean
+    'valid' column that is False where classify_url returns None, so rows can be selected on their columns, e.g.
+    paths[paths['valid'] & (paths['filetype'] == 'atmPrf')]. The urls are parsed together with the numpy.strings
+    functions (numpy >= 2.3) as ascii bytes, each step running over every url at once; with an older numpy, or urls
+    that are not ascii, the rows come from classify_url.
+    :param urls:
+    :return ucar_paths:
+    """
+    try:
+        paths = np.asarray(urls, dtype='S') if hasattr(getattr(np, 'strings', None), 'slice') else None
+    except UnicodeEncodeError:
+        paths = None
+    if paths is None:
+        return _ucar_path_rows([classify_url(str(url)) for url in urls])
+
+    strings = np.strings
+    site_index = strings.find(paths, site_marker.encode())
+    starts = np.where(site_index >= 0, site_index + len(site_marker), 0)
+    ends = strings.str_len(paths)
+    while True:
+        trailing = (ends > starts) & (strings.slice(paths, ends - 1, ends) == b'/')
+        if not trailing.any():
+            break
+        ends -= trailing
+    part_count = strings.count(paths, b'/', starts, ends) + 1
+
+    # the mission, the subdir of spire/geoopt and the five parts under it, '' past the end of the path
+    parts = []
+    for _ in range(7):
+        slash = strings.find(paths, b'/', starts, ends)
+        part_ends = np.where(slash >= 0, slash, ends)
+        width = max(1, int((part_ends - starts).max(initial=0)))
+        parts.append(strings.slice(paths, starts, part_ends).astype(f'U{width}'))
+        starts = np.minimum(part_ends + 1, ends)
+
+    mission = parts[0]
+    has_subdir = np.isin(mission, list(subdir_missions)) & (part_count > 1)
+    subdir = np.where(has_subdir, parts[1], '')
+    proctype, level, year, doy, filename = [np.where(has_subdir, parts[k + 1], parts[k]) for k in range(1, 6)]
+    year_reached = part_count > 3 + has_subdir
+    doy_reached = part_count > 4 + has_subdir
+    valid = (mission != '') & (part_count - has_subdir <= 6) & \
+        (~year_reached | ((strings.str_len(year) == 4) & strings.isdigit(year))) & \
+        (~doy_reached | strings.isdigit(doy))
+
+    # casting to U6 keeps the first 6 characters, the filetype of the usual <filetype>_... name
+    prefix = filename.astype('U6')
+    filetype = np.where(np.isin(prefix, catalog_filetypes) & (strings.slice(filename, 6, 7) == '_'), prefix, '')
+    # filenames that do not start with their filetype, the first filetype found wins as in filename_filetype
+    unresolved = np.flatnonzero((filetype == '') & (filename != ''))
+    if len(unresolved) > 0:
+        filenames = filename[unresolved]
+        found = np.zeros(len(unresolved), dtype='U6')
+        for candidate in catalog_filetypes:
+            found = np.where((found == '') & (strings.find(filenames, candidate) >= 0), candidate, found)
+        filetype[unresolved] = found
+
+    columns = [mission, subdir, proctype, level, year, doy, filetype, filename]
+    ucar_paths = np.empty(len(paths), dtype=[(name, column.dtype) for name, column in zip(UcarPath._fields, columns)] +
+                          [('valid', bool)])
+    for name, column in zip(UcarPath._fields, columns):
+        ucar_paths[name] = column
+    ucar_paths['valid'] = valid
+
+    return ucar_paths
+
+
+def _ucar_path_rows(ucar_paths):
+    """
+    Builds the structured array classify_urls returns from a list of UcarPath (or None for an invalid url).
+    """
+    rows = [('',) * len(UcarPath._fields) + (False,) if ucar_path is None else
+            tuple('' if value is None else value for value in ucar_path) + (True,) for ucar_path in ucar_paths]
+    widths = [max([len(row[index]) for row in rows], default=0) or 1 for index in range(len(UcarPath._fields))]
+
+    return np.array(rows, dtype=[(name, f'U{width}') for name, width in zip(UcarPath._fields, widths)] +
+                    [('valid', bool)])
+
+
+def crawl_link_actions(urls):
+    """
+    Function decides for each input url what the crawler does with it, with the same rules as recursive_scrape: keep it
+    as a file to download (a .tar.gz of a catalog filetype), follow it (a directory under a valid proctype and not an
+    excluded level), or neither. Returns the urls to keep and the urls to follow.
+    :param urls:
+    :return file_urls, dir_urls:
+    """
+    file_urls = [url for url in urls if url.endswith('tar.gz') and is_correct_filetype(url)]
+    dir_urls = [url for url in urls if url.endswith('/') and is_valid_proc_type(url) and is_correct_level(url)]
+
+    return file_urls, dir_urls
+
+
+def crawl_listing_actions(url, links):
+    """
+    Function is crawl_link_actions for the links of one directory listing at url. The parent url is checked once and
+    each link only on its own name: none of the proctype, level or filetype markers can straddle the '/' the parent
+    url ends with, so url + link contains a marker exactly when one of the two does.
+    :param url:
+    :param links:
+    :return file_urls, dir_urls:
+    """
+    if not url.endswith('/'):
+        return crawl_link_actions([url + '/' + link for link in links])
+
+    parent_proc_type = is_valid_proc_type(url)
+    parent_level = is_correct_level(url)
+    parent_filetype = _contains_any(url, catalog_filetypes)
+
+    file_urls = []
+    dir_urls = []
+    for link in links:
+        if link.startswith('/'):
+            # an absolute href replaces the parent, as with os.path.join
+            link_file_urls, link_dir_urls = crawl_link_actions([link])
+            file_urls.extend(link_file_urls)
+            dir_urls.extend(link_dir_urls)
+        elif link.endswith('.tar.gz'):
+            if parent_filetype or _contains_any(link, catalog_filetypes):
+                file_urls.append(url + link)
+        elif link.endswith('/'):
+            if (parent_proc_type or _contains_any(link, valid_proc_types)) and parent_level and \
+                    not _contains_any(link, excluded_levels):
+                dir_urls.append(url + link)
+
+    return file_urls, dir_urls
@@ -0,0 +1,243 @@
+import os
+import sys
+import math
+import atexit
+import weakref
+import logging
+import tempfile
+from .lazy_import import lazy_module
+
+hashlib = lazy_module('hashlib')
+sqlite3 = lazy_module('sqlite3')
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Settings for the crawler's discovered-url dedupe; change with configure_url_dedupe. backend 'set' keeps every url in
+# memory, 'bloom' keeps a Bloom filter of capacity urls at false_positive_rate in memory and the urls themselves in a
+# temporary SQLite file of its own in directory (the system temporary directory if None), removed on close, which is
+# only read when the filter says a url may have been seen.
+url_dedupe_config = {
+    'backend': os.environ.get('UCAR_URL_DEDUPE', 'set'),
+    'directory': os.environ.get('UCAR_URL_DEDUPE_DIR'),
+    'capacity': 20_000_000,
+    'false_positive_rate': 0.01,
+    'commit_every': 10_000,
+    'cache_kib': 16 * 1024,         # SQLite page cache of the on-disk check
+}
+
+# temporary on-disk checks still open, removed at exit if their owner never closed them
+_temporary_dedupes = weakref.WeakSet()
+
+
+class HashSetDedupe:
+    """
+    Exact dedupe of urls in an in-memory hash set: O(1) per url, memory grows with every url kept.
+    """
+
+    backend = 'set'
+
+    def __init__(self, urls=()):
+        self.urls = set()
+        self._url_bytes = 0
+        for url in urls:
+            self.add(url)
+
+    def add(self, url):
+        """
+        Records url and returns True if it had not been seen before, False if it is a duplicate.
+        """
+        if url in self.urls:
+            return False
+        self.urls.add(url)
+        self._url_bytes += sys.getsizeof(url)
+        return True
+
+    def __contains__(self, url):
+        return url in self.urls
+
+    def __len__(self):
+        return len(self.urls)
+
+    def memory_bytes(self):
+        return sys.getsizeof(self.urls) + self._url_bytes
+
+    def memory_report(self):
+        return {'backend': self.backend, 'urls': len(self), 'memory_bytes': self.memory_bytes()}
+
+    def close(self):
+        self.urls = set()
+        self._url_bytes = 0
+
+
+class BloomFilter:
+    """
+    Bloom filter sized for capacity items at false_positive_rate. Bit positions come from one blake2b digest per item
+    split into two 64 bit hashes (Kirsch-Mitzenmacher double hashing).
+    """
+
+    def __init__(self, capacity, false_positive_rate):
+        self.num_bits = max(8, int(math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first_hash = int.from_bytes(digest[:8], 'little')
+        second_hash = int.from_bytes(digest[8:], 'little') | 1
+        return [(first_hash + i * second_hash) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item):
+        """
+        Adds item and returns whether it may already have been in the filter.
+        """
+        was_present = True
+        for position in self._positions(item):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                was_present = False
+                self.bits[position >> 3] |= mask
+        return was_present
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def memory_bytes(self):
+        return sys.getsizeof(self.bits)
+
+
+class BloomDedupe:
+    """
+    Exact dedupe for archive-scale crawls with bounded memory. A Bloom filter answers "never seen" for almost every new
+    url without touching disk; only when it says "maybe seen" (a real duplicate, or a false positive at about
+    false_positive_rate) is the url looked up in an SQLite table of every url kept. Memory is the filter plus the
+    SQLite page cache whatever the url count; past capacity the false positive rate, and so the lookups, climb but the
+    answers stay exact.
+    """
+
+    backend = 'bloom'
+
+    def __init__(self, urls=(), directory=None, capacity=None, false_positive_rate=None, commit_every=None,
+                 cache_kib=None):
+        self.bloom = BloomFilter(capacity or url_dedupe_config['capacity'],
+                                 false_positive_rate or url_dedupe_config['false_positive_rate'])
+        self.commit_every = commit_every or url_dedupe_config['commit_every']
+        self.cache_kib = cache_kib or url_dedupe_config['cache_kib']
+        self.count = 0
+        self.exact_checks = 0
+        self.false_positives = 0
+        self._uncommitted = 0
+
+        # every dedupe has a file of its own, so several can be open at once without locking each other out
+        file_descriptor, self.path = tempfile.mkstemp(prefix='ucar_urls_', suffix='.sqlite', dir=directory)
+        os.close(file_descriptor)
+        _temporary_dedupes.add(self)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=OFF")
+        self.connection.execute("PRAGMA synchronous=OFF")
+        self.connection.execute(f"PRAGMA cache_size=-{self.cache_kib}")
+        self.connection.execute("CREATE TABLE seen_urls (url TEXT PRIMARY KEY) WITHOUT ROWID")
+        for url in urls:
+            self.add(url)
+
+    def _is_stored(self, url):
+        return self.connection.execute("SELECT 1 FROM seen_urls WHERE url = ?", (url,)).fetchone() is not None
+
+    def add(self, url):
+        """
+        Records url and returns True if it had not been seen before, False if it is a duplicate.
+        """
+        if self.bloom.add(url):
+            self.exact_checks += 1
+            if self._is_stored(url):
+                return False
+            self.false_positives += 1
+
+        self.connection.execute("INSERT INTO seen_urls (url) VALUES (?)", (url,))
+        self.count += 1
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every:
+            self.connection.commit()
+            self._uncommitted = 0
+        return True
+
+    def __contains__(self, url):
+        return url in self.bloom and self._is_stored(url)
+
+    def __len__(self):
+        return self.count
+
+    def memory_bytes(self):
+        page_size = self.connection.execute("PRAGMA page_size").fetchone()[0]
+        # the page cache only grows as far as the table does
+        table_bytes = self.connection.execute("PRAGMA page_count").fetchone()[0] * page_size
+        return self.bloom.memory_bytes() + min(self.cache_kib * 1024, table_bytes)
+
+    def memory_report(self):
+        return {'backend': self.backend, 'urls': len(self), 'memory_bytes': self.memory_bytes(),
+                'exact_checks': self.exact_checks, 'false_positives': self.false_positives}
+
+    def close(self):
+        if self.connection is None:
+            return
+        self.connection.close()
+        self.connection = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+@atexit.register
+def _close_temporary_dedupes():
+    for dedupe in list(_temporary_dedupes):
+        dedupe.close()
+
+
+url_dedupe_backends = {'set': HashSetDedupe, 'bloom': BloomDedupe}
+
+
+def configure_url_dedupe(**config):
+    """
+    Function updates url_dedupe_config with the input keyword arguments (backend, directory, capacity,
+    false_positive_rate, commit_every, cache_kib).
+    :param config:
+    :return url_dedupe_config:
+    """
+    unknown_keys = set(config.keys()).difference(set(url_dedupe_config.keys()))
+    if len(unknown_keys) > 0:
+        raise ValueError(f"unknown url dedupe settings: {sorted(unknown_keys)}")
+    backend = config.get('backend', url_dedupe_config['backend'])
+    if backend not in url_dedupe_backends:
+        raise ValueError(f"unknown url dedupe backend {backend}, expected one of {list(url_dedupe_backends)}")
+
+    url_dedupe_config.update(config)
+
+    return url_dedupe_config
+
+
+def open_url_dedupe(urls=()):
+    """
+    Function returns a new dedupe of the configured backend holding the input urls. add(url) records a url and returns
+    whether it was new.
+    :param urls:
+    :return dedupe:
+    """
+    if url_dedupe_config['backend'] == 'bloom':
+        return BloomDedupe(urls, directory=url_dedupe_config['directory'])
+
+    return HashSetDedupe(urls)
+
+
+def format_dedupe_summary(dedupe):
+    """
+    Function returns a one-line summary of a dedupe's url count and memory for the run summary, and logs it.
+    :param dedupe:
+    :return summary:
+    """
+    report = dedupe.memory_report()
+    summary = (f"url dedupe ({report['backend']}): {report['urls']} urls in "
+               f"{report['memory_bytes'] / 1024 / 1024:.1f} MiB")
+    if 'exact_checks' in report:
+        summary += f" | {report['exact_checks']} on-disk checks, {report['false_positives']} false positives"
+    LOGGER.info(summary)
+
+    return summary